@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from motor_fat import CODECS, PROPIETARIO_DEFECTO, SistemaFAT
+
+#Banco de pruebas sin interfaz: cada ejecucion crea un volumen en un directorio temporal, corre las cargas
+#en orden sobre el mismo volumen y escribe un informe JSON. Con la misma semilla el trabajo es identico.
+#Uso: python bench_fat.py --archivos 2000 --tamaño 4096 > actual.json
+#     python bench_fat.py --comparar base.json   (marca las cargas que empeoraron)
+VERSION_INFORME = 1
+CARGAS = ("crear_masivo", "lectura_secuencial", "ediciones_pequenas", "listado", "permisos", "mixto_multiusuario")
+ALFABETO = "abcdefghijklmnopqrstuvwxyz      \n"
+UMBRAL_REGRESION = 0.10
+
+
+def _texto(aleatorio, tamaño):
+    return "".join(aleatorio.choices(ALFABETO, k=tamaño))
+
+
+def _percentil(ordenadas, fraccion):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(fraccion * len(ordenadas)))]
+
+
+def _contadores_io():
+    #Contadores de E/S del proceso (Linux); en otros sistemas el informe los deja en null
+    try:
+        with open("/proc/self/io") as f:
+            return {clave: int(valor) for clave, valor in (linea.split(": ") for linea in f)}
+    except OSError:
+        return None
+
+
+def _huella_disco(raiz):
+    aparente = asignado = archivos = 0
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            estado = os.stat(os.path.join(directorio, nombre))
+            aparente += estado.st_size
+            asignado += getattr(estado, "st_blocks", 0) * 512
+            archivos += 1
+    return {"bytes_aparentes": aparente, "bytes_asignados": asignado, "archivos": archivos}
+
+
+class Medicion:
+    #Acumula latencias de una carga; varios hilos pueden anotar a la vez
+
+    def __init__(self):
+        self.latencias = []
+        self.fallidas = 0
+        self._cerrojo = threading.Lock()
+
+    def medir(self, operacion, *args):
+        inicio = time.perf_counter()
+        resultado = operacion(*args)
+        duracion = time.perf_counter() - inicio
+        with self._cerrojo:
+            self.latencias.append(duracion)
+            if isinstance(resultado, tuple) and resultado[0] in (False, None):
+                self.fallidas += 1
+        return resultado
+
+    def informe(self, segundos, io_inicial, io_final, bytes_logicos):
+        ordenadas = sorted(self.latencias)
+        resultado = {
+            "operaciones": len(ordenadas),
+            "fallidas": self.fallidas,
+            "segundos": segundos,
+            "ops_por_segundo": len(ordenadas) / segundos if segundos else 0.0,
+            "mb_por_segundo": bytes_logicos / segundos / 1e6 if segundos else 0.0,
+            "latencia_p50_ms": _percentil(ordenadas, 0.50) * 1000,
+            "latencia_p99_ms": _percentil(ordenadas, 0.99) * 1000,
+            "latencia_max_ms": (ordenadas[-1] if ordenadas else 0.0) * 1000,
+        }
+        if io_inicial and io_final:
+            resultado["syscalls_escritura"] = io_final["syscw"] - io_inicial["syscw"]
+            resultado["syscalls_lectura"] = io_final["syscr"] - io_inicial["syscr"]
+            resultado["bytes_escritos"] = io_final["wchar"] - io_inicial["wchar"]
+            resultado["bytes_escritos_disco"] = io_final["write_bytes"] - io_inicial["write_bytes"]
+        else:
+            resultado.update(syscalls_escritura=None, syscalls_lectura=None, bytes_escritos=None, bytes_escritos_disco=None)
+        return resultado
+
+
+class BancoFAT:
+
+    def __init__(self, raiz, archivos, tamaño, usuarios, hilos, rondas_listado, semilla, opciones_volumen):
+        self.raiz = raiz
+        self.archivos = archivos
+        self.tamaño = tamaño
+        self.usuarios = [f"usuario{i}" for i in range(usuarios)]
+        self.hilos = hilos
+        self.rondas_listado = rondas_listado
+        self.semilla = semilla
+        self.sistema = SistemaFAT(raiz=raiz, **opciones_volumen)
+        self.sistema.usuario_actual = PROPIETARIO_DEFECTO
+        for usuario in self.usuarios:
+            self.sistema.registrar_usuario(usuario, usuario)
+        self.nombres = [f"archivo_{i:06d}.txt" for i in range(archivos)]
+
+    def ejecutar(self, cargas):
+        resultados = {}
+        for carga in cargas:
+            medicion = Medicion()
+            aleatorio = random.Random(f"{self.semilla}:{carga}")
+            io_inicial = _contadores_io()
+            inicio = time.perf_counter()
+            bytes_logicos = getattr(self, carga)(medicion, aleatorio)
+            segundos = time.perf_counter() - inicio
+            resultados[carga] = medicion.informe(segundos, io_inicial, _contadores_io(), bytes_logicos)
+        return resultados
+
+    def crear_masivo(self, medicion, aleatorio):
+        #Los archivos se reparten entre los usuarios para que el listado y los permisos tengan variedad
+        total = 0
+        for i, nombre in enumerate(self.nombres):
+            contenido = _texto(aleatorio, self.tamaño)
+            with self.sistema.como_usuario(self.usuarios[i % len(self.usuarios)]):
+                medicion.medir(self.sistema.crear_archivo, nombre, contenido)
+            total += len(contenido)
+        return total
+
+    def lectura_secuencial(self, medicion, aleatorio):
+        total = 0
+        for nombre in self.nombres:
+            _, contenido = medicion.medir(self.sistema.obtener_contenido_archivo, nombre)
+            total += len(contenido or "")
+        return total
+
+    def ediciones_pequenas(self, medicion, aleatorio):
+        #Cambia unos pocos caracteres en una posicion al azar, como una edicion desde el dialogo
+        total = 0
+        for nombre in aleatorio.sample(self.nombres, min(len(self.nombres), max(1, self.archivos // 2))):
+            _, contenido = self.sistema.obtener_contenido_archivo(nombre)
+            posicion = aleatorio.randrange(len(contenido))
+            nuevo = contenido[:posicion] + _texto(aleatorio, 8) + contenido[posicion + 8:]
+            medicion.medir(self.sistema.modificar_archivo, nombre, nuevo)
+            total += 8
+        return total
+
+    def listado(self, medicion, aleatorio):
+        #Lo que hace la interfaz al refrescar: la lista completa y la de un usuario sin privilegios
+        for _ in range(self.rondas_listado):
+            medicion.medir(self.sistema.listar_archivos, True)
+            usuario = aleatorio.choice(self.usuarios)
+            medicion.medir(lambda: self.sistema.consultar(en_papelera=False, legible_por=usuario))
+        return 0
+
+    def permisos(self, medicion, aleatorio):
+        #Da y quita un permiso a un usuario que no es el propietario, asi cada operacion cambia la ACL
+        for _ in range(max(1, self.archivos // 2)):
+            i = aleatorio.randrange(len(self.nombres))
+            otros = [usuario for usuario in self.usuarios if usuario != self.usuarios[i % len(self.usuarios)]] or self.usuarios
+            destino = aleatorio.choice(otros)
+            tipo = aleatorio.choice(("lectura", "escritura"))
+            medicion.medir(self.sistema.asignar_permisos, self.nombres[i], destino, tipo, "agregar")
+            medicion.medir(self.sistema.asignar_permisos, self.nombres[i], destino, tipo, "revocar")
+        return 0
+
+    def mixto_multiusuario(self, medicion, aleatorio):
+        #Cada hilo es un usuario con su propia sesion: lee, lee rangos, edita, agrega y lista
+        semillas = [aleatorio.random() for _ in range(self.hilos)]
+        totales = [0] * self.hilos
+
+        def trabajar(indice):
+            local = random.Random(semillas[indice])
+            usuario = self.usuarios[indice % len(self.usuarios)]
+            propios = [nombre for i, nombre in enumerate(self.nombres) if i % len(self.usuarios) == indice % len(self.usuarios)]
+            with self.sistema.como_usuario(usuario):
+                for _ in range(max(1, self.archivos // self.hilos)):
+                    eleccion = local.random()
+                    nombre = local.choice(propios) if propios else local.choice(self.nombres)
+                    if eleccion < 0.4:
+                        _, contenido = medicion.medir(self.sistema.obtener_contenido_archivo, nombre)
+                        totales[indice] += len(contenido or "")
+                    elif eleccion < 0.6:
+                        _, datos = medicion.medir(self.sistema.leer_rango, nombre, local.randrange(self.tamaño), 256)
+                        totales[indice] += len(datos or "")
+                    elif eleccion < 0.75:
+                        texto = _texto(local, 64)
+                        medicion.medir(self.sistema.agregar_contenido, nombre, texto)
+                        totales[indice] += len(texto)
+                    elif eleccion < 0.9:
+                        texto = _texto(local, self.tamaño)
+                        medicion.medir(self.sistema.modificar_archivo, nombre, texto)
+                        totales[indice] += len(texto)
+                    else:
+                        medicion.medir(self.sistema.consultar, None, False, usuario)
+
+        hilos = [threading.Thread(target=trabajar, args=(i,)) for i in range(self.hilos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return sum(totales)
+
+    def cerrar(self):
+        self.sistema.cerrar()
+
+
+def comparar(actual, base, umbral=UMBRAL_REGRESION):
+    #Devuelve {carga: cambio relativo de ops/s} y la lista de cargas que empeoraron mas que el umbral
+    cambios = {}
+    regresiones = []
+    for carga, medidas in actual["cargas"].items():
+        anterior = base.get("cargas", {}).get(carga)
+        if not anterior or not anterior["ops_por_segundo"]:
+            continue
+        cambio = medidas["ops_por_segundo"] / anterior["ops_por_segundo"] - 1
+        cambios[carga] = cambio
+        if cambio < -umbral:
+            regresiones.append(carga)
+    return cambios, regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banco de pruebas del motor FAT.")
+    parser.add_argument("--archivos", type=int, default=1000)
+    parser.add_argument("--tamaño", type=int, default=2048, help="Caracteres por archivo.")
+    parser.add_argument("--usuarios", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=4, help="Hilos de la carga mixta.")
+    parser.add_argument("--rondas-listado", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--cargas", default=",".join(CARGAS), help="Lista separada por comas; el orden importa.")
+    parser.add_argument("--almacen", choices=("imagen", "json"), help="Almacen de un volumen nuevo (por defecto, imagen).")
+    parser.add_argument("--tamaño-bloque", type=int)
+    parser.add_argument("--compresion", choices=sorted(CODECS))
+    parser.add_argument("--deduplicar", action="store_true")
+    parser.add_argument("--raiz", help="Directorio para el volumen; por defecto uno temporal que se borra al final.")
+    parser.add_argument("--salida", help="Escribe el informe en este archivo en lugar de stdout.")
+    parser.add_argument("--comparar", help="Informe anterior con el que comparar ops/s.")
+    parser.add_argument("--metricas", action="store_true", help="Activa las metricas del motor e incluye su instantanea.")
+    argumentos = parser.parse_args(argv)
+    cargas = [carga for carga in argumentos.cargas.split(",") if carga]
+    desconocidas = [carga for carga in cargas if carga not in CARGAS]
+    if desconocidas:
+        parser.error(f"cargas desconocidas: {', '.join(desconocidas)}")
+
+    raiz = argumentos.raiz or tempfile.mkdtemp(prefix="bench_fat_")
+    opciones_volumen = {"almacen": argumentos.almacen, "tamaño_bloque": argumentos.tamaño_bloque,
+                        "compresion": argumentos.compresion, "deduplicar": argumentos.deduplicar}
+    banco = BancoFAT(raiz, argumentos.archivos, argumentos.tamaño, argumentos.usuarios, argumentos.hilos,
+                     argumentos.rondas_listado, argumentos.semilla, opciones_volumen)
+    banco.sistema.metricas.activas = argumentos.metricas
+    try:
+        resultados = banco.ejecutar(cargas)
+    finally:
+        banco.cerrar()
+    informe = {
+        "version": VERSION_INFORME,
+        "parametros": dict(vars(argumentos), cargas=cargas),
+        "plataforma": {"python": platform.python_version(), "sistema": platform.platform()},
+        "volumen": dict(banco.sistema.volumen),
+        "cargas": resultados,
+        "huella_disco": _huella_disco(raiz),
+    }
+    if argumentos.metricas:
+        informe["metricas"] = banco.sistema.metricas.instantanea()
+    if not argumentos.raiz:
+        shutil.rmtree(raiz, ignore_errors=True)
+    codigo = 0
+    if argumentos.comparar:
+        with open(argumentos.comparar) as f:
+            cambios, regresiones = comparar(informe, json.load(f))
+        informe["comparacion"] = {"cambio_ops_por_segundo": cambios, "regresiones": regresiones}
+        codigo = 1 if regresiones else 0
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, "w") as f:
+            f.write(texto + "\n")
+    else:
+        sys.stdout.write(texto + "\n")
+    return codigo
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+import argparse
+import os
+import re
+import shlex
+import sys
+
+from motor_fat import CONTRASENA_DEFECTO, HILOS_IMPORTACION, ORDENES_CONSULTA, PROPIETARIO_DEFECTO, SistemaFAT
+
+#Linea de comandos: fat [--usuario U] [--contrasena C] <orden> [argumentos]
+#"fat batch" lee una orden por linea de stdin sobre el mismo volumen abierto; el contenido va entre comillas.
+#Las credenciales por defecto salen de FAT_USUARIO y FAT_CONTRASENA, y el directorio del volumen de FAT_RAIZ
+MODOS_PERMISO = {"r": ("lectura",), "w": ("escritura",), "rw": ("lectura", "escritura")}
+PATRON_PERMISO = re.compile(r'^(.+)([+-])(rw|r|w)$')
+
+
+def _construir_ordenes(subparsers):
+    orden = subparsers.add_parser("create", help="Crea un archivo; sin contenido lo lee de stdin.")
+    orden.add_argument("nombre")
+    orden.add_argument("contenido", nargs="?")
+    orden = subparsers.add_parser("cat", help="Muestra el contenido de un archivo.")
+    orden.add_argument("nombre")
+    orden = subparsers.add_parser("edit", help="Reemplaza el contenido de un archivo; sin contenido lo lee de stdin.")
+    orden.add_argument("nombre")
+    orden.add_argument("contenido", nargs="?")
+    orden.add_argument("-a", "--anexar", action="store_true", help="Agrega el contenido al final.")
+    orden = subparsers.add_parser("ls", help="Lista los archivos.")
+    orden.add_argument("-a", "--todos", action="store_true", help="Incluye los archivos en papelera.")
+    orden.add_argument("--papelera", action="store_true", help="Solo los archivos en papelera.")
+    orden.add_argument("--propietario", help="Solo los archivos de este usuario.")
+    orden.add_argument("--ordenar", default="nombre", choices=ORDENES_CONSULTA, help="Campo por el que se ordena.")
+    orden.add_argument("-r", "--inverso", action="store_true", help="Invierte el orden.")
+    orden.add_argument("-n", "--limite", type=int, help="Muestra como maximo esta cantidad.")
+    orden = subparsers.add_parser("search", help='Busca archivos por contenido: palabras, "frases" y prefijos*.')
+    orden.add_argument("consulta")
+    orden.add_argument("-a", "--todos", action="store_true", help="Incluye los archivos en papelera.")
+    orden.add_argument("-n", "--limite", type=int, help="Muestra como maximo esta cantidad.")
+    orden = subparsers.add_parser("clone", help="Clona un archivo; el clon comparte los bloques hasta que uno de los dos cambia.")
+    orden.add_argument("nombre")
+    orden.add_argument("destino")
+    orden = subparsers.add_parser("rm", help="Mueve un archivo a la papelera.")
+    orden.add_argument("nombre")
+    orden.add_argument("--purgar", action="store_true", help="Lo elimina definitivamente.")
+    orden = subparsers.add_parser("restore", help="Recupera un archivo de la papelera.")
+    orden.add_argument("nombre")
+    orden = subparsers.add_parser("vacuum", help="Purga la papelera vencida, recupera bloques huerfanos y desfragmenta.")
+    orden.add_argument("--retencion", type=float, help="Dias en papelera antes de purgar (por defecto, los del volumen).")
+    orden.add_argument("--sin-desfragmentar", action="store_true")
+    orden.add_argument("--ritmo", type=int, help="Maximo de bloques procesados por segundo.")
+    orden = subparsers.add_parser("import", help="Importa un directorio o un tar del anfitrion.")
+    orden.add_argument("origen")
+    orden.add_argument("-j", "--hilos", type=int, default=HILOS_IMPORTACION)
+    orden = subparsers.add_parser("export", help="Exporta los archivos legibles a un directorio o a un .tar, .tar.gz, .tgz, .tar.bz2 o .tar.xz.")
+    orden.add_argument("destino")
+    orden.add_argument("nombres", nargs="*", help="Solo estos archivos.")
+    orden.add_argument("-j", "--hilos", type=int, default=HILOS_IMPORTACION)
+    orden = subparsers.add_parser("snapshot", help="Crea, lista, lee, restaura o elimina instantáneas del volumen.")
+    acciones = orden.add_subparsers(dest="accion", required=True)
+    accion = acciones.add_parser("create", help="Crea una instantánea.")
+    accion.add_argument("instantanea")
+    accion = acciones.add_parser("ls", help="Lista las instantáneas o, con un nombre, sus archivos.")
+    accion.add_argument("instantanea", nargs="?")
+    accion.add_argument("-a", "--todos", action="store_true", help="Incluye los archivos en papelera.")
+    accion = acciones.add_parser("cat", help="Muestra un archivo tal como estaba en la instantánea.")
+    accion.add_argument("instantanea")
+    accion.add_argument("nombre")
+    accion = acciones.add_parser("restore", help="Vuelve el volumen, o solo los archivos dados, a la instantánea.")
+    accion.add_argument("instantanea")
+    accion.add_argument("nombres", nargs="*")
+    accion = acciones.add_parser("rm", help="Elimina una instantánea y libera los bloques que solo ella usaba.")
+    accion.add_argument("instantanea")
+    orden = subparsers.add_parser("chmod", help="Da (+) o quita (-) permisos r, w o rw a un usuario.")
+    orden.add_argument("nombre")
+    orden.add_argument("permiso", help="usuario seguido de +r, -r, +w, -w, +rw o -rw, por ejemplo bob+rw")
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="fat", description="Sistema de archivos FAT simulado.")
+    parser.add_argument("--usuario", default=os.environ.get("FAT_USUARIO", PROPIETARIO_DEFECTO))
+    parser.add_argument("--contrasena", default=os.environ.get("FAT_CONTRASENA", CONTRASENA_DEFECTO))
+    parser.add_argument("--raiz", default=os.environ.get("FAT_RAIZ"), help="Directorio del volumen (por defecto, el actual).")
+    subparsers = parser.add_subparsers(dest="orden", required=True)
+    _construir_ordenes(subparsers)
+    subparsers.add_parser("batch", help="Ejecuta las ordenes de stdin, una por linea.")
+    return parser
+
+
+def _parser_lote():
+    parser = argparse.ArgumentParser(prog="fat batch", add_help=False)
+    _construir_ordenes(parser.add_subparsers(dest="orden", required=True))
+    return parser
+
+
+def _interpretar(parser, argv):
+    #argparse asigna los posicionales opcionales antes de ver las opciones: en "edit a -a texto"
+    #el contenido queda sobrante y se recupera aqui
+    argumentos, sobrantes = parser.parse_known_args(argv)
+    if sobrantes[:1] == ["--"]:
+        del sobrantes[0]
+    if sobrantes and getattr(argumentos, "contenido", False) is None and len(sobrantes) == 1:
+        argumentos.contenido = sobrantes.pop()
+    if sobrantes:
+        parser.error(f"argumentos no reconocidos: {' '.join(sobrantes)}")
+    return argumentos
+
+
+def _contenido(argumentos, en_lote):
+    if argumentos.contenido is not None:
+        return argumentos.contenido
+    if en_lote:
+        return None
+    return sys.stdin.read()
+
+
+def _mostrar_progreso(informe):
+    total = f"/{informe['total']}" if informe["total"] is not None else ""
+    sys.stderr.write(f"\r{informe['archivos']}{total} archivos, {informe['mb_por_segundo']:.1f} MB/s")
+    sys.stderr.flush()
+
+
+def _escribir_informe(informe, salida):
+    for clave, valor in informe.items():
+        if clave in ("fallidos", "omitidos"):
+            for nombre, motivo in valor:
+                salida.write(f"{clave[:-1]}\t{nombre}\t{motivo}\n")
+            valor = len(valor)
+        salida.write(f"{clave}\t{valor:.3f}\n" if isinstance(valor, float) else f"{clave}\t{valor}\n")
+
+
+def _escribir_entradas(entradas, salida):
+    for entrada in entradas:
+        marca = "\t(papelera)" if entrada.get("estado_papelera") else ""
+        salida.write(f"{entrada['nombre']}\t{entrada['propietario']}\t{entrada['cant_caracteres']}\t{entrada['fecha_modificacion']}{marca}\n")
+
+
+def _escribir_fragmentos(metadata, fragmentos, salida):
+    if not metadata:
+        return False, fragmentos
+    for fragmento in fragmentos:
+        salida.write(fragmento)
+    salida.write("\n")
+    return True, None
+
+
+def _ejecutar_instantanea(sesion, argumentos, salida):
+    accion = argumentos.accion
+    if accion == "create":
+        return sesion.crear_instantanea(argumentos.instantanea)
+    if accion == "ls" and argumentos.instantanea is None:
+        for instantanea in sesion.listar_instantaneas():
+            salida.write(f"{instantanea['nombre']}\t{instantanea['fecha_creacion']}\t{instantanea['archivos']}\n")
+        return True, None
+    if accion == "ls":
+        exito, entradas = sesion.archivos_instantanea(argumentos.instantanea, argumentos.todos)
+        if not exito:
+            return exito, entradas
+        _escribir_entradas(entradas, salida)
+        return True, None
+    if accion == "cat":
+        return _escribir_fragmentos(*sesion.leer_instantanea(argumentos.instantanea, argumentos.nombre), salida)
+    if accion == "restore":
+        return sesion.restaurar_instantanea(argumentos.instantanea, argumentos.nombres or None)
+    return sesion.eliminar_instantanea(argumentos.instantanea)
+
+
+def ejecutar(sesion, argumentos, salida, en_lote=False):
+    #Ejecuta una orden ya interpretada y devuelve (exito, mensaje); cat escribe el contenido en salida
+    orden = argumentos.orden
+    if orden in ("create", "edit"):
+        contenido = _contenido(argumentos, en_lote)
+        if contenido is None:
+            return False, "Falta el contenido."
+        if orden == "create":
+            return sesion.crear_archivo(argumentos.nombre, contenido)
+        if argumentos.anexar:
+            return sesion.agregar_contenido(argumentos.nombre, contenido)
+        return sesion.modificar_archivo(argumentos.nombre, contenido)
+    if orden == "cat":
+        return _escribir_fragmentos(*sesion.abrir_lectura(argumentos.nombre), salida)
+    if orden == "clone":
+        return sesion.clonar_archivo(argumentos.nombre, argumentos.destino)
+    if orden == "ls":
+        en_papelera = True if argumentos.papelera else None if argumentos.todos else False
+        _, entradas = sesion.consultar(propietario=argumentos.propietario, en_papelera=en_papelera,
+                                       orden=argumentos.ordenar, descendente=argumentos.inverso, limite=argumentos.limite)
+        _escribir_entradas(entradas, salida)
+        return True, None
+    if orden == "search":
+        for nombre, apariciones in sesion.buscar(argumentos.consulta, argumentos.limite, argumentos.todos):
+            salida.write(f"{nombre}\t{apariciones}\n")
+        return True, None
+    if orden == "rm":
+        entrada = sesion.catalogo.obtener(argumentos.nombre)
+        if argumentos.purgar and entrada and entrada.get("estado_papelera"):
+            return sesion.purgar_archivo(argumentos.nombre)
+        exito, mensaje = sesion.eliminar_archivo(argumentos.nombre)
+        if exito and argumentos.purgar:
+            return sesion.purgar_archivo(argumentos.nombre)
+        return exito, mensaje
+    if orden == "restore":
+        return sesion.recuperar_archivo(argumentos.nombre)
+    if orden == "vacuum":
+        try:
+            informe = sesion.limpiar_volumen(argumentos.retencion, not argumentos.sin_desfragmentar, argumentos.ritmo)
+        except PermissionError as error:
+            return False, str(error)
+        _escribir_informe(informe, salida)
+        return True, None
+    if orden in ("import", "export"):
+        progreso = _mostrar_progreso if sys.stderr.isatty() else None
+        try:
+            if orden == "import":
+                informe = sesion.importar(argumentos.origen, argumentos.hilos, progreso)
+            else:
+                informe = sesion.exportar(argumentos.destino, argumentos.nombres or None, argumentos.hilos, progreso)
+        except (OSError, ValueError) as error:
+            return False, str(error)
+        if progreso:
+            sys.stderr.write("\n")
+        _escribir_informe(informe, salida)
+        return not informe["fallidos"], None
+    if orden == "snapshot":
+        return _ejecutar_instantanea(sesion, argumentos, salida)
+    if orden == "chmod":
+        coincidencia = PATRON_PERMISO.match(argumentos.permiso)
+        if not coincidencia:
+            return False, f"Permiso '{argumentos.permiso}' no válido."
+        usuario, signo, letras = coincidencia.groups()
+        accion = "agregar" if signo == "+" else "revocar"
+        for tipo in MODOS_PERMISO[letras]:
+            exito, mensaje = sesion.asignar_permisos(argumentos.nombre, usuario.lower(), tipo, accion)
+            if not exito:
+                return exito, mensaje
+        return True, mensaje
+    return False, f"Orden '{orden}' no válida."
+
+
+def ejecutar_lote(sesion, entrada, salida, errores):
+    #Devuelve la cantidad de ordenes que fallaron; una linea invalida no detiene el lote
+    parser = _parser_lote()
+    total = fallidas = 0
+    for numero, linea in enumerate(entrada, 1):
+        linea = linea.strip()
+        if not linea or linea.startswith("#"):
+            continue
+        total += 1
+        try:
+            argumentos = _interpretar(parser, shlex.split(linea))
+        except (SystemExit, ValueError):
+            errores.write(f"linea {numero}: orden no válida\n")
+            fallidas += 1
+            continue
+        exito, mensaje = ejecutar(sesion, argumentos, salida, en_lote=True)
+        if not exito:
+            errores.write(f"linea {numero}: {mensaje}\n")
+            fallidas += 1
+    errores.write(f"{total} órdenes, {fallidas} fallidas\n")
+    return fallidas
+
+
+def main(argv=None):
+    argumentos = _interpretar(_parser(), argv)
+    sistema = SistemaFAT(raiz=argumentos.raiz)
+    try:
+        sesion = sistema.abrir_sesion(argumentos.usuario, argumentos.contrasena)
+        if sesion is None:
+            sys.stderr.write("Credenciales incorrectas.\n")
+            return 1
+        if argumentos.orden == "batch":
+            return 1 if ejecutar_lote(sesion, sys.stdin, sys.stdout, sys.stderr) else 0
+        exito, mensaje = ejecutar(sesion, argumentos, sys.stdout)
+        if mensaje:
+            (sys.stdout if exito else sys.stderr).write(mensaje + "\n")
+        return 0 if exito else 1
+    finally:
+        sistema.cerrar()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,3560 @@
+import bisect
+import bz2
+import codecs
+import contextlib
+import copy
+import functools
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import re
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import weakref
+import zlib
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timedelta
+
+#Todas las configuraciones necesarias en los directorios
+#Tamaño de bloque por defecto; cada volumen guarda el suyo en RUTA_VOLUMEN al crearse
+TAMAÑO_BLOQUE = 20
+DIR_FAT = 'fat_data'
+DIR_DATOS = 'datos_archivos'
+PROPIETARIO_DEFECTO = 'admin'
+CONTRASENA_DEFECTO = 'admin'
+RUTA_USUARIOS = 'usuarios.json'
+RUTA_VOLUMEN = 'volumen.json'
+RUTA_CATALOGO = os.path.join(DIR_FAT, 'catalogo.log')
+RUTA_DIARIO = os.path.join(DIR_FAT, 'diario.log')
+RUTA_INDICE_TEXTO = os.path.join(DIR_FAT, 'indice_texto.idx')
+DIR_INSTANTANEAS = os.path.join(DIR_FAT, 'instantaneas')
+EXTENSION_INSTANTANEA = '.cat'
+PATRON_INSTANTANEA = re.compile(r'^\w[\w.-]*$')
+INTERVALO_PUNTO_CONTROL = 5.0
+LIMITE_DIARIO_BYTES = 16 * 1024 * 1024
+RUTA_IMAGEN = os.path.join(DIR_DATOS, 'disco.img')
+BLOQUES_INICIALES_IMAGEN = 1024
+RUTA_MAPA_BLOQUES = os.path.join(DIR_DATOS, 'mapa_bloques.bin')
+RUTA_REFERENCIAS = os.path.join(DIR_DATOS, 'referencias.log')
+TAMAÑO_FRAGMENTO_LECTURA = 64 * 1024
+LOTE_LECTURA = 256
+CACHE_BLOQUES_BYTES = 8 * 1024 * 1024
+CARACTERES_POR_MARCO = 32 * 1024
+HILOS_LECTURA = 8
+HILOS_IMPORTACION = 4
+LOTE_IMPORTACION = 64
+INTERVALO_PROGRESO = 0.5
+MANIFIESTO_EXPORTACION = '.manifiesto_fat.jsonl'
+PREFIJO_PAX = 'FAT.'
+#Sufijo del destino -> compresion de tarfile; cualquier otro destino se exporta como directorio
+EXTENSIONES_TAR = {".tar.gz": "gz", ".tgz": "gz", ".tar.bz2": "bz2", ".tar.xz": "xz", ".tar": ""}
+RETENCION_PAPELERA_DIAS = 30
+INTERVALO_LIMPIEZA = 3600.0
+SOBRECOSTO_BLOQUE_CACHE = 64
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+ORDENES_CONSULTA = ("nombre", "propietario", "cant_caracteres", "fecha_creacion", "fecha_modificacion", "fecha_eliminacion")
+
+#Codecs de compresion por marco: nombre -> (comprimir, descomprimir) sobre bytes; se pueden registrar otros
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+    "bz2": (bz2.compress, bz2.decompress),
+}
+
+#Almacenamiento de bloques
+class AlmacenJSON:
+    #Formato heredado: un archivo JSON por bloque, la cadena enlaza rutas
+    tipo = 'json'
+
+    PATRON_ID = re.compile(r'bloque_(\d+)\.json$')
+
+    def __init__(self, directorio=DIR_DATOS):
+        self.directorio = directorio
+        self._sucios = set()
+        os.makedirs(directorio, exist_ok=True)
+
+    def referencia(self, id_bloque):
+        return os.path.join(self.directorio, f"bloque_{id_bloque}.json")
+
+    def identificador(self, ref):
+        #Los bloques heredados con nombre bloque_{timestamp}_{i} no pertenecen al asignador
+        coincidencia = self.PATRON_ID.search(ref)
+        return int(coincidencia.group(1)) if coincidencia else None
+
+    def ids_ocupados(self):
+        return [i for i in map(self.identificador, os.listdir(self.directorio)) if i is not None]
+
+    def escribir(self, ref, bloque):
+        with open(ref, 'w') as f:
+            json.dump(bloque, f, separators=(',', ':'))
+        self._sucios.add(ref)
+
+    def leer(self, ref):
+        try:
+            with open(ref, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return None
+
+    def leer_tramo(self, id_inicial, cantidad):
+        return [self.leer(self.referencia(id_bloque)) for id_bloque in range(id_inicial, id_inicial + cantidad)]
+
+    def liberar(self, ref):
+        if os.path.exists(ref):
+            os.remove(ref)
+        self._sucios.add(ref)
+
+    def tamaño_en_disco(self, ref):
+        try:
+            return os.path.getsize(ref)
+        except OSError:
+            return 0
+
+    def sincronizar(self):
+        sucios, self._sucios = self._sucios, set()
+        for ref in sucios:
+            if os.path.exists(ref):
+                descriptor = os.open(ref, os.O_RDONLY)
+                os.fsync(descriptor)
+                os.close(descriptor)
+        if sucios:
+            descriptor = os.open(self.directorio, os.O_RDONLY)
+            os.fsync(descriptor)
+            os.close(descriptor)
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenImagen:
+    #Imagen unica preasignada con ranuras de ancho fijo, accedida con mmap; la cadena enlaza numeros de bloque
+    tipo = 'imagen'
+    MAGICO = b'FATIMG01'
+    CABECERA = struct.Struct('<8sIII')
+    TAM_CABECERA = 64
+    RANURA = struct.Struct('<BiH')
+    USADO = 1
+    EOF = 2
+
+    def __init__(self, ruta=RUTA_IMAGEN, tamaño_bloque=TAMAÑO_BLOQUE, bloques_iniciales=BLOQUES_INICIALES_IMAGEN):
+        self.ruta = ruta
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        if not os.path.exists(ruta):
+            with open(ruta, 'wb') as f:
+                f.write(self.CABECERA.pack(self.MAGICO, 1, tamaño_bloque, 0).ljust(self.TAM_CABECERA, b'\0'))
+            self._archivo = open(ruta, 'r+b')
+            self._abrir_mapa(0, tamaño_bloque)
+            self._crecer(bloques_iniciales)
+        else:
+            self._archivo = open(ruta, 'r+b')
+            magico, _, tamaño, total = self.CABECERA.unpack(self._archivo.read(self.CABECERA.size))
+            if magico != self.MAGICO:
+                raise ValueError(f"Imagen de disco inválida: {ruta}")
+            self._abrir_mapa(total, tamaño)
+
+    def _abrir_mapa(self, total, tamaño_bloque):
+        self.total = total
+        self.tamaño_bloque = tamaño_bloque
+        self.capacidad = tamaño_bloque * 4
+        self.ancho_ranura = self.RANURA.size + self.capacidad
+        self._mapa = mmap.mmap(self._archivo.fileno(), 0)
+
+    def _desplazamiento(self, ref):
+        return self.TAM_CABECERA + ref * self.ancho_ranura
+
+    def _crecer(self, cantidad):
+        #El mapa anterior no se cierra: un lector concurrente puede seguir usandolo hasta soltar su referencia
+        nuevo_total = self.total + cantidad
+        self._archivo.truncate(self._desplazamiento(nuevo_total))
+        self._mapa = mmap.mmap(self._archivo.fileno(), 0)
+        self.CABECERA.pack_into(self._mapa, 0, self.MAGICO, 1, self.tamaño_bloque, nuevo_total)
+        self.total = nuevo_total
+
+    def referencia(self, id_bloque):
+        if id_bloque >= self.total:
+            self._crecer(max(id_bloque + 1 - self.total, self.total))
+        return id_bloque
+
+    def identificador(self, ref):
+        return ref
+
+    def ids_ocupados(self):
+        return [i for i in range(self.total) if self._mapa[self._desplazamiento(i)] & self.USADO]
+
+    def escribir(self, ref, bloque):
+        datos = bloque["datos"].encode('utf-8')
+        if len(datos) > self.capacidad:
+            raise ValueError("El bloque excede la capacidad de la ranura.")
+        siguiente = bloque["siguiente_archivo"]
+        banderas = self.USADO | (self.EOF if bloque["eof"] else 0)
+        self.referencia(ref)
+        inicio = self._desplazamiento(ref)
+        self.RANURA.pack_into(self._mapa, inicio, banderas, -1 if siguiente is None else siguiente, len(datos))
+        inicio += self.RANURA.size
+        self._mapa[inicio:inicio + len(datos)] = datos
+
+    def leer(self, ref):
+        if ref is None or not 0 <= ref < self.total:
+            return None
+        mapa = self._mapa
+        inicio = self._desplazamiento(ref)
+        banderas, siguiente, longitud = self.RANURA.unpack_from(mapa, inicio)
+        if not banderas & self.USADO:
+            return None
+        inicio += self.RANURA.size
+        return {
+            "datos": mapa[inicio:inicio + longitud].decode('utf-8'),
+            "siguiente_archivo": None if siguiente < 0 else siguiente,
+            "eof": bool(banderas & self.EOF)
+        }
+
+    def leer_tramo(self, id_inicial, cantidad):
+        #Un tramo contiguo de ranuras se copia de la imagen en una sola lectura y se decodifica sin volver a copiarlo
+        cantidad = max(0, min(cantidad, self.total - id_inicial))
+        inicio = self._desplazamiento(id_inicial)
+        region = memoryview(self._mapa[inicio:inicio + cantidad * self.ancho_ranura])
+        bloques = []
+        for desplazamiento in range(0, len(region), self.ancho_ranura):
+            banderas, siguiente, longitud = self.RANURA.unpack_from(region, desplazamiento)
+            if not banderas & self.USADO:
+                bloques.append(None)
+                continue
+            datos = region[desplazamiento + self.RANURA.size:desplazamiento + self.RANURA.size + longitud]
+            bloques.append({
+                "datos": str(datos, 'utf-8'),
+                "siguiente_archivo": None if siguiente < 0 else siguiente,
+                "eof": bool(banderas & self.EOF)
+            })
+        return bloques
+
+    def liberar(self, ref):
+        if ref is None or not 0 <= ref < self.total:
+            return
+        self._mapa[self._desplazamiento(ref)] = 0
+
+    def tamaño_en_disco(self, ref):
+        return self.ancho_ranura
+
+    def sincronizar(self):
+        self._mapa.flush()
+
+    def cerrar(self):
+        self._mapa.flush()
+        self._mapa.close()
+        self._archivo.close()
+
+
+ALMACENES = {AlmacenJSON.tipo: AlmacenJSON, AlmacenImagen.tipo: AlmacenImagen}
+
+#Asignador de bloques con mapa de ocupacion persistente (un byte por bloque, mapeado con mmap)
+class AsignadorBloques:
+    LIBRE = 0
+    OCUPADO = 1
+    TAMAÑO_INICIAL = 4096
+
+    def __init__(self, ruta=RUTA_MAPA_BLOQUES, ids_ocupados=None):
+        self.ruta = ruta
+        nuevo = not os.path.exists(ruta)
+        if nuevo:
+            with open(ruta, 'wb') as f:
+                f.truncate(self.TAMAÑO_INICIAL)
+        self._archivo = open(ruta, 'r+b')
+        self._mapa = mmap.mmap(self._archivo.fileno(), 0)
+        if nuevo:
+            for id_bloque in ids_ocupados or ():
+                self._asegurar(id_bloque + 1)
+                self._mapa[id_bloque] = self.OCUPADO
+        #Los ids por encima del limite nunca se han usado; por debajo solo hay huecos liberados
+        self.limite = self._mapa.rfind(bytes([self.OCUPADO])) + 1
+        self.usados = self._mapa[:self.limite].count(self.OCUPADO)
+
+    def _asegurar(self, longitud):
+        if longitud <= len(self._mapa):
+            return
+        nueva_longitud = max(longitud, 2 * len(self._mapa))
+        self._mapa.close()
+        self._archivo.truncate(nueva_longitud)
+        self._mapa = mmap.mmap(self._archivo.fileno(), 0)
+
+    def reservar(self, cantidad, contiguos=False):
+        #Primero un tramo contiguo entre los huecos, luego huecos sueltos y por ultimo crecer por el final;
+        #con contiguos=True no se usan huecos sueltos
+        if cantidad <= 0:
+            return []
+        inicio = self._mapa.find(bytes(cantidad), 0, self.limite)
+        if inicio >= 0:
+            ids = list(range(inicio, inicio + cantidad))
+        elif not contiguos and self.limite - self.usados >= cantidad:
+            ids = []
+            posicion = 0
+            while len(ids) < cantidad:
+                posicion = self._mapa.find(bytes(1), posicion, self.limite)
+                ids.append(posicion)
+                posicion += 1
+        else:
+            inicio = self.limite
+            while inicio > 0 and self._mapa[inicio - 1] == self.LIBRE:
+                inicio -= 1
+            ids = list(range(inicio, inicio + cantidad))
+        self._asegurar(ids[-1] + 1)
+        for id_bloque in ids:
+            self._mapa[id_bloque] = self.OCUPADO
+        self.usados += cantidad
+        self.limite = max(self.limite, ids[-1] + 1)
+        return ids
+
+    def marcar_ocupado(self, id_bloque):
+        self._asegurar(id_bloque + 1)
+        if self._mapa[id_bloque] == self.LIBRE:
+            self._mapa[id_bloque] = self.OCUPADO
+            self.usados += 1
+            self.limite = max(self.limite, id_bloque + 1)
+
+    def liberar(self, id_bloque):
+        if id_bloque is None or id_bloque >= self.limite or self._mapa[id_bloque] == self.LIBRE:
+            return
+        self._mapa[id_bloque] = self.LIBRE
+        self.usados -= 1
+        while self.limite > 0 and self._mapa[self.limite - 1] == self.LIBRE:
+            self.limite -= 1
+
+    def ids_ocupados(self):
+        ids = []
+        posicion = self._mapa.find(bytes([self.OCUPADO]), 0, self.limite)
+        while posicion >= 0:
+            ids.append(posicion)
+            posicion = self._mapa.find(bytes([self.OCUPADO]), posicion + 1, self.limite)
+        return ids
+
+    def tramos_libres(self):
+        tramos = []
+        posicion = self._mapa.find(bytes(1), 0, self.limite)
+        while 0 <= posicion < self.limite:
+            fin = self._mapa.find(bytes([self.OCUPADO]), posicion, self.limite)
+            fin = self.limite if fin < 0 else fin
+            tramos.append((posicion, fin - posicion))
+            posicion = self._mapa.find(bytes(1), fin, self.limite)
+        return tramos
+
+    def sincronizar(self):
+        self._mapa.flush()
+
+    def cerrar(self):
+        self._mapa.flush()
+        self._mapa.close()
+        self._archivo.close()
+
+
+#Cache LRU de bloques limitada por bytes
+class CacheBloques:
+
+    def __init__(self, presupuesto_bytes=CACHE_BLOQUES_BYTES):
+        self.presupuesto_bytes = presupuesto_bytes
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._bloques = OrderedDict()
+        self._cerrojo = threading.Lock()
+
+    def _peso(self, bloque):
+        return len(bloque["datos"]) + SOBRECOSTO_BLOQUE_CACHE
+
+    def obtener(self, ref):
+        with self._cerrojo:
+            bloque = self._bloques.get(ref)
+            if bloque is None:
+                self.fallos += 1
+                return None
+            self._bloques.move_to_end(ref)
+            self.aciertos += 1
+            return bloque
+
+    def guardar(self, ref, bloque):
+        peso = self._peso(bloque)
+        with self._cerrojo:
+            anterior = self._bloques.pop(ref, None)
+            if anterior is not None:
+                self.bytes_usados -= self._peso(anterior)
+            if peso > self.presupuesto_bytes:
+                return
+            self._bloques[ref] = bloque
+            self.bytes_usados += peso
+            while self.bytes_usados > self.presupuesto_bytes:
+                _, desalojado = self._bloques.popitem(last=False)
+                self.bytes_usados -= self._peso(desalojado)
+                self.desalojos += 1
+
+    def invalidar(self, ref):
+        with self._cerrojo:
+            bloque = self._bloques.pop(ref, None)
+            if bloque is not None:
+                self.bytes_usados -= self._peso(bloque)
+
+    def vaciar(self):
+        with self._cerrojo:
+            self._bloques.clear()
+            self.bytes_usados = 0
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "bloques": len(self._bloques),
+            "bytes_usados": self.bytes_usados,
+            "presupuesto_bytes": self.presupuesto_bytes,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+        }
+
+
+#Diccionario en memoria persistido como registro de solo anexado
+class RegistroAnexado:
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.entradas = {}
+        self._lineas = 0
+        if os.path.exists(ruta):
+            self._cargar()
+        else:
+            self._inicializar()
+        self._registro = open(ruta, 'ab')
+
+    def _inicializar(self):
+        self._escribir_compactado()
+
+    def _cargar(self):
+        with open(self.ruta, 'rb') as f:
+            registros, completo = self._leer(f)
+        for nombre, entrada in registros:
+            if entrada is None:
+                self.entradas.pop(nombre, None)
+            else:
+                self.entradas[nombre] = entrada
+        self._lineas = len(registros)
+        #Un final truncado se descarta reescribiendo el registro; si no, lo anexado despues quedaria ilegible
+        if not completo or self._lineas > 2 * len(self.entradas) + 64:
+            self._escribir_compactado()
+
+    def _leer(self, f):
+        #Devuelve ([(nombre, entrada o None)], completo)
+        registros = []
+        for linea in f:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                registro = None
+            if registro is None or not linea.endswith(b"\n"):
+                return registros, False  #Linea final truncada por una escritura interrumpida
+            registros.append((registro["nombre"], registro["entrada"]))
+        return registros, True
+
+    def _cabecera(self):
+        return b""
+
+    def _codificar(self, nombre, entrada):
+        return (json.dumps({"nombre": nombre, "entrada": entrada}, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8')
+
+    def _escribir_compactado(self):
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'wb') as f:
+            f.write(self._cabecera())
+            f.writelines(self._codificar(nombre, entrada) for nombre, entrada in self.entradas.items())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+        self._lineas = len(self.entradas)
+
+    def _anexar(self, nombre, entrada):
+        self._registro.write(self._codificar(nombre, entrada))
+        self._registro.flush()
+        self._lineas += 1
+        if self._lineas > 2 * len(self.entradas) + 64:
+            self.compactar()
+
+    def obtener(self, nombre):
+        return self.entradas.get(nombre)
+
+    def guardar(self, nombre, entrada):
+        self.entradas[nombre] = entrada
+        self._anexar(nombre, entrada)
+
+    def eliminar(self, nombre):
+        if self.entradas.pop(nombre, None) is not None:
+            self._anexar(nombre, None)
+
+    def compactar(self):
+        self._registro.close()
+        self._escribir_compactado()
+        self._registro = open(self.ruta, 'ab')
+
+    def sincronizar(self):
+        self._registro.flush()
+        os.fsync(self._registro.fileno())
+
+    def cerrar(self):
+        self._registro.close()
+
+
+#Indices secundarios del catalogo para consultar sin recorrer todas las entradas
+class IndicesCatalogo:
+    FECHAS = ("fecha_modificacion", "fecha_eliminacion")
+
+    def __init__(self, entradas=()):
+        self.claves = {}  #Valores indexados de cada nombre, para quitarlo sin releer la entrada
+        self.por_propietario = {}
+        self.en_papelera = set()
+        self.lectores = {}
+        self.escritores = {}
+        self.fechas = {campo: [] for campo in self.FECHAS}  #Listas ordenadas de (fecha, nombre)
+        for nombre, entrada in entradas:
+            self.agregar(nombre, entrada)
+
+    def _claves(self, entrada):
+        permisos = entrada.get("permisos", {})
+        return {
+            "propietario": entrada.get("propietario"),
+            "estado_papelera": bool(entrada.get("estado_papelera", False)),
+            "lectura": tuple(permisos.get("lectura", ())),
+            "escritura": tuple(permisos.get("escritura", ())),
+            "fecha_modificacion": entrada.get("fecha_modificacion"),
+            "fecha_eliminacion": entrada.get("fecha_eliminacion") if entrada.get("estado_papelera") else None,
+        }
+
+    def agregar(self, nombre, entrada):
+        claves = self._claves(entrada)
+        self.claves[nombre] = claves
+        self.por_propietario.setdefault(claves["propietario"], set()).add(nombre)
+        if claves["estado_papelera"]:
+            self.en_papelera.add(nombre)
+        for tabla, tipo in ((self.lectores, "lectura"), (self.escritores, "escritura")):
+            for usuario in claves[tipo]:
+                tabla.setdefault(usuario, set()).add(nombre)
+        for campo in self.FECHAS:
+            if claves[campo] is not None:
+                bisect.insort(self.fechas[campo], (claves[campo], nombre))
+
+    def quitar(self, nombre):
+        claves = self.claves.pop(nombre, None)
+        if claves is None:
+            return
+        self._descartar(self.por_propietario, claves["propietario"], nombre)
+        self.en_papelera.discard(nombre)
+        for tabla, tipo in ((self.lectores, "lectura"), (self.escritores, "escritura")):
+            for usuario in claves[tipo]:
+                self._descartar(tabla, usuario, nombre)
+        for campo in self.FECHAS:
+            if claves[campo] is not None:
+                lista = self.fechas[campo]
+                posicion = bisect.bisect_left(lista, (claves[campo], nombre))
+                if posicion < len(lista) and lista[posicion] == (claves[campo], nombre):
+                    del lista[posicion]
+
+    def _descartar(self, tabla, clave, nombre):
+        nombres = tabla.get(clave)
+        if nombres is not None:
+            nombres.discard(nombre)
+            if not nombres:
+                del tabla[clave]
+
+    def filtrar(self, propietario=None, en_papelera=None, legible_por=None, escribible_por=None):
+        #Devuelve el conjunto de nombres que cumplen los filtros, o None si no se filtro nada
+        conjuntos = []
+        if propietario is not None:
+            conjuntos.append(self.por_propietario.get(propietario, set()))
+        if en_papelera:
+            conjuntos.append(self.en_papelera)
+        for usuario, tipo in ((legible_por, "lectura"), (escribible_por, "escritura")):
+            if usuario is not None and usuario != PROPIETARIO_DEFECTO:
+                conjuntos.append(self.accesibles(usuario, tipo))
+        resultado = None
+        if conjuntos:
+            conjuntos.sort(key=len)
+            resultado = set(conjuntos[0]).intersection(*conjuntos[1:])
+        if en_papelera is False:
+            resultado = (set(self.claves) if resultado is None else resultado) - self.en_papelera
+        return resultado
+
+    def accesibles(self, usuario, tipo_permiso):
+        #Nombres que el usuario (no administrador) puede leer o escribir; el propietario siempre tiene ambos permisos
+        return self.por_propietario.get(usuario, set()) | self._tabla_permisos(tipo_permiso).get(usuario, set())
+
+    def _tabla_permisos(self, tipo_permiso):
+        return self.lectores if tipo_permiso == "lectura" else self.escritores if tipo_permiso == "escritura" else {}
+
+    def rango(self, campo, desde=None, hasta=None):
+        #Pares (fecha, nombre) con desde <= fecha < hasta, en orden de fecha
+        lista = self.fechas[campo]
+        inicio = bisect.bisect_left(lista, (desde,)) if desde is not None else 0
+        fin = bisect.bisect_left(lista, (hasta,)) if hasta is not None else len(lista)
+        return lista[inicio:fin]
+
+
+#Fechas del catalogo: en memoria texto con FORMATO_FECHA, en disco segundos desde la epoca.
+#Se convierte por minutos memorizados y se añaden los segundos: las entradas suelen compartir minuto
+@functools.lru_cache(maxsize=4096)
+def _minuto_a_texto(minuto):
+    #Prefijo "AAAA-MM-DD HH:MM:" del minuto, o None si en la zona local el minuto no empieza en el segundo 0
+    fecha = datetime.fromtimestamp(minuto * 60)
+    return fecha.strftime(FORMATO_FECHA)[:-2] if fecha.second == 0 else None
+
+
+@functools.lru_cache(maxsize=4096)
+def _texto_a_minuto(prefijo):
+    try:
+        return int(datetime.strptime(prefijo + "00", FORMATO_FECHA).timestamp())
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def _epoca_a_fecha(epoca):
+    prefijo = _minuto_a_texto(epoca // 60)
+    if prefijo is None:
+        return datetime.fromtimestamp(epoca).strftime(FORMATO_FECHA)
+    return f"{prefijo}{epoca % 60:02d}"
+
+
+@functools.lru_cache(maxsize=4096)
+def _fecha_a_epoca(texto):
+    #None si el texto no es una fecha que vuelva igual al convertirla de nuevo (formato ajeno, hora inexistente)
+    segundos = texto[-2:]
+    if not (segundos.isascii() and segundos.isdigit()):
+        return None
+    inicio = _texto_a_minuto(texto[:-2])
+    if inicio is None:
+        return None
+    epoca = inicio + int(segundos)
+    return epoca if _epoca_a_fecha(epoca) == texto else None
+
+
+#Codificacion binaria de una entrada FAT: cabecera de ancho fijo, despues la clave, los ids de usuario de los
+#permisos, las extensiones, los marcos y por ultimo un JSON con los campos que no encajan en el formato
+#(indice_bloques de rutas heredadas, fechas con otro formato, claves desconocidas). Usuarios y codecs son
+#simbolos internados: el registro los define una vez y las entradas guardan su id
+class CodecEntrada:
+    CABECERA = struct.Struct('<HBIQqqqQqIIIIII')
+    MAX_U32 = 2 ** 32 - 1
+    MAX_I64 = 2 ** 63 - 1
+    #Bits de "presentes": que campos conocidos tiene la entrada
+    NOMBRE = 1
+    PAPELERA = 2
+    CARACTERES = 4
+    CREACION = 8
+    MODIFICACION = 16
+    ELIMINACION = 32
+    SIN_ELIMINACION = 64
+    PROPIETARIO = 128
+    PERMISOS = 256
+    REVISION = 512
+    RUTA = 1024
+    EXTENSIONES = 2048
+    MARCOS = 4096
+    FECHAS = {"fecha_creacion": (0, CREACION), "fecha_modificacion": (1, MODIFICACION), "fecha_eliminacion": (2, ELIMINACION)}
+
+    def __init__(self):
+        self.textos = [None]  #El id 0 es None (marco sin comprimir)
+        self.ids = {None: 0}
+        self.nuevos = []  #Ids creados desde la ultima vez que el registro los escribio
+
+    def simbolo(self, texto):
+        id_simbolo = self.ids.get(texto)
+        if id_simbolo is None:
+            id_simbolo = self.ids[texto] = len(self.textos)
+            self.textos.append(texto)
+            self.nuevos.append(id_simbolo)
+        return id_simbolo
+
+    def definir(self, vista):
+        id_simbolo = struct.unpack_from('<I', vista)[0]
+        texto = str(vista[4:], 'utf-8')
+        if id_simbolo >= len(self.textos):
+            self.textos.extend([None] * (id_simbolo + 1 - len(self.textos)))
+        self.textos[id_simbolo] = texto
+        self.ids[texto] = id_simbolo
+
+    def codificar_simbolo(self, id_simbolo):
+        return struct.pack('<I', id_simbolo) + self.textos[id_simbolo].encode('utf-8')
+
+    def _entero(self, valor, maximo):
+        return type(valor) is int and 0 <= valor <= maximo
+
+    def _enteros(self, valores, maximo):
+        return all(type(n) is int for n in valores) and (not valores or (min(valores) >= 0 and max(valores) <= maximo))
+
+    def _textos(self, valores):
+        return type(valores) is list and all(type(texto) is str for texto in valores)
+
+    def _planos(self, filas, ancho):
+        #Aplana una lista de listas de ancho fijo, o devuelve None si no tiene esa forma
+        if type(filas) is not list or not all(type(fila) is list and len(fila) == ancho for fila in filas):
+            return None
+        return [n for fila in filas for n in fila]
+
+    def codificar(self, clave, entrada):
+        presentes = banderas = propietario = caracteres = revision = ruta = 0
+        fechas = [0, 0, 0]
+        lectura = escritura = extensiones = marcos = ()
+        extra = {}
+        for campo, valor in entrada.items():
+            if campo in self.FECHAS:
+                epoca = _fecha_a_epoca(valor) if type(valor) is str else None
+                if epoca is not None:
+                    posicion, bit = self.FECHAS[campo]
+                    presentes |= bit
+                    fechas[posicion] = epoca
+                elif valor is None and campo == "fecha_eliminacion":
+                    presentes |= self.SIN_ELIMINACION
+                else:
+                    extra[campo] = valor
+            elif campo == "nombre" and valor == clave:
+                presentes |= self.NOMBRE
+            elif campo == "estado_papelera" and type(valor) is bool:
+                presentes |= self.PAPELERA
+                banderas = int(valor)
+            elif campo == "cant_caracteres" and self._entero(valor, self.MAX_I64):
+                presentes |= self.CARACTERES
+                caracteres = valor
+            elif campo == "propietario" and type(valor) is str:
+                presentes |= self.PROPIETARIO
+                propietario = self.simbolo(valor)
+            elif (campo == "permisos" and type(valor) is dict and len(valor) == 2
+                  and self._textos(valor.get("lectura")) and self._textos(valor.get("escritura"))):
+                presentes |= self.PERMISOS
+                lectura = [self.simbolo(u) for u in valor["lectura"]]
+                escritura = [self.simbolo(u) for u in valor["escritura"]]
+            elif campo == "revision" and self._entero(valor, self.MAX_I64):
+                presentes |= self.REVISION
+                revision = valor
+            elif campo == "ruta_datos_inicial" and self._entero(valor, self.MAX_I64):
+                presentes |= self.RUTA
+                ruta = valor
+            elif campo == "extensiones":
+                planos = self._planos(valor, 2)
+                if planos is not None and self._enteros(planos, self.MAX_I64):
+                    presentes |= self.EXTENSIONES
+                    extensiones = planos
+                else:
+                    extra[campo] = valor
+            elif campo == "marcos":
+                #[caracteres, bloques, codec]; el codec es un simbolo, None si el marco no esta comprimido
+                planos = self._planos(valor, 3)
+                if (planos is not None and self._enteros(planos[0::3] + planos[1::3], self.MAX_U32)
+                        and all(codec is None or type(codec) is str for codec in planos[2::3])):
+                    presentes |= self.MARCOS
+                    planos[2::3] = [self.simbolo(codec) for codec in planos[2::3]]
+                    marcos = planos
+                else:
+                    extra[campo] = valor
+            else:
+                extra[campo] = valor
+        clave_binaria = clave.encode('utf-8')
+        extra_binario = json.dumps(extra, ensure_ascii=False, separators=(',', ':')).encode('utf-8') if extra else b""
+        formato = f'<{len(clave_binaria)}s{len(lectura) + len(escritura)}I{len(extensiones)}q{len(marcos)}I{len(extra_binario)}s'
+        buffer = bytearray(self.CABECERA.size + len(clave_binaria) + 4 * (len(lectura) + len(escritura))
+                           + 8 * len(extensiones) + 4 * len(marcos) + len(extra_binario))
+        self.CABECERA.pack_into(buffer, 0, presentes, banderas, propietario, caracteres, *fechas, revision, ruta,
+                                len(lectura), len(escritura), len(extensiones) // 2, len(marcos) // 3,
+                                len(clave_binaria), len(extra_binario))
+        struct.pack_into(formato, buffer, self.CABECERA.size, clave_binaria, *lectura, *escritura, *extensiones, *marcos, extra_binario)
+        return buffer
+
+    def decodificar(self, vista):
+        #vista es un memoryview sobre el registro; los textos se decodifican directamente de el
+        (presentes, banderas, propietario, caracteres, creacion, modificacion, eliminacion, revision, ruta,
+         n_lectura, n_escritura, n_extensiones, n_marcos, largo_clave, largo_extra) = self.CABECERA.unpack_from(vista)
+        posicion = self.CABECERA.size
+        clave = str(vista[posicion:posicion + largo_clave], 'utf-8')
+        posicion += largo_clave
+        n_ids = n_lectura + n_escritura
+        n_enteros = 2 * n_extensiones
+        valores = struct.unpack_from(f'<{n_ids}I{n_enteros}q{3 * n_marcos}I', vista, posicion)
+        posicion += 4 * n_ids + 8 * n_enteros + 12 * n_marcos
+        ids = valores[:n_ids]
+        extensiones = valores[n_ids:n_ids + n_enteros]
+        marcos = valores[n_ids + n_enteros:]
+        textos = self.textos
+        entrada = {}
+        if presentes & self.NOMBRE:
+            entrada["nombre"] = clave
+        if presentes & self.RUTA:
+            entrada["ruta_datos_inicial"] = ruta
+        if presentes & self.PAPELERA:
+            entrada["estado_papelera"] = bool(banderas)
+        if presentes & self.CARACTERES:
+            entrada["cant_caracteres"] = caracteres
+        if presentes & self.CREACION:
+            entrada["fecha_creacion"] = _epoca_a_fecha(creacion)
+        if presentes & self.MODIFICACION:
+            entrada["fecha_modificacion"] = _epoca_a_fecha(modificacion)
+        if presentes & self.ELIMINACION:
+            entrada["fecha_eliminacion"] = _epoca_a_fecha(eliminacion)
+        elif presentes & self.SIN_ELIMINACION:
+            entrada["fecha_eliminacion"] = None
+        if presentes & self.PROPIETARIO:
+            entrada["propietario"] = textos[propietario]
+        if presentes & self.PERMISOS:
+            entrada["permisos"] = {"lectura": [textos[i] for i in ids[:n_lectura]],
+                                   "escritura": [textos[i] for i in ids[n_lectura:]]}
+        if presentes & self.MARCOS:
+            entrada["marcos"] = [[marcos[i], marcos[i + 1], textos[marcos[i + 2]]] for i in range(0, len(marcos), 3)]
+        if presentes & self.EXTENSIONES:
+            entrada["extensiones"] = [[extensiones[i], extensiones[i + 1]] for i in range(0, len(extensiones), 2)]
+        if presentes & self.REVISION:
+            entrada["revision"] = revision
+        if largo_extra:
+            entrada.update(json.loads(str(vista[posicion:posicion + largo_extra], 'utf-8')))
+        return clave, entrada
+
+
+#Catalogo FAT en memoria, persistido como registro binario: cabecera con la version del formato y despues
+#registros [tipo, longitud, crc32] + cuerpo. La version 1 era un registro de lineas JSON; al abrirlo se migra
+class CatalogoFAT(RegistroAnexado):
+    MAGICO = b'FATCAT'
+    VERSION = 2
+    CABECERA = struct.Struct('<6sH')
+    REGISTRO = struct.Struct('<BII')
+    ENTRADA = 1
+    BORRADO = 2
+    SIMBOLO = 3
+
+    def __init__(self, ruta=RUTA_CATALOGO):
+        self.codec = CodecEntrada()
+        self.version_origen = self.VERSION
+        super().__init__(ruta)
+        self.indices = IndicesCatalogo(self.entradas.items())
+
+    def _cargar(self):
+        super()._cargar()
+        if self.version_origen != self.VERSION:
+            #Migracion en linea: el registro JSON se reescribe compactado en binario con un reemplazo atomico
+            self._escribir_compactado()
+
+    def _leer(self, f):
+        datos = f.read()
+        if not datos.startswith(self.MAGICO):
+            self.version_origen = 1
+            f.seek(0)
+            return super()._leer(f)
+        _, version = self.CABECERA.unpack_from(datos)
+        if version > self.VERSION:
+            raise ValueError(f"El catálogo usa el formato {version}, posterior al soportado ({self.VERSION}).")
+        self.version_origen = version
+        vista = memoryview(datos)
+        registros = []
+        posicion = self.CABECERA.size
+        while posicion < len(datos):
+            if posicion + self.REGISTRO.size > len(datos):
+                return registros, False
+            tipo, longitud, crc = self.REGISTRO.unpack_from(vista, posicion)
+            inicio = posicion + self.REGISTRO.size
+            posicion = inicio + longitud
+            cuerpo = vista[inicio:posicion]
+            if posicion > len(datos) or zlib.crc32(cuerpo) != crc:
+                return registros, False  #Registro final truncado por una escritura interrumpida
+            if tipo == self.SIMBOLO:
+                self.codec.definir(cuerpo)
+            elif tipo == self.BORRADO:
+                registros.append((str(cuerpo, 'utf-8'), None))
+            else:
+                registros.append(self.codec.decodificar(cuerpo))
+        return registros, True
+
+    def _registro_binario(self, tipo, cuerpo):
+        return self.REGISTRO.pack(tipo, len(cuerpo), zlib.crc32(cuerpo)) + cuerpo
+
+    def _cabecera(self):
+        #Un registro compactado empieza definiendo todos los simbolos conocidos
+        self.codec.nuevos.clear()
+        simbolos = (self._registro_binario(self.SIMBOLO, self.codec.codificar_simbolo(i)) for i in range(1, len(self.codec.textos)))
+        return self.CABECERA.pack(self.MAGICO, self.VERSION) + b"".join(simbolos)
+
+    def _codificar(self, nombre, entrada):
+        if entrada is None:
+            registro = self._registro_binario(self.BORRADO, nombre.encode('utf-8'))
+        else:
+            registro = self._registro_binario(self.ENTRADA, self.codec.codificar(nombre, entrada))
+        if not self.codec.nuevos:
+            return registro
+        #Los simbolos que introduce la entrada se escriben antes que ella, en la misma escritura
+        simbolos = [self._registro_binario(self.SIMBOLO, self.codec.codificar_simbolo(i)) for i in self.codec.nuevos]
+        self.codec.nuevos.clear()
+        return b"".join(simbolos) + registro
+
+    #Toda mutacion del catalogo (operaciones, diario, conversion) pasa por aqui y mantiene los indices
+    def guardar(self, nombre, entrada):
+        self.indices.quitar(nombre)
+        super().guardar(nombre, entrada)
+        self.indices.agregar(nombre, entrada)
+
+    def eliminar(self, nombre):
+        self.indices.quitar(nombre)
+        super().eliminar(nombre)
+
+    def _inicializar(self):
+        #Volumenes anteriores guardaban una entrada JSON por archivo en DIR_FAT
+        directorio = os.path.dirname(self.ruta)
+        sueltas = [n for n in os.listdir(directorio) if n.endswith(".json")]
+        for nombre_archivo_json in sueltas:
+            with open(os.path.join(directorio, nombre_archivo_json), 'r') as f:
+                entrada = json.load(f)
+            self.entradas[entrada.get("nombre", nombre_archivo_json[:-len(".json")])] = entrada
+        self._escribir_compactado()
+        for nombre_archivo_json in sueltas:
+            os.remove(os.path.join(directorio, nombre_archivo_json))
+
+
+class InstantaneaFAT(CatalogoFAT):
+    #Copia congelada del catalogo con el mismo formato binario: se escribe compactada una sola vez y despues solo se lee
+
+    def __init__(self, ruta, entradas=None):
+        self._congeladas = entradas or {}
+        super().__init__(ruta)
+        self._registro.close()
+
+    def _inicializar(self):
+        self.entradas = self._congeladas
+        self._escribir_compactado()
+
+    def cerrar(self):
+        pass
+
+
+#Indice invertido de contenidos: termino -> {nombre: posiciones}. Se guarda entero al cerrar el volumen;
+#al abrirlo se reindexan los archivos cuya revision ya no coincide con la del catalogo
+class IndiceTexto:
+    PATRON_TERMINO = re.compile(r'\w+')
+    PATRON_CONSULTA = re.compile(r'"([^"]*)"|(\S+)')
+
+    def __init__(self):
+        #nombre -> [revision, cantidad de terminos, palabra final abierta o None, terminos del archivo]
+        self.documentos = {}
+        self.terminos = {}
+        self._vocabulario = None  #Terminos ordenados para los prefijos; se rehace cuando aparece o desaparece un termino
+        self.modificado = False
+
+    @classmethod
+    def cargar(cls, ruta):
+        indice = cls()
+        if os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    datos = json.load(f)
+                indice.terminos = datos["terminos"]
+                indice.documentos = {nombre: [revision, cantidad, abierta, set(terminos)]
+                                     for nombre, (revision, cantidad, abierta, terminos) in datos["documentos"].items()}
+            except (ValueError, KeyError):
+                indice = cls()  #Un indice ilegible se reconstruye desde el contenido
+        return indice
+
+    def guardar(self, ruta):
+        temporal = ruta + '.tmp'
+        documentos = {nombre: [revision, cantidad, abierta, list(terminos)]
+                      for nombre, (revision, cantidad, abierta, terminos) in self.documentos.items()}
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump({"documentos": documentos, "terminos": self.terminos}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporal, ruta)
+        self.modificado = False
+
+    def revision(self, nombre):
+        return self.documentos[nombre][0] if nombre in self.documentos else None
+
+    def indexar(self, nombre, revision, texto):
+        self.quitar(nombre)
+        documento = self.documentos[nombre] = [revision, 0, None, set()]
+        self._agregar(nombre, documento, texto, 0)
+
+    def anexar(self, nombre, revision, texto):
+        #Si el contenido terminaba en medio de una palabra, esa palabra se reindexa unida al texto nuevo
+        documento = self.documentos[nombre]
+        documento[0] = revision
+        inicio, abierta = documento[1], documento[2]
+        if abierta is not None:
+            inicio -= 1
+            posiciones = self.terminos[abierta][nombre]
+            posiciones.pop()
+            if not posiciones:
+                self._descartar(abierta, nombre)
+                documento[3].discard(abierta)
+            texto = abierta + texto
+        self._agregar(nombre, documento, texto, inicio)
+
+    def _agregar(self, nombre, documento, texto, inicio):
+        terminos = self.PATRON_TERMINO.findall(texto.lower())
+        locales = {}
+        for posicion, termino in enumerate(terminos, inicio):
+            posiciones = locales.get(termino)
+            if posiciones is None:
+                locales[termino] = [posicion]
+            else:
+                posiciones.append(posicion)
+        for termino, posiciones in locales.items():
+            publicaciones = self.terminos.get(termino)
+            if publicaciones is None:
+                publicaciones = self.terminos[termino] = {}
+                self._vocabulario = None
+            if nombre in publicaciones:
+                publicaciones[nombre] += posiciones
+            else:
+                publicaciones[nombre] = posiciones
+        documento[3].update(locales)
+        documento[1] = inicio + len(terminos)
+        documento[2] = terminos[-1] if terminos and self.PATRON_TERMINO.match(texto[-1:]) else None
+        self.modificado = True
+
+    def quitar(self, nombre):
+        documento = self.documentos.pop(nombre, None)
+        if documento is None:
+            return
+        for termino in documento[3]:
+            self._descartar(termino, nombre)
+        self.modificado = True
+
+    def _descartar(self, termino, nombre):
+        publicaciones = self.terminos[termino]
+        del publicaciones[nombre]
+        if not publicaciones:
+            del self.terminos[termino]
+            self._vocabulario = None
+
+    @classmethod
+    def interpretar(cls, consulta):
+        #Cada clausula es una frase ("entre comillas") o una palabra; un * final la vuelve prefijo
+        clausulas = []
+        for frase, palabra in cls.PATRON_CONSULTA.findall(consulta):
+            texto = frase or palabra
+            terminos = [termino.lower() for termino in cls.PATRON_TERMINO.findall(texto)]
+            if terminos:
+                clausulas.append((terminos, texto.endswith("*")))
+        return clausulas
+
+    def _expandir(self, termino, prefijo):
+        if not prefijo:
+            return [termino] if termino in self.terminos else []
+        if self._vocabulario is None:
+            self._vocabulario = sorted(self.terminos)
+        inicio = fin = bisect.bisect_left(self._vocabulario, termino)
+        while fin < len(self._vocabulario) and self._vocabulario[fin].startswith(termino):
+            fin += 1
+        return self._vocabulario[inicio:fin]
+
+    def _posiciones(self, termino, prefijo):
+        #{nombre: posiciones} del termino, o de todos los terminos que empiezan por el
+        expandidos = self._expandir(termino, prefijo)
+        if len(expandidos) == 1:
+            return self.terminos[expandidos[0]]
+        unidas = {}
+        for expandido in expandidos:
+            for nombre, posiciones in self.terminos[expandido].items():
+                unidas.setdefault(nombre, []).extend(posiciones)
+        return unidas
+
+    def _apariciones(self, nombre, listas):
+        #Veces que la frase aparece en el archivo: inicios donde cada termino sigue al anterior
+        if len(listas) == 1:
+            return len(listas[0][nombre])
+        inicios = set(listas[0][nombre])
+        for desfase, publicaciones in enumerate(listas[1:], 1):
+            inicios.intersection_update([posicion - desfase for posicion in publicaciones[nombre]])
+            if not inicios:
+                break
+        return len(inicios)
+
+    def buscar(self, consulta):
+        #Archivos que cumplen todas las clausulas, con la suma de sus apariciones; solo el ultimo termino
+        #de cada clausula puede ser prefijo
+        interpretadas = self.interpretar(consulta)
+        if len(interpretadas) == 1 and len(interpretadas[0][0]) == 1:
+            #Una sola palabra: basta contar las posiciones, sin unir las listas de los prefijos
+            resultado = {}
+            for expandido in self._expandir(*interpretadas[0][0], interpretadas[0][1]):
+                for nombre, posiciones in self.terminos[expandido].items():
+                    resultado[nombre] = resultado.get(nombre, 0) + len(posiciones)
+            return resultado
+        clausulas = [[self._posiciones(termino, prefijo and i == len(terminos) - 1) for i, termino in enumerate(terminos)]
+                     for terminos, prefijo in interpretadas]
+        if not clausulas:
+            return {}
+        menor, *resto = sorted((lista for listas in clausulas for lista in listas), key=len)
+        resultado = {}
+        for nombre in menor:
+            if not all(nombre in publicaciones for publicaciones in resto):
+                continue
+            total = 0
+            for listas in clausulas:
+                apariciones = self._apariciones(nombre, listas)
+                if not apariciones:
+                    break
+                total += apariciones
+            else:
+                resultado[nombre] = total
+        return resultado
+
+
+#Metricas de operaciones: histogramas de latencia y contadores de E/S
+class Histograma:
+    #La cubeta i cuenta las duraciones de menos de 2^i microsegundos que no cupieron en la anterior
+    CUBETAS = 32
+
+    def __init__(self):
+        self.cuentas = [0] * self.CUBETAS
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def anotar(self, segundos):
+        self.cuentas[min(int(segundos * 1e6).bit_length(), self.CUBETAS - 1)] += 1
+        self.total += 1
+        self.suma += segundos
+        self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, fraccion):
+        #Limite superior de la cubeta que alcanza la fraccion pedida, acotado por el maximo observado
+        acumulado = 0
+        for indice, cuenta in enumerate(self.cuentas):
+            acumulado += cuenta
+            if cuenta and acumulado >= fraccion * self.total:
+                return min((1 << indice) / 1e6, self.maximo)
+        return self.maximo
+
+    def exportar(self):
+        return {
+            "cuenta": self.total,
+            "total_ms": self.suma * 1000,
+            "media_ms": self.suma / self.total * 1000 if self.total else 0.0,
+            "p50_ms": self.percentil(0.50) * 1000,
+            "p90_ms": self.percentil(0.90) * 1000,
+            "p99_ms": self.percentil(0.99) * 1000,
+            "max_ms": self.maximo * 1000,
+            "cubetas_us": {str(1 << indice): cuenta for indice, cuenta in enumerate(self.cuentas) if cuenta},
+        }
+
+
+class Metricas:
+    #Desactivadas solo cuestan comprobar `activas` en cada operacion medida.
+    #perfilador es opcional y envuelve cada operacion medida: un perfil con enable()/disable(), como
+    #cProfile.Profile(), que se activa solo en la operacion mas externa de cada hilo, o un callable(nombre)
+    #que devuelve un gestor de contexto, por ejemplo para abrir un span de trazas
+
+    def __init__(self, activas=False, perfilador=None):
+        self.activas = activas
+        self.perfilador = perfilador
+        self._cerrojo = threading.Lock()
+        self._hilo = threading.local()
+        self.reiniciar()
+
+    def contexto(self, nombre):
+        perfilador = self.perfilador
+        if perfilador is None:
+            return contextlib.nullcontext()
+        if hasattr(perfilador, "enable"):
+            return self._perfilar(perfilador)
+        return perfilador(nombre)
+
+    @contextlib.contextmanager
+    def _perfilar(self, perfil):
+        #Las operaciones anidadas ya quedan dentro de la externa; desactivarlo al salir de ellas cortaria el perfil
+        profundidad = getattr(self._hilo, "profundidad", 0)
+        self._hilo.profundidad = profundidad + 1
+        if not profundidad:
+            perfil.enable()
+        try:
+            yield
+        finally:
+            self._hilo.profundidad = profundidad
+            if not profundidad:
+                perfil.disable()
+
+    def reiniciar(self):
+        with self._cerrojo:
+            self.histogramas = {}
+            self.contadores = {}
+            self.desde = time.time()
+
+    def anotar(self, nombre, segundos):
+        with self._cerrojo:
+            histograma = self.histogramas.get(nombre)
+            if histograma is None:
+                histograma = self.histogramas[nombre] = Histograma()
+            histograma.anotar(segundos)
+
+    def contar(self, **incrementos):
+        with self._cerrojo:
+            for clave, cantidad in incrementos.items():
+                self.contadores[clave] = self.contadores.get(clave, 0) + cantidad
+
+    def instantanea(self):
+        with self._cerrojo:
+            return {
+                "activas": self.activas,
+                "desde": datetime.fromtimestamp(self.desde).strftime("%Y-%m-%d %H:%M:%S"),
+                "segundos": time.time() - self.desde,
+                "operaciones": {nombre: histograma.exportar() for nombre, histograma in sorted(self.histogramas.items())},
+                "contadores": dict(sorted(self.contadores.items())),
+            }
+
+    def exportar(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.instantanea(), f, indent=2, ensure_ascii=False)
+
+
+#Contadores de una importacion o exportacion compartidos por sus hilos
+class ProgresoTransferencia:
+
+    def __init__(self, aviso=None, total=None):
+        self.aviso = aviso  #Recibe el informe parcial como mucho cada INTERVALO_PROGRESO segundos
+        self.total = total
+        self.archivos = 0
+        self.caracteres = 0
+        self.bytes = 0
+        self.fallidos = []
+        self.omitidos = []  #(nombre, motivo) de lo que no se transfiere a proposito, sin contar como fallo
+        self.inicio = time.perf_counter()
+        self._ultimo_aviso = self.inicio
+        self._cerrojo = threading.Lock()
+
+    def sumar(self, archivos=0, caracteres=0, cantidad_bytes=0):
+        with self._cerrojo:
+            self.archivos += archivos
+            self.caracteres += caracteres
+            self.bytes += cantidad_bytes
+            ahora = time.perf_counter()
+            avisar = self.aviso is not None and ahora - self._ultimo_aviso >= INTERVALO_PROGRESO
+            if avisar:
+                self._ultimo_aviso = ahora
+        if avisar:
+            self.aviso(self.informe())
+
+    def fallo(self, nombre, motivo):
+        with self._cerrojo:
+            self.fallidos.append((nombre, motivo))
+
+    def omitir(self, nombre, motivo):
+        with self._cerrojo:
+            self.omitidos.append((nombre, motivo))
+
+    def informe(self):
+        with self._cerrojo:
+            segundos = time.perf_counter() - self.inicio
+            return {
+                "archivos": self.archivos,
+                "total": self.total,
+                "fallidos": list(self.fallidos),
+                "omitidos": list(self.omitidos),
+                "caracteres": self.caracteres,
+                "bytes": self.bytes,
+                "segundos": segundos,
+                "archivos_por_segundo": self.archivos / segundos if segundos else 0.0,
+                "mb_por_segundo": self.bytes / segundos / 1e6 if segundos else 0.0,
+            }
+
+
+#Diario de escritura anticipada con confirmacion agrupada
+class Transaccion:
+    #Mutaciones de una operacion que se confirman juntas en un solo registro del diario
+
+    def __init__(self):
+        self.bloques = {}
+        self.fat = {}
+        self.reservados = []
+        self.liberados = []
+        self.referencias = {}
+        self.huellas = {}
+        #Copias privadas de las entradas leidas; el catalogo solo cambia al confirmar
+        self.leidas = {}
+        #nombre -> (revision anterior, revision, texto, anexado) para el indice de texto; se aplica despues de confirmar
+        self.textos = {}
+
+    def vacia(self):
+        return not (self.bloques or self.fat or self.liberados or self.referencias)
+
+    def registro(self):
+        return {
+            "bloques": [[ref, bloque] for ref, bloque in self.bloques.items()],
+            "fat": [[nombre, entrada] for nombre, entrada in self.fat.items()],
+            "reservados": self.reservados,
+            "liberados": self.liberados,
+            "referencias": [[id_bloque, referencia] for id_bloque, referencia in self.referencias.items()],
+        }
+
+
+class EstadoHilo(threading.local):
+    transaccion = None
+    usuario = None
+
+
+class CerrojoLecturaEscritura:
+    #Varios lectores o un escritor; un hilo puede volver a entrar en el modo que ya tiene y el escritor
+    #tambien puede leer. Los escritores en espera bloquean a lectores nuevos para no quedar postergados
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._lectores = {}
+        self._escritor = None
+        self._profundidad = 0
+        self._escritores_en_espera = 0
+
+    def adquirir_lectura(self):
+        hilo = threading.get_ident()
+        with self._condicion:
+            if self._escritor != hilo and hilo not in self._lectores:
+                while self._escritor is not None or self._escritores_en_espera:
+                    self._condicion.wait()
+            self._lectores[hilo] = self._lectores.get(hilo, 0) + 1
+
+    def liberar_lectura(self):
+        hilo = threading.get_ident()
+        with self._condicion:
+            if self._lectores[hilo] > 1:
+                self._lectores[hilo] -= 1
+                return
+            del self._lectores[hilo]
+            if not self._lectores:
+                self._condicion.notify_all()
+
+    def adquirir_escritura(self):
+        hilo = threading.get_ident()
+        with self._condicion:
+            if self._escritor == hilo:
+                self._profundidad += 1
+                return
+            if hilo in self._lectores:
+                raise RuntimeError("No se puede pasar de lectura a escritura con el mismo cerrojo.")
+            self._escritores_en_espera += 1
+            while self._escritor is not None or self._lectores:
+                self._condicion.wait()
+            self._escritores_en_espera -= 1
+            self._escritor = hilo
+            self._profundidad = 1
+
+    def liberar_escritura(self):
+        with self._condicion:
+            self._profundidad -= 1
+            if not self._profundidad:
+                self._escritor = None
+                self._condicion.notify_all()
+
+    @contextlib.contextmanager
+    def lectura(self):
+        self.adquirir_lectura()
+        try:
+            yield
+        finally:
+            self.liberar_lectura()
+
+    @contextlib.contextmanager
+    def escritura(self):
+        self.adquirir_escritura()
+        try:
+            yield
+        finally:
+            self.liberar_escritura()
+
+
+class DiarioEscritura:
+    #Cada linea es "crc32 json"; una linea incompleta o con crc invalido marca el final del diario
+
+    def __init__(self, sincronizar_almacen, ruta=RUTA_DIARIO, intervalo=INTERVALO_PUNTO_CONTROL, limite_bytes=LIMITE_DIARIO_BYTES):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.limite_bytes = limite_bytes
+        self._sincronizar_almacen = sincronizar_almacen
+        self._condicion = threading.Condition()
+        self._cerrojo_archivo = threading.Lock()
+        self._cerrojo_punto_control = threading.Lock()
+        self._cola = []
+        #lsn -> excepcion de la escritura que no llego a ser durable; confirmar la relanza
+        self._fallidos = {}
+        self._en_diario = {}
+        self._aplicados = set()
+        self._siguiente_lsn = 1
+        self._lsn_durable = 0
+        self._bytes = 0
+        self._cerrado = False
+        self.confirmaciones = 0
+        self.fsyncs = 0
+        self.puntos_control = 0
+        self._archivo = None
+        self._hilos = []
+
+    def recuperar(self):
+        #Devuelve los registros completos pendientes de aplicar; lo demas se descarta (rollback)
+        registros = []
+        if os.path.exists(self.ruta):
+            with open(self.ruta, 'rb') as f:
+                for linea in f:
+                    crc, _, cuerpo = linea.rstrip(b"\n").partition(b" ")
+                    if not linea.endswith(b"\n") or crc != b"%08x" % zlib.crc32(cuerpo):
+                        break
+                    registros.append(json.loads(cuerpo))
+        return registros
+
+    def iniciar(self):
+        self._archivo = open(self.ruta, 'wb')
+        self._hilos = [
+            threading.Thread(target=self._bucle_confirmacion, name="diario-confirmacion", daemon=True),
+            threading.Thread(target=self._bucle_punto_control, name="diario-punto-control", daemon=True),
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def confirmar(self, registro):
+        #Bloquea hasta que el registro es durable; varias operaciones concurrentes comparten un fsync.
+        #Si la escritura del grupo falla (p. ej. disco lleno) relanza el error y el registro no cuenta como escrito
+        cuerpo = json.dumps(registro, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        linea = b"%08x " % zlib.crc32(cuerpo) + cuerpo + b"\n"
+        with self._condicion:
+            lsn = self._siguiente_lsn
+            self._siguiente_lsn += 1
+            self._cola.append((lsn, linea))
+            self._condicion.notify_all()
+            while True:
+                error = self._fallidos.pop(lsn, None)
+                if error is not None:
+                    raise error
+                if self._lsn_durable >= lsn:
+                    return lsn
+                self._condicion.wait()
+
+    def marcar_aplicado(self, lsn):
+        with self._condicion:
+            self._aplicados.add(lsn)
+            if self._bytes > self.limite_bytes:
+                self._condicion.notify_all()
+
+    def _bucle_confirmacion(self):
+        while True:
+            with self._condicion:
+                while not self._cola and not self._cerrado:
+                    self._condicion.wait()
+                if not self._cola:
+                    return
+                lote, self._cola = self._cola, []
+            try:
+                self._escribir_lote(lote)
+            except Exception as error:
+                #El hilo sigue vivo: los que esperan el lote reciben el error y los siguientes lotes se intentan igual
+                with self._condicion:
+                    for lsn, _ in lote:
+                        self._fallidos[lsn] = error
+                    self._condicion.notify_all()
+                continue
+            with self._condicion:
+                for lsn, linea in lote:
+                    self._en_diario[lsn] = linea
+                    self._bytes += len(linea)
+                self._lsn_durable = lote[-1][0]
+                self.confirmaciones += len(lote)
+                self.fsyncs += 1
+                self._condicion.notify_all()
+
+    def _escribir_lote(self, lote):
+        with self._cerrojo_archivo:
+            inicio = self._archivo.tell()
+            try:
+                self._archivo.write(b"".join(linea for _, linea in lote))
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+            except OSError:
+                #Lo que llegara a escribirse del lote se recorta para que la recuperacion no aplique registros fallidos
+                try:
+                    self._archivo.close()
+                except OSError:
+                    pass
+                with open(self.ruta, 'r+b') as f:
+                    f.truncate(inicio)
+                self._archivo = open(self.ruta, 'ab')
+                raise
+
+    def _bucle_punto_control(self):
+        while True:
+            with self._condicion:
+                self._condicion.wait_for(lambda: self._cerrado or self._bytes > self.limite_bytes, timeout=self.intervalo)
+                if self._cerrado:
+                    return
+            self.punto_control()
+
+    def punto_control(self):
+        #Sincroniza el almacen principal y descarta del diario los registros ya aplicados
+        with self._cerrojo_punto_control:
+            with self._condicion:
+                aplicados = self._aplicados & self._en_diario.keys()
+            if not aplicados:
+                return
+            self._sincronizar_almacen()
+            with self._cerrojo_archivo, self._condicion:
+                for lsn in aplicados:
+                    del self._en_diario[lsn]
+                self._aplicados -= aplicados
+                restantes = [self._en_diario[lsn] for lsn in sorted(self._en_diario)]
+                self._archivo.close()
+                temporal = self.ruta + '.tmp'
+                with open(temporal, 'wb') as f:
+                    f.writelines(restantes)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporal, self.ruta)
+                self._archivo = open(self.ruta, 'ab')
+                self._bytes = sum(map(len, restantes))
+                self.puntos_control += 1
+
+    def estadisticas(self):
+        with self._condicion:
+            return {
+                "confirmaciones": self.confirmaciones,
+                "fsyncs": self.fsyncs,
+                "confirmaciones_por_fsync": self.confirmaciones / self.fsyncs if self.fsyncs else 0.0,
+                "puntos_control": self.puntos_control,
+                "bytes_diario": self._bytes,
+            }
+
+    def cerrar(self):
+        with self._condicion:
+            self._cerrado = True
+            self._condicion.notify_all()
+        for hilo in self._hilos:
+            hilo.join()
+        self.punto_control()
+        self._archivo.close()
+
+
+def _medido(metodo):
+    #Anota la latencia de la operacion en las metricas del sistema si estan activas
+    nombre = metodo.__name__
+
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        metricas = self.metricas
+        if not metricas.activas:
+            return metodo(self, *args, **kwargs)
+        contexto = metricas.contexto(nombre)
+        inicio = time.perf_counter()
+        try:
+            with contexto:
+                return metodo(self, *args, **kwargs)
+        finally:
+            metricas.anotar(nombre, time.perf_counter() - inicio)
+    return envoltura
+
+
+def _transaccional(metodo):
+    #Agrupa las escrituras del metodo en una transaccion; las llamadas anidadas se unen a la externa
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        if self._local.transaccion is not None:
+            return metodo(self, *args, **kwargs)
+        #Las cuentas de referencia se calculan sobre el estado confirmado: con deduplicacion o bloques compartidos
+        #por clones las escrituras van en serie
+        serie = self._cerrojo_deduplicacion if self.volumen["deduplicacion"] or self.referencias.entradas else contextlib.nullcontext()
+        with serie:
+            transaccion = self._local.transaccion = Transaccion()
+            try:
+                resultado = metodo(self, *args, **kwargs)
+            except BaseException:
+                self._descartar(transaccion)
+                raise
+            finally:
+                self._local.transaccion = None
+            try:
+                self._confirmar(transaccion)
+            except BaseException:
+                #El diario no pudo escribir el registro: nada se aplico y las reservas se devuelven
+                self._descartar(transaccion)
+                raise
+            if transaccion.textos:
+                self._indexar_textos(transaccion.textos)
+        return resultado
+    return envoltura
+
+
+def _cerrojo_archivo(modo):
+    #Toma el cerrojo del volumen en lectura y el del archivo nombrado en el primer argumento en `modo`;
+    #va por fuera de _transaccional para que la confirmacion ocurra con el archivo aun bloqueado
+    def decorador(metodo):
+        @functools.wraps(metodo)
+        def envoltura(self, nombre_archivo, *args, **kwargs):
+            cerrojo = self._cerrojo_de(nombre_archivo)
+            with self._cerrojo_volumen.lectura(), getattr(cerrojo, modo)():
+                return metodo(self, nombre_archivo, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+class SesionFAT:
+    #Contexto de un usuario sobre un SistemaFAT compartido; cada operacion se ejecuta con su usuario
+
+    def __init__(self, sistema, usuario):
+        self.sistema = sistema
+        self.usuario = usuario
+
+    def __getattr__(self, nombre):
+        atributo = getattr(self.sistema, nombre)
+        if nombre.startswith('_') or not callable(atributo):
+            return atributo
+
+        @functools.wraps(atributo)
+        def operacion(*args, **kwargs):
+            with self.sistema.como_usuario(self.usuario):
+                return atributo(*args, **kwargs)
+        return operacion
+
+
+#Principal
+class SistemaFAT:
+
+    def __init__(self, almacen=None, cache_bytes=CACHE_BLOQUES_BYTES, tamaño_bloque=None, deduplicar=None, compresion=None, raiz=None):
+        #raiz es el directorio del volumen; por defecto las rutas son relativas al directorio de trabajo
+        self.raiz = raiz
+        #FAT_METRICAS=1 las activa desde el arranque; tambien se pueden activar despues con metricas.activas = True
+        self.metricas = Metricas(activas=bool(os.environ.get("FAT_METRICAS")))
+        os.makedirs(self._ruta(DIR_FAT), exist_ok=True)
+        os.makedirs(self._ruta(DIR_DATOS), exist_ok=True)
+        os.makedirs(self._ruta(DIR_INSTANTANEAS), exist_ok=True)
+        if almacen and almacen not in ALMACENES:
+            raise ValueError(f"Almacen '{almacen}' no válido.")
+        if compresion and compresion not in CODECS:
+            raise ValueError(f"Codec de compresión '{compresion}' no válido.")
+        self.volumen = self._cargar_volumen(almacen, tamaño_bloque)
+        if deduplicar is not None and deduplicar != self.volumen["deduplicacion"]:
+            self.volumen["deduplicacion"] = deduplicar
+            self._guardar_volumen(self.volumen)
+        #compresion=False la desactiva para los archivos nuevos; los ya comprimidos se siguen leyendo
+        if compresion is not None and (compresion or None) != self.volumen["compresion"]:
+            self.volumen["compresion"] = compresion or None
+            self._guardar_volumen(self.volumen)
+        self._medidas_codec = {}
+        self.tamaño_bloque = self.volumen["tamaño_bloque"]
+        self.almacen = self._abrir_almacen(self.volumen["almacen"])
+        #Un volumen sin mapa de ocupacion lo reconstruye a partir de los bloques existentes
+        ids_ocupados = None if os.path.exists(self._ruta(RUTA_MAPA_BLOQUES)) else self.almacen.ids_ocupados()
+        self.asignador = AsignadorBloques(self._ruta(RUTA_MAPA_BLOQUES), ids_ocupados=ids_ocupados)
+        self.cache = CacheBloques(cache_bytes)
+        self.catalogo = CatalogoFAT(self._ruta(RUTA_CATALOGO))
+        #Bloques compartidos: id -> {"huella", "cuenta"}; un bloque sin registro tiene un solo dueño.
+        #Los clones comparten bloques sin huella
+        self.referencias = RegistroAnexado(self._ruta(RUTA_REFERENCIAS))
+        self._por_huella = {referencia["huella"]: id_bloque for id_bloque, referencia in self.referencias.entradas.items()
+                            if referencia["huella"] is not None}
+        #Instantaneas del volumen: nombre -> InstantaneaFAT; sus bloques quedan fijados (ver _fijar_instantaneas)
+        self._instantaneas = {}
+        for nombre_fichero in sorted(os.listdir(self._ruta(DIR_INSTANTANEAS))):
+            if nombre_fichero.endswith(EXTENSION_INSTANTANEA):
+                self._instantaneas[nombre_fichero[:-len(EXTENSION_INSTANTANEA)]] = InstantaneaFAT(
+                    os.path.join(self._ruta(DIR_INSTANTANEAS), nombre_fichero))
+        self._fijar_instantaneas()
+        self._local = EstadoHilo()
+        #Protege el catalogo, el asignador, las referencias y el almacen; los archivos tienen su propio cerrojo
+        self._cerrojo_almacen = threading.RLock()
+        self._cerrojo_volumen = CerrojoLecturaEscritura()
+        self._cerrojo_deduplicacion = threading.RLock()
+        self._cerrojo_medidas = threading.Lock()
+        self._cerrojo_usuarios = threading.Lock()
+        self._cerrojos_archivo = weakref.WeakValueDictionary()
+        self._cerrojo_tabla = threading.Lock()
+        self._pool = None
+        self._hilo_limpieza = None
+        self._fin_limpieza = threading.Event()
+        self.ultima_limpieza = None
+        #El indice de texto se carga en la primera busqueda; hasta entonces las escrituras no lo mantienen
+        self._indice_texto = None
+        self._pendientes_texto = set()
+        self._cerrojo_texto = threading.Lock()
+        self.diario = DiarioEscritura(self._sincronizar_almacen, self._ruta(RUTA_DIARIO))
+        registros = self.diario.recuperar()
+        for registro in registros:
+            self._aplicar(registro)
+        if registros:
+            self._sincronizar_almacen()
+        self.diario.iniciar()
+        self.usuarios_registrados = self._cargar_usuarios()
+
+    #El usuario es propio de cada hilo; las sesiones lo fijan durante cada operacion
+    @property
+    def usuario_actual(self):
+        return self._local.usuario
+
+    @usuario_actual.setter
+    def usuario_actual(self, usuario):
+        self._local.usuario = usuario
+
+    @contextlib.contextmanager
+    def como_usuario(self, usuario):
+        anterior = self._local.usuario
+        self._local.usuario = usuario
+        try:
+            yield
+        finally:
+            self._local.usuario = anterior
+
+    def abrir_sesion(self, nombre_usuario, contrasena):
+        if not self.verificar_credenciales(nombre_usuario, contrasena):
+            return None
+        return SesionFAT(self, nombre_usuario.lower())
+
+    def _cerrojo_de(self, nombre_archivo):
+        with self._cerrojo_tabla:
+            cerrojo = self._cerrojos_archivo.get(nombre_archivo)
+            if cerrojo is None:
+                cerrojo = self._cerrojos_archivo[nombre_archivo] = CerrojoLecturaEscritura()
+            return cerrojo
+
+    def enviar(self, operacion, *args, **kwargs):
+        #Ejecuta operacion en el pool de hilos con el usuario del hilo que la envia y devuelve un Future
+        usuario = self.usuario_actual
+        if self._pool is None:
+            #Se importa aqui para no cargar concurrent.futures (y logging) en cada arranque del motor
+            from concurrent.futures import ThreadPoolExecutor
+            with self._cerrojo_tabla:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=HILOS_LECTURA, thread_name_prefix="fat")
+
+        def ejecutar():
+            with self.como_usuario(usuario):
+                return operacion(*args, **kwargs)
+        return self._pool.submit(ejecutar)
+
+    @_medido
+    def leer_archivos(self, nombres_archivo):
+        #Lee varios archivos en paralelo; devuelve (metadata, contenido) de cada uno en el mismo orden
+        futuros = [self.enviar(self.obtener_contenido_archivo, nombre) for nombre in nombres_archivo]
+        return [futuro.result() for futuro in futuros]
+
+    def _confirmar(self, transaccion):
+        if transaccion.vacia():
+            return
+        inicio = time.perf_counter()
+        registro = transaccion.registro()
+        lsn = self.diario.confirmar(registro)
+        self._aplicar(registro)
+        self.diario.marcar_aplicado(lsn)
+        if self.metricas.activas:
+            self.metricas.anotar("_confirmar", time.perf_counter() - inicio)
+
+    def _descartar(self, transaccion):
+        with self._cerrojo_almacen:
+            for id_bloque in transaccion.reservados:
+                self.asignador.liberar(id_bloque)
+
+    def _aplicar(self, registro):
+        #Idempotente: la recuperacion puede volver a aplicar registros ya escritos en el almacen
+        with self._cerrojo_almacen:
+            for id_bloque in registro["reservados"]:
+                self.asignador.marcar_ocupado(id_bloque)
+            for ref, bloque in registro["bloques"]:
+                if bloque is None:
+                    self.almacen.liberar(ref)
+                    self.cache.invalidar(ref)
+                else:
+                    self.almacen.escribir(ref, bloque)
+                    self.cache.guardar(ref, bloque)
+            for id_bloque in registro["liberados"]:
+                self.asignador.liberar(id_bloque)
+            for id_bloque, referencia in registro.get("referencias", ()):
+                anterior = self.referencias.obtener(id_bloque)
+                if anterior is not None and self._por_huella.get(anterior["huella"]) == id_bloque:
+                    del self._por_huella[anterior["huella"]]
+                if referencia is None:
+                    self.referencias.eliminar(id_bloque)
+                else:
+                    self.referencias.guardar(id_bloque, referencia)
+                    if referencia["huella"] is not None:
+                        self._por_huella[referencia["huella"]] = id_bloque
+            for nombre, entrada in registro["fat"]:
+                if entrada is None:
+                    self.catalogo.eliminar(nombre)
+                else:
+                    self.catalogo.guardar(nombre, entrada)
+
+    def _sincronizar_almacen(self):
+        with self._cerrojo_almacen:
+            self.almacen.sincronizar()
+            self.asignador.sincronizar()
+            self.catalogo.sincronizar()
+            self.referencias.sincronizar()
+
+    def estadisticas_diario(self):
+        return self.diario.estadisticas()
+
+    def cerrar(self):
+        self.detener_limpieza()
+        if self._pool is not None:
+            self._pool.shutdown()
+        self.diario.cerrar()
+        if self._indice_texto is not None and self._indice_texto.modificado:
+            self._indice_texto.guardar(self._ruta(RUTA_INDICE_TEXTO))
+        self.almacen.cerrar()
+        self.asignador.cerrar()
+        self.catalogo.cerrar()
+        self.referencias.cerrar()
+
+    def _cargar_volumen(self, almacen, tamaño_bloque):
+        volumen = None
+        if os.path.exists(self._ruta(RUTA_VOLUMEN)):
+            with open(self._ruta(RUTA_VOLUMEN), 'r') as f:
+                volumen = json.load(f)
+        if volumen is None:
+            #Los volumenes anteriores a la imagen solo tienen bloques JSON sueltos; sin ellos se usa el almacen pedido
+            hay_bloques_json = not almacen and any(n.endswith(".json") for n in os.listdir(self._ruta(DIR_DATOS)))
+            volumen = {
+                "almacen": AlmacenJSON.tipo if hay_bloques_json else almacen or AlmacenImagen.tipo,
+                "tamaño_bloque": TAMAÑO_BLOQUE if hay_bloques_json else tamaño_bloque or TAMAÑO_BLOQUE
+            }
+        volumen.setdefault("tamaño_bloque", TAMAÑO_BLOQUE)
+        volumen.setdefault("deduplicacion", False)
+        volumen.setdefault("compresion", None)
+        volumen.setdefault("retencion_papelera_dias", RETENCION_PAPELERA_DIAS)
+        if almacen and almacen != volumen["almacen"]:
+            raise ValueError(f"El volumen usa el almacen '{volumen['almacen']}'; use convertir_almacen para cambiarlo.")
+        if tamaño_bloque and tamaño_bloque != volumen["tamaño_bloque"]:
+            raise ValueError(f"El volumen se creó con bloques de {volumen['tamaño_bloque']} caracteres.")
+        self._guardar_volumen(volumen)
+        return volumen
+
+    def _ruta(self, ruta):
+        return os.path.join(self.raiz, ruta) if self.raiz else ruta
+
+    def _abrir_almacen(self, tipo):
+        if tipo == AlmacenImagen.tipo:
+            return AlmacenImagen(self._ruta(RUTA_IMAGEN), tamaño_bloque=self.tamaño_bloque)
+        return AlmacenJSON(self._ruta(DIR_DATOS))
+
+    def _guardar_volumen(self, volumen):
+        with open(self._ruta(RUTA_VOLUMEN), 'w') as f:
+            json.dump(volumen, f, indent=4)
+
+    def _cargar_usuarios(self):
+        if not os.path.exists(self._ruta(RUTA_USUARIOS)):
+            return {PROPIETARIO_DEFECTO: self._hash_contrasena(CONTRASENA_DEFECTO)}
+        try:
+            with open(self._ruta(RUTA_USUARIOS), 'r') as f:
+                usuarios = json.load(f)
+                if PROPIETARIO_DEFECTO not in usuarios:
+                    usuarios[PROPIETARIO_DEFECTO] = self._hash_contrasena(CONTRASENA_DEFECTO)
+                return usuarios
+        except Exception:
+            return {PROPIETARIO_DEFECTO: self._hash_contrasena(CONTRASENA_DEFECTO)}
+
+    def _guardar_usuarios(self):
+        with open(self._ruta(RUTA_USUARIOS), 'w') as f:
+            json.dump(self.usuarios_registrados, f, indent=4)
+
+    def _hash_contrasena(self, contrasena):
+        return contrasena[::-1] + '_hash'
+
+    def verificar_credenciales(self, nombre_usuario, contrasena):
+        nombre_usuario = nombre_usuario.lower()
+        if nombre_usuario in self.usuarios_registrados:
+            contrasena_hash = self._hash_contrasena(contrasena)
+            return self.usuarios_registrados[nombre_usuario] == contrasena_hash
+        return False
+
+    def registrar_usuario(self, nombre_usuario, contrasena):
+        nombre_usuario = nombre_usuario.lower()
+        with self._cerrojo_usuarios:
+            if nombre_usuario not in self.usuarios_registrados:
+                self.usuarios_registrados[nombre_usuario] = self._hash_contrasena(contrasena)
+                self._guardar_usuarios()
+                return True
+        return False
+
+    #Dentro de una operacion las escrituras van a la transaccion y se aplican al confirmarla
+    def _guardar_entrada_fat(self, nombre_archivo, entrada):
+        self._local.transaccion.fat[nombre_archivo] = entrada
+
+    def _eliminar_entrada_fat(self, nombre_archivo):
+        self._local.transaccion.fat[nombre_archivo] = None
+
+    def _cargar_entrada_fat(self, nombre_archivo):
+        #Dentro de una transaccion se trabaja sobre una copia para que otros hilos no vean cambios sin confirmar
+        if self.metricas.activas:
+            self.metricas.contar(entradas_cargadas=1)
+        transaccion = self._local.transaccion
+        if transaccion is None:
+            return self.catalogo.obtener(nombre_archivo)
+        if nombre_archivo in transaccion.fat:
+            return transaccion.fat[nombre_archivo]
+        if nombre_archivo not in transaccion.leidas:
+            transaccion.leidas[nombre_archivo] = copy.deepcopy(self.catalogo.obtener(nombre_archivo))
+        return transaccion.leidas[nombre_archivo]
+
+    def _entradas(self):
+        with self._cerrojo_almacen:
+            return list(self.catalogo.entradas.values())
+
+    #Las referencias de bloque son rutas en el almacen JSON y numeros de ranura en la imagen
+    #La cache solo guarda bloques del almacen activo del volumen; otro almacen se escribe directamente
+    def _guardar_bloque_datos(self, ref_bloque, datos_bloque, almacen=None):
+        if self.metricas.activas:
+            self.metricas.contar(bloques_escritos=1, caracteres_escritos=len(datos_bloque["datos"]))
+        if almacen is not None and almacen is not self.almacen:
+            almacen.escribir(ref_bloque, datos_bloque)
+        else:
+            self._local.transaccion.bloques[ref_bloque] = datos_bloque
+        return ref_bloque
+
+    def _leer_bloque(self, ref_bloque, almacen=None):
+        if almacen is not None and almacen is not self.almacen:
+            return almacen.leer(ref_bloque)
+        transaccion = self._local.transaccion
+        if transaccion is not None and ref_bloque in transaccion.bloques:
+            return transaccion.bloques[ref_bloque]
+        bloque = self.cache.obtener(ref_bloque)
+        leido = bloque is None
+        if leido:
+            bloque = self.almacen.leer(ref_bloque)
+            if bloque is not None:
+                self.cache.guardar(ref_bloque, bloque)
+        if self.metricas.activas and bloque is not None:
+            self.metricas.contar(bloques_leidos=1, caracteres_leidos=len(bloque["datos"]), lecturas_almacen=int(leido))
+        return bloque
+
+    def _eliminar_bloque_datos(self, ref_bloque):
+        #Un bloque compartido solo pierde una referencia; se libera cuando la cuenta llega a cero
+        #y ninguna instantanea lo usa
+        transaccion = self._local.transaccion
+        id_bloque = self.almacen.identificador(ref_bloque)
+        referencia = self._referencia(id_bloque)
+        if referencia is not None and referencia["cuenta"] > 1:
+            cuenta = referencia["cuenta"] - 1
+            #Un bloque clonado que vuelve a tener un solo dueño deja de estar compartido
+            transaccion.referencias[id_bloque] = None if cuenta == 1 and referencia["huella"] is None else dict(referencia, cuenta=cuenta)
+            return
+        if referencia is not None:
+            transaccion.referencias[id_bloque] = None
+        if self._en_instantanea(ref_bloque, id_bloque):
+            return
+        transaccion.bloques[ref_bloque] = None
+        if id_bloque is not None:
+            transaccion.liberados.append(id_bloque)
+
+    def _referencia(self, id_bloque):
+        if id_bloque is None:
+            return None
+        transaccion = self._local.transaccion
+        if transaccion is not None and id_bloque in transaccion.referencias:
+            return transaccion.referencias[id_bloque]
+        return self.referencias.obtener(id_bloque)
+
+    def _en_instantanea(self, ref_bloque, id_bloque=None):
+        if id_bloque is None:
+            id_bloque = self.almacen.identificador(ref_bloque)
+        if id_bloque is None:
+            return ref_bloque in self._rutas_fijadas
+        i = bisect.bisect_right(self._inicios_fijados, id_bloque) - 1
+        return i >= 0 and id_bloque < self._fines_fijados[i]
+
+    def _compartido(self, ref_bloque):
+        #Un bloque de un clon, deduplicado o de una instantanea no se escribe en su sitio: se copia al modificarlo
+        id_bloque = self.almacen.identificador(ref_bloque)
+        return self._referencia(id_bloque) is not None or self._en_instantanea(ref_bloque, id_bloque)
+
+    def _huella(self, datos_bloque):
+        return hashlib.blake2b(datos_bloque.encode('utf-8'), digest_size=16).hexdigest()
+
+    def _buscar_huella(self, huella):
+        transaccion = self._local.transaccion
+        id_bloque = transaccion.huellas.get(huella, self._por_huella.get(huella))
+        if id_bloque is None or self._referencia(id_bloque) is None:
+            return None
+        return id_bloque
+
+    def _reservar_bloques(self, cantidad, almacen=None, contiguos=False):
+        almacen = almacen or self.almacen
+        with self._cerrojo_almacen:
+            ids = self.asignador.reservar(cantidad, contiguos)
+            referencias_bloque = [almacen.referencia(id_bloque) for id_bloque in ids]
+        if almacen is self.almacen:
+            self._local.transaccion.reservados.extend(ids)
+        return referencias_bloque
+
+    def estadisticas_cache(self):
+        return self.cache.estadisticas()
+
+    def _dividir(self, contenido):
+        return [contenido[i:i + self.tamaño_bloque] for i in range(0, len(contenido), self.tamaño_bloque)]
+
+    def _generar_bloques(self, contenido, almacen=None):
+        almacen = almacen or self.almacen
+        if self.volumen["deduplicacion"] and almacen is self.almacen:
+            return self._generar_bloques_deduplicados(contenido)
+        bloques = self._dividir(contenido)
+        referencias_bloque = self._reservar_bloques(len(bloques), almacen)
+        for i, datos_bloque in enumerate(bloques):
+            entrada_bloque = {
+                "datos": datos_bloque,
+                "siguiente_archivo": referencias_bloque[i + 1] if i < len(bloques) - 1 else None,
+                "eof": (i == len(bloques) - 1)
+            }
+            self._guardar_bloque_datos(referencias_bloque[i], entrada_bloque, almacen)
+        return referencias_bloque
+
+    def _generar_bloques_deduplicados(self, contenido):
+        #Los bloques se direccionan por la huella de su contenido y los repetidos solo suman una referencia;
+        #no llevan enlace propio porque pueden pertenecer a varias cadenas, el archivo se lee por su indice
+        transaccion = self._local.transaccion
+        bloques = self._dividir(contenido)
+        huellas = [self._huella(datos_bloque) for datos_bloque in bloques]
+        nuevas = dict.fromkeys(h for h in huellas if self._buscar_huella(h) is None)
+        rutas_nuevas = iter(self._reservar_bloques(len(nuevas)))
+        referencias_bloque = []
+        for datos_bloque, huella in zip(bloques, huellas):
+            id_bloque = self._buscar_huella(huella)
+            if id_bloque is None:
+                ruta = next(rutas_nuevas)
+                id_bloque = self.almacen.identificador(ruta)
+                self._guardar_bloque_datos(ruta, {"datos": datos_bloque, "siguiente_archivo": None, "eof": True})
+                transaccion.referencias[id_bloque] = {"huella": huella, "cuenta": 1}
+                transaccion.huellas[huella] = id_bloque
+            else:
+                referencia = self._referencia(id_bloque)
+                transaccion.referencias[id_bloque] = dict(referencia, cuenta=referencia["cuenta"] + 1)
+            referencias_bloque.append(self.almacen.referencia(id_bloque))
+        return referencias_bloque
+
+    def _iterar_bloques(self, ruta_primer_bloque, almacen=None):
+        ruta_actual = ruta_primer_bloque
+        eslabones = 0
+        while ruta_actual is not None:
+            bloque = self._leer_bloque(ruta_actual, almacen)
+            if bloque is None:
+                break
+            eslabones += 1
+            yield ruta_actual, bloque
+            if bloque["eof"]:
+                ruta_actual = None
+            else:
+                ruta_actual = bloque["siguiente_archivo"]
+        if self.metricas.activas:
+            self.metricas.contar(cadenas_recorridas=1, eslabones_recorridos=eslabones)
+
+    def _leer_contenido_completo(self, ruta_primer_bloque, almacen=None):
+        partes = []
+        rutas_bloques = []
+        for ruta, bloque in self._iterar_bloques(ruta_primer_bloque, almacen):
+            partes.append(bloque["datos"])
+            rutas_bloques.append(ruta)
+        return "".join(partes), rutas_bloques
+
+    #El indice de un archivo son extensiones [id_inicial, longitud] cuando sus bloques tienen id del asignador;
+    #los bloques heredados sin id se listan uno a uno en indice_bloques
+    def _fijar_indice(self, entrada, rutas_bloques, almacen=None):
+        almacen = almacen or self.almacen
+        entrada["ruta_datos_inicial"] = rutas_bloques[0]
+        ids = [almacen.identificador(ruta) for ruta in rutas_bloques]
+        if None in ids:
+            entrada["indice_bloques"] = list(rutas_bloques)
+            entrada.pop("extensiones", None)
+            return
+        entrada["extensiones"] = []
+        self._extender_extensiones(entrada["extensiones"], ids)
+        entrada.pop("indice_bloques", None)
+
+    def _extender_extensiones(self, extensiones, ids):
+        for id_bloque in ids:
+            if extensiones and extensiones[-1][0] + extensiones[-1][1] == id_bloque:
+                extensiones[-1][1] += 1
+            else:
+                extensiones.append([id_bloque, 1])
+
+    def _extender_indice(self, entrada, rutas_nuevas):
+        ids = [self.almacen.identificador(ruta) for ruta in rutas_nuevas]
+        if "extensiones" in entrada and None not in ids:
+            self._extender_extensiones(entrada["extensiones"], ids)
+        else:
+            self._fijar_indice(entrada, self._indice_bloques(entrada) + rutas_nuevas)
+
+    def _indice_bloques(self, entrada):
+        if "extensiones" in entrada:
+            return [self.almacen.referencia(id_bloque) for inicio, longitud in entrada["extensiones"]
+                    for id_bloque in range(inicio, inicio + longitud)]
+        if "indice_bloques" not in entrada:
+            self._indexar_cadena(entrada)
+            return self._indice_bloques(entrada)
+        return entrada["indice_bloques"]
+
+    @_transaccional
+    def _indexar_cadena(self, entrada):
+        #Las entradas anteriores al indice se indexan recorriendo la cadena una sola vez
+        self._fijar_indice(entrada, [ruta for ruta, _ in self._iterar_bloques(entrada["ruta_datos_inicial"])])
+        self._guardar_entrada_fat(entrada["nombre"], entrada)
+
+    def _reemplazar_cola(self, entrada, rutas_nuevas, cantidad=1):
+        #Sustituye los ultimos `cantidad` bloques del indice por rutas_nuevas
+        if "extensiones" in entrada:
+            while cantidad:
+                ultima = entrada["extensiones"][-1]
+                quitados = min(cantidad, ultima[1])
+                ultima[1] -= quitados
+                if not ultima[1]:
+                    entrada["extensiones"].pop()
+                cantidad -= quitados
+            if entrada["extensiones"]:
+                self._extender_indice(entrada, rutas_nuevas)
+            else:
+                self._fijar_indice(entrada, rutas_nuevas)
+        else:
+            indice = self._indice_bloques(entrada)
+            self._fijar_indice(entrada, indice[:len(indice) - cantidad] + rutas_nuevas)
+
+    def _cantidad_bloques(self, entrada):
+        if "extensiones" in entrada:
+            return sum(longitud for _, longitud in entrada["extensiones"])
+        return len(self._indice_bloques(entrada))
+
+    def _ultimos_bloques(self, entrada, cantidad):
+        total = self._cantidad_bloques(entrada)
+        return [ruta for _, rutas in self._tramos(entrada, total - cantidad, total) for ruta in rutas]
+
+    def _ultimo_bloque(self, entrada):
+        if "extensiones" in entrada:
+            inicio, longitud = entrada["extensiones"][-1]
+            return self.almacen.referencia(inicio + longitud - 1)
+        return self._indice_bloques(entrada)[-1]
+
+    def _tramos(self, entrada, primero, fin):
+        #Produce (id_inicial, referencias) para cada tramo contiguo de los bloques logicos [primero, fin)
+        if "extensiones" not in entrada:
+            indice = self._indice_bloques(entrada)
+            for i in range(primero, min(fin, len(indice))):
+                yield None, [indice[i]]
+            return
+        posicion = 0
+        for inicio, longitud in entrada["extensiones"]:
+            desde, hasta = max(primero, posicion), min(fin, posicion + longitud)
+            for lote in range(desde, hasta, LOTE_LECTURA):
+                id_inicial = inicio + lote - posicion
+                cantidad = min(LOTE_LECTURA, hasta - lote)
+                yield id_inicial, [self.almacen.referencia(i) for i in range(id_inicial, id_inicial + cantidad)]
+            posicion += longitud
+            if posicion >= fin:
+                break
+
+    def _leer_tramo(self, id_inicial, rutas_bloques):
+        bloques = [self.cache.obtener(ruta) for ruta in rutas_bloques]
+        if None in bloques:
+            if id_inicial is not None and len(rutas_bloques) > 1:
+                bloques = self.almacen.leer_tramo(id_inicial, len(rutas_bloques))
+                lecturas = 1
+            else:
+                bloques = [self.almacen.leer(ruta) for ruta in rutas_bloques]
+                lecturas = len(rutas_bloques)
+            for ruta, bloque in zip(rutas_bloques, bloques):
+                if bloque is not None:
+                    self.cache.guardar(ruta, bloque)
+        else:
+            lecturas = 0
+        if self.metricas.activas:
+            self.metricas.contar(bloques_leidos=len(bloques), lecturas_almacen=lecturas,
+                                 caracteres_leidos=sum(len(bloque["datos"]) for bloque in bloques if bloque is not None))
+        return bloques
+
+    def _datos_en(self, entrada, primero, fin):
+        for id_inicial, rutas_bloques in self._tramos(entrada, primero, fin):
+            for bloque in self._leer_tramo(id_inicial, rutas_bloques):
+                yield bloque["datos"]
+
+    def _actualizar_bloques(self, indice_bloques, nuevo_contenido):
+        #Reescribe solo los bloques cuyo contenido o enlace cambia; la cola sobrante se libera
+        if self.volumen["deduplicacion"]:
+            #Los bloques deduplicados son inmutables: los iguales se reutilizan por huella y el resto se sustituye
+            referencias_bloque = self._generar_bloques(nuevo_contenido)
+            for ruta in indice_bloques: self._eliminar_bloque_datos(ruta)
+            return referencias_bloque
+        compartidos = [self._compartido(ruta) for ruta in indice_bloques]
+        if any(compartidos):
+            return self._copiar_al_escribir(indice_bloques, compartidos, nuevo_contenido)
+        viejos = [(ruta, self._leer_bloque(ruta)) for ruta in indice_bloques]
+        nuevos = self._dividir(nuevo_contenido)
+        referencias_bloque = [ruta for ruta, _ in viejos[:len(nuevos)]]
+        if len(nuevos) > len(viejos):
+            referencias_bloque += self._reservar_bloques(len(nuevos) - len(viejos))
+        for i, datos_bloque in enumerate(nuevos):
+            entrada_bloque = {
+                "datos": datos_bloque,
+                "siguiente_archivo": referencias_bloque[i + 1] if i < len(nuevos) - 1 else None,
+                "eof": (i == len(nuevos) - 1)
+            }
+            if i >= len(viejos) or viejos[i][1] != entrada_bloque:
+                self._guardar_bloque_datos(referencias_bloque[i], entrada_bloque)
+        for ruta, _ in viejos[len(nuevos):]:
+            self._eliminar_bloque_datos(ruta)
+        return referencias_bloque
+
+    def _copiar_al_escribir(self, indice_bloques, compartidos, nuevo_contenido):
+        #Los bloques que no cambian se siguen compartiendo y solo los modificados se copian a bloques nuevos.
+        #Como en la deduplicacion, un bloque que puede estar en varias cadenas no lleva enlace
+        nuevos = self._dividir(nuevo_contenido)
+        referencias_bloque = []
+        copias = []
+        for i, datos_bloque in enumerate(nuevos):
+            if i < len(indice_bloques):
+                ruta = indice_bloques[i]
+                if self._leer_bloque(ruta)["datos"] == datos_bloque:
+                    referencias_bloque.append(ruta)
+                    continue
+                if not compartidos[i]:
+                    self._guardar_bloque_datos(ruta, {"datos": datos_bloque, "siguiente_archivo": None, "eof": True})
+                    referencias_bloque.append(ruta)
+                    continue
+                self._eliminar_bloque_datos(ruta)
+            copias.append(i)
+            referencias_bloque.append(None)
+        for i, ruta in zip(copias, self._reservar_bloques(len(copias))):
+            self._guardar_bloque_datos(ruta, {"datos": nuevos[i], "siguiente_archivo": None, "eof": True})
+            referencias_bloque[i] = ruta
+        for ruta in indice_bloques[len(nuevos):]:
+            self._eliminar_bloque_datos(ruta)
+        return referencias_bloque
+
+    #Compresion: con un codec en el volumen los archivos nuevos se guardan en marcos de CARACTERES_POR_MARCO
+    #caracteres comprimidos por separado; cada byte comprimido ocupa un caracter latin-1 en los bloques.
+    #entrada["marcos"] lista [caracteres, bloques, codec] de cada marco, codec None si se guardó sin comprimir
+    def _medida_codec(self, codec):
+        return self._medidas_codec.setdefault(codec, {
+            "marcos_comprimidos": 0,
+            "marcos_sin_comprimir": 0,
+            "marcos_descomprimidos": 0,
+            "bytes_originales": 0,
+            "bytes_almacenados": 0,
+            "segundos_compresion": 0.0,
+            "segundos_descompresion": 0.0,
+        })
+
+    def _comprimir_marco(self, texto):
+        codec = self.volumen["compresion"]
+        if codec is None:
+            return texto, None
+        datos = texto.encode('utf-8')
+        inicio = time.perf_counter()
+        comprimido = CODECS[codec][0](datos)
+        segundos = time.perf_counter() - inicio
+        #Solo compensa guardar el marco comprimido si ocupa menos bloques que el texto plano
+        util = -(-len(comprimido) // self.tamaño_bloque) < -(-len(texto) // self.tamaño_bloque)
+        with self._cerrojo_medidas:
+            medida = self._medida_codec(codec)
+            medida["segundos_compresion"] += segundos
+            medida["bytes_originales"] += len(datos)
+            medida["marcos_comprimidos" if util else "marcos_sin_comprimir"] += 1
+            medida["bytes_almacenados"] += len(comprimido) if util else len(datos)
+        if not util:
+            return texto, None
+        return comprimido.decode('latin-1'), codec
+
+    def _descomprimir_marco(self, almacenado, codec):
+        if codec is None:
+            return almacenado
+        inicio = time.perf_counter()
+        texto = CODECS[codec][1](almacenado.encode('latin-1')).decode('utf-8')
+        segundos = time.perf_counter() - inicio
+        with self._cerrojo_medidas:
+            medida = self._medida_codec(codec)
+            medida["segundos_descompresion"] += segundos
+            medida["marcos_descomprimidos"] += 1
+        return texto
+
+    def _generar_marco(self, texto):
+        almacenado, codec = self._comprimir_marco(texto)
+        rutas_bloques = self._generar_bloques(almacenado)
+        return [len(texto), len(rutas_bloques), codec], rutas_bloques
+
+    def _generar_marcos(self, contenido):
+        marcos, rutas_bloques = [], []
+        for i in range(0, len(contenido), CARACTERES_POR_MARCO):
+            marco, rutas_marco = self._generar_marco(contenido[i:i + CARACTERES_POR_MARCO])
+            marcos.append(marco)
+            rutas_bloques += rutas_marco
+        return marcos, rutas_bloques
+
+    def _leer_marco(self, entrada, primer_bloque, marco):
+        _, bloques, codec = marco
+        return self._descomprimir_marco("".join(self._datos_en(entrada, primer_bloque, primer_bloque + bloques)), codec)
+
+    def _marcos(self, entrada, desde=0, hasta=None):
+        #Produce (primer_caracter, texto) de los marcos que tocan [desde, hasta) descomprimiendo solo esos
+        caracter = bloque = 0
+        for marco in entrada["marcos"]:
+            if hasta is not None and caracter >= hasta:
+                break
+            if caracter + marco[0] > desde:
+                yield caracter, self._leer_marco(entrada, bloque, marco)
+            caracter += marco[0]
+            bloque += marco[1]
+
+    def _actualizar_marcos(self, entrada, nuevo_contenido):
+        #Los marcos cuyo texto no cambia conservan sus bloques; el resto se recomprime y sus bloques se liberan
+        indice = self._indice_bloques(entrada)
+        viejos = []
+        bloque = 0
+        for marco in entrada["marcos"]:
+            viejos.append((bloque, marco))
+            bloque += marco[1]
+        marcos, rutas_bloques, conservados = [], [], set()
+        for n, i in enumerate(range(0, len(nuevo_contenido), CARACTERES_POR_MARCO)):
+            texto = nuevo_contenido[i:i + CARACTERES_POR_MARCO]
+            if n < len(viejos) and viejos[n][1][0] == len(texto) and self._leer_marco(entrada, *viejos[n]) == texto:
+                primer_bloque, marco = viejos[n]
+                rutas_marco = indice[primer_bloque:primer_bloque + marco[1]]
+                conservados.add(n)
+            else:
+                marco, rutas_marco = self._generar_marco(texto)
+            marcos.append(marco)
+            rutas_bloques += rutas_marco
+        for n, (primer_bloque, marco) in enumerate(viejos):
+            if n not in conservados:
+                for ruta in indice[primer_bloque:primer_bloque + marco[1]]: self._eliminar_bloque_datos(ruta)
+        entrada["marcos"] = marcos
+        self._fijar_indice(entrada, rutas_bloques)
+
+    def _piezas(self, entrada, desde):
+        if "marcos" in entrada:
+            for caracter, texto in self._marcos(entrada, desde):
+                yield texto[max(0, desde - caracter):]
+            return
+        primer_bloque = desde // self.tamaño_bloque
+        recorte = desde - primer_bloque * self.tamaño_bloque
+        for datos in self._datos_en(entrada, primer_bloque, entrada["cant_caracteres"] // self.tamaño_bloque + 1):
+            if recorte:
+                datos, recorte = datos[recorte:], 0
+            yield datos
+
+    def _fragmentos(self, entrada, tam_fragmento, desde=0):
+        partes = []
+        acumulado = 0
+        for datos in self._piezas(entrada, desde):
+            partes.append(datos)
+            acumulado += len(datos)
+            if acumulado >= tam_fragmento:
+                yield "".join(partes)
+                partes = []
+                acumulado = 0
+        if partes:
+            yield "".join(partes)
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def crear_archivo(self, nombre_archivo, contenido):
+        if self._cargar_entrada_fat(nombre_archivo):
+            return False, "El archivo ya existe."
+        if not self.usuario_actual:
+            return False, "Usuario no logueado."
+        return self._crear_entrada(nombre_archivo, contenido, self.usuario_actual)
+
+    def _crear_entrada(self, nombre_archivo, contenido, propietario_archivo, permisos=None, fecha_creacion=None, fecha_modificacion=None):
+        #Crea el archivo dentro de la transaccion en curso; la importacion conserva propietario, permisos y fechas
+        if self.volumen["compresion"]:
+            marcos, rutas_bloques = self._generar_marcos(contenido)
+        else:
+            rutas_bloques = self._generar_bloques(contenido)
+        if not rutas_bloques:
+            return False, "El contenido del archivo es inválido."
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        entrada_fat = {
+            "nombre": nombre_archivo,
+            "ruta_datos_inicial": rutas_bloques[0],
+            "estado_papelera": False,
+            "cant_caracteres": len(contenido),
+            "fecha_creacion": fecha_creacion or ahora,
+            "fecha_modificacion": fecha_modificacion or ahora,
+            "fecha_eliminacion": None,
+            "propietario": propietario_archivo,
+            "permisos": permisos or {"lectura": [propietario_archivo], "escritura": [propietario_archivo]}
+        }
+        if self.volumen["compresion"]:
+            entrada_fat["marcos"] = marcos
+        self._fijar_indice(entrada_fat, rutas_bloques)
+        self._registrar_texto(nombre_archivo, entrada_fat, contenido)
+        self._guardar_entrada_fat(nombre_archivo, entrada_fat)
+        return True, "Archivo creado exitosamente."
+
+    @_medido
+    def listar_archivos(self, incluir_eliminados=False):
+        return [entrada for entrada in self._entradas()
+                if incluir_eliminados or not entrada.get("estado_papelera", False)]
+
+    def _texto_fecha(self, valor):
+        #Acepta texto en el formato de la FAT, datetime, o timedelta contado hacia atras desde ahora
+        if valor is None or isinstance(valor, str):
+            return valor
+        if isinstance(valor, timedelta):
+            valor = datetime.now() - valor
+        return valor.strftime("%Y-%m-%d %H:%M:%S")
+
+    @_medido
+    def consultar(self, propietario=None, en_papelera=None, legible_por=None, escribible_por=None,
+                  modificado_desde=None, modificado_hasta=None, eliminado_desde=None, eliminado_hasta=None,
+                  orden="nombre", descendente=False, desplazamiento=0, limite=None):
+        #Devuelve (total, entradas de la pagina) usando los indices del catalogo; las fechas "hasta" son exclusivas
+        #Ejemplo: consultar(en_papelera=True, eliminado_hasta=timedelta(days=30)) da la papelera con mas de 30 dias
+        if orden not in ORDENES_CONSULTA:
+            raise ValueError(f"Orden '{orden}' no válido.")
+        rangos = {
+            "fecha_modificacion": (modificado_desde, modificado_hasta),
+            "fecha_eliminacion": (eliminado_desde, eliminado_hasta),
+        }
+        with self._cerrojo_almacen:
+            indices = self.catalogo.indices
+            entradas = self.catalogo.entradas
+            candidatos = indices.filtrar(propietario, en_papelera, legible_por, escribible_por)
+            tramos = {}
+            for campo, (desde, hasta) in rangos.items():
+                if desde is None and hasta is None:
+                    continue
+                tramos[campo] = indices.rango(campo, self._texto_fecha(desde), self._texto_fecha(hasta))
+                en_rango = {nombre for _, nombre in tramos[campo]}
+                candidatos = en_rango if candidatos is None else candidatos & en_rango
+            if orden in IndicesCatalogo.FECHAS:
+                #El indice ya esta ordenado por fecha; las entradas sin esa fecha quedan al final
+                tramo = tramos.get(orden) or indices.rango(orden)
+                nombres = [nombre for _, nombre in tramo if candidatos is None or nombre in candidatos]
+                if orden not in tramos:
+                    universo = entradas if candidatos is None else candidatos
+                    nombres += sorted(nombre for nombre in universo if indices.claves[nombre][orden] is None)
+            elif orden == "nombre":
+                nombres = sorted(entradas if candidatos is None else candidatos)
+            else:
+                nombres = sorted(entradas if candidatos is None else candidatos,
+                                 key=lambda nombre: (entradas[nombre].get(orden), nombre))
+            if descendente:
+                nombres.reverse()
+            fin = None if limite is None else desplazamiento + limite
+            return len(nombres), [entradas[nombre] for nombre in nombres[desplazamiento:fin]]
+
+    def _metadata_entrada(self, entrada):
+        return {
+            "Nombre": entrada["nombre"],
+            "Propietario": entrada["propietario"],
+            "Tamaño (chars)": entrada["cant_caracteres"],
+            "Creación": entrada["fecha_creacion"],
+            "Modificación": entrada["fecha_modificacion"],
+            "Permisos (Lectura)": ", ".join(entrada["permisos"]["lectura"]),
+            "Permisos (Escritura)": ", ".join(entrada["permisos"]["escritura"]),
+        }
+
+    @_medido
+    @_cerrojo_archivo("lectura")
+    def abrir_lectura(self, nombre_archivo, tam_fragmento=TAMAÑO_FRAGMENTO_LECTURA, desde=0):
+        #Devuelve los metadatos y un generador que recorre la cadena bajo demanda
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or entrada.get("estado_papelera"):
+            return None, "Archivo no encontrado o en papelera."
+        if not self.verificar_permisos(nombre_archivo, "lectura", entrada):
+            return None, "Permiso de lectura denegado."
+        return self._metadata_entrada(entrada), self._leer_fragmentos(nombre_archivo, tam_fragmento, desde)
+
+    def _leer_fragmentos(self, nombre_archivo, tam_fragmento, desde):
+        #El cerrojo del archivo se toma para cada fragmento y no mientras el generador esta suspendido;
+        #si el archivo cambia entre dos fragmentos la lectura sigue en la misma posicion de la version nueva
+        posicion = desde
+        while True:
+            with self._cerrojo_volumen.lectura(), self._cerrojo_de(nombre_archivo).lectura():
+                entrada = self._cargar_entrada_fat(nombre_archivo)
+                if not entrada or entrada.get("estado_papelera"):
+                    return
+                fragmento = next(self._fragmentos(entrada, tam_fragmento, posicion), "")
+            if not fragmento:
+                return
+            posicion += len(fragmento)
+            yield fragmento
+
+    @_medido
+    @_cerrojo_archivo("lectura")
+    def leer_rango(self, nombre_archivo, offset, longitud):
+        #Un offset negativo se cuenta desde el final, como en los slices de Python
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or entrada.get("estado_papelera"):
+            return None, "Archivo no encontrado o en papelera."
+        if not self.verificar_permisos(nombre_archivo, "lectura", entrada):
+            return None, "Permiso de lectura denegado."
+        total = entrada["cant_caracteres"]
+        inicio = max(0, total + offset if offset < 0 else offset)
+        fin = min(total, inicio + max(0, longitud))
+        if inicio >= fin:
+            return self._metadata_entrada(entrada), ""
+        if "marcos" in entrada:
+            return self._metadata_entrada(entrada), "".join(
+                texto[max(0, inicio - caracter):fin - caracter] for caracter, texto in self._marcos(entrada, inicio, fin))
+        primer_bloque = inicio // self.tamaño_bloque
+        ultimo_bloque = (fin - 1) // self.tamaño_bloque
+        datos = "".join(self._datos_en(entrada, primer_bloque, ultimo_bloque + 1))
+        desplazamiento = primer_bloque * self.tamaño_bloque
+        return self._metadata_entrada(entrada), datos[inicio - desplazamiento:fin - desplazamiento]
+
+    @_medido
+    def obtener_contenido_archivo(self, nombre_archivo):
+        metadata, fragmentos = self.abrir_lectura(nombre_archivo)
+        if not metadata:
+            return None, fragmentos
+        return metadata, "".join(fragmentos)
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def modificar_archivo(self, nombre_archivo, nuevo_contenido):
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or entrada.get("estado_papelera"):
+            return False, "Archivo no encontrado o en papelera."
+        if not self.verificar_permisos(nombre_archivo, "escritura", entrada):
+            return False, "Permiso de escritura denegado."
+        if not nuevo_contenido:
+            return False, "Error: El nuevo contenido del archivo es inválido."
+
+        if "marcos" in entrada:
+            self._actualizar_marcos(entrada, nuevo_contenido)
+        else:
+            rutas_bloques_nuevas = self._actualizar_bloques(self._indice_bloques(entrada), nuevo_contenido)
+            self._fijar_indice(entrada, rutas_bloques_nuevas)
+        entrada["cant_caracteres"] = len(nuevo_contenido)
+        entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._registrar_texto(nombre_archivo, entrada, nuevo_contenido)
+        self._guardar_entrada_fat(nombre_archivo, entrada)
+        return True, "Archivo modificado exitosamente."
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def agregar_contenido(self, nombre_archivo, texto):
+        #Completa el ultimo bloque y enlaza bloques nuevos desde la cola sin tocar el resto de la cadena
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or entrada.get("estado_papelera"):
+            return False, "Archivo no encontrado o en papelera."
+        if not self.verificar_permisos(nombre_archivo, "escritura", entrada):
+            return False, "Permiso de escritura denegado."
+        if not texto:
+            return False, "Error: El contenido a agregar es inválido."
+
+        if "marcos" in entrada:
+            #Solo se recomprime el ultimo marco si aun no esta lleno; los anteriores no se tocan
+            caracteres, bloques, codec = entrada["marcos"][-1]
+            if caracteres < CARACTERES_POR_MARCO:
+                rutas_cola = self._ultimos_bloques(entrada, bloques)
+                texto_cola = self._descomprimir_marco("".join(self._leer_bloque(ruta)["datos"] for ruta in rutas_cola), codec)
+                marcos, rutas_bloques_nuevas = self._generar_marcos(texto_cola + texto)
+                for ruta in rutas_cola: self._eliminar_bloque_datos(ruta)
+                entrada["marcos"][-1:] = marcos
+                self._reemplazar_cola(entrada, rutas_bloques_nuevas, bloques)
+            else:
+                marcos, rutas_bloques_nuevas = self._generar_marcos(texto)
+                entrada["marcos"] += marcos
+                self._extender_indice(entrada, rutas_bloques_nuevas)
+            entrada["cant_caracteres"] += len(texto)
+            entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._registrar_texto(nombre_archivo, entrada, texto, anexado=True)
+            self._guardar_entrada_fat(nombre_archivo, entrada)
+            return True, "Contenido agregado exitosamente."
+
+        ruta_cola = self._ultimo_bloque(entrada)
+        cola = self._leer_bloque(ruta_cola)
+        if self.volumen["deduplicacion"] or self._compartido(ruta_cola):
+            #Una cola deduplicada o compartida no se modifica en su sitio: se sustituye junto con el texto nuevo
+            rutas_bloques_nuevas = self._generar_bloques(cola["datos"] + texto)
+            self._eliminar_bloque_datos(ruta_cola)
+            self._reemplazar_cola(entrada, rutas_bloques_nuevas)
+        else:
+            hueco = self.tamaño_bloque - len(cola["datos"])
+            rutas_bloques_nuevas = self._generar_bloques(texto[hueco:])
+            self._guardar_bloque_datos(ruta_cola, {
+                "datos": cola["datos"] + texto[:hueco],
+                "siguiente_archivo": rutas_bloques_nuevas[0] if rutas_bloques_nuevas else None,
+                "eof": not rutas_bloques_nuevas
+            })
+            self._extender_indice(entrada, rutas_bloques_nuevas)
+        entrada["cant_caracteres"] += len(texto)
+        entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._registrar_texto(nombre_archivo, entrada, texto, anexado=True)
+        self._guardar_entrada_fat(nombre_archivo, entrada)
+        return True, "Contenido agregado exitosamente."
+
+    @_medido
+    def clonar_archivo(self, nombre_origen, nombre_destino):
+        #Copia un archivo solo en metadatos: el clon comparte los bloques del origen y cada lado copia los que modifica.
+        #Los cerrojos de los dos archivos se toman en orden de nombre para que dos clonaciones cruzadas no se bloqueen
+        if nombre_origen == nombre_destino:
+            return False, "El origen y el destino son el mismo archivo."
+        with self._cerrojo_volumen.lectura(), contextlib.ExitStack() as cerrojos:
+            for nombre, modo in sorted([(nombre_origen, "lectura"), (nombre_destino, "escritura")]):
+                cerrojos.enter_context(getattr(self._cerrojo_de(nombre), modo)())
+            #Las cuentas de referencia se actualizan en serie, como con deduplicacion
+            with self._cerrojo_deduplicacion:
+                return self._clonar(nombre_origen, nombre_destino)
+
+    @_transaccional
+    def _clonar(self, nombre_origen, nombre_destino):
+        entrada = self._cargar_entrada_fat(nombre_origen)
+        if not entrada or entrada.get("estado_papelera"):
+            return False, "Archivo no encontrado o en papelera."
+        if not self.verificar_permisos(nombre_origen, "lectura", entrada):
+            return False, "Permiso de lectura denegado."
+        if self._cargar_entrada_fat(nombre_destino):
+            return False, "El archivo ya existe."
+        if not self.usuario_actual:
+            return False, "Usuario no logueado."
+        ids = [self.almacen.identificador(ruta) for ruta in self._indice_bloques(entrada)]
+        if None in ids:
+            #Los bloques heredados sin id no llevan cuenta de referencias: el clon recibe una copia
+            return self._crear_entrada(nombre_destino, "".join(self._piezas(entrada, 0)), self.usuario_actual)
+        transaccion = self._local.transaccion
+        for id_bloque in ids:
+            referencia = self._referencia(id_bloque)
+            transaccion.referencias[id_bloque] = dict(referencia, cuenta=referencia["cuenta"] + 1) if referencia else {"huella": None, "cuenta": 2}
+        clon = copy.deepcopy(entrada)
+        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        clon.update(nombre=nombre_destino, fecha_creacion=ahora, fecha_modificacion=ahora, propietario=self.usuario_actual,
+                    permisos={"lectura": [self.usuario_actual], "escritura": [self.usuario_actual]})
+        self._registrar_texto(nombre_destino, clon, None)
+        self._guardar_entrada_fat(nombre_destino, clon)
+        return True, "Archivo clonado exitosamente."
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def eliminar_archivo(self, nombre_archivo):
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or entrada.get("estado_papelera"):
+            return False, "Error: Archivo no encontrado o ya en papelera."
+        if entrada["propietario"] != self.usuario_actual:
+            return False, "Error: Solo el propietario puede eliminar el archivo."
+
+        entrada["estado_papelera"] = True
+        entrada["fecha_eliminacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._guardar_entrada_fat(nombre_archivo, entrada)
+        return True, "Archivo movido a la papelera."
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def recuperar_archivo(self, nombre_archivo):
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or not entrada.get("estado_papelera"):
+            return False, "Archivo no encontrado o no está en papelera."
+        if entrada["propietario"] != self.usuario_actual:
+            return False, "Solo el propietario puede recuperar el archivo."
+        entrada["estado_papelera"] = False
+        entrada["fecha_eliminacion"] = None
+        entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._guardar_entrada_fat(nombre_archivo, entrada)
+        return True, "Archivo recuperado exitosamente."
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def purgar_archivo(self, nombre_archivo):
+        #Elimina definitivamente un archivo de la papelera y devuelve sus bloques al asignador
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or not entrada.get("estado_papelera"):
+            return False, "Archivo no encontrado o no está en papelera."
+        if entrada["propietario"] != self.usuario_actual and self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el propietario o el administrador pueden purgar el archivo."
+        self._purgar_entrada(nombre_archivo, entrada)
+        return True, "Archivo eliminado definitivamente."
+
+    def _purgar_entrada(self, nombre_archivo, entrada):
+        for ruta in self._indice_bloques(entrada): self._eliminar_bloque_datos(ruta)
+        self._eliminar_entrada_fat(nombre_archivo)
+        self._local.transaccion.textos[nombre_archivo] = (None, None, None, False)
+
+    def _bytes_liberados(self):
+        #Espacio en disco de los bloques que la transaccion en curso libera; se mide antes de confirmarla
+        return sum(self.almacen.tamaño_en_disco(ref) for ref, bloque in self._local.transaccion.bloques.items() if bloque is None)
+
+    def fijar_retencion(self, dias):
+        #Dias que un archivo pasa en la papelera antes de que la limpieza lo purgue; None la desactiva
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el administrador puede cambiar la retención."
+        if dias is not None and dias < 0:
+            return False, "La retención no puede ser negativa."
+        self.volumen["retencion_papelera_dias"] = dias
+        self._guardar_volumen(self.volumen)
+        return True, "Retención de la papelera actualizada."
+
+    @_medido
+    def limpiar_volumen(self, retencion_dias=None, desfragmentar=True, bloques_por_segundo=None, detener=None):
+        #Purga la papelera vencida, recupera bloques huerfanos y reescribe contiguas las cadenas fragmentadas.
+        #bloques_por_segundo limita el ritmo de E/S; `detener` (un threading.Event) corta la limpieza entre archivos.
+        #Purga archivos de cualquier usuario: como devuelve el informe, la negativa se señala con PermissionError
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            raise PermissionError("Solo el administrador puede limpiar el volumen.")
+        detener = detener or threading.Event()
+        retencion_dias = self.volumen["retencion_papelera_dias"] if retencion_dias is None else retencion_dias
+        informe = {"archivos_purgados": 0, "bloques_huerfanos": 0, "archivos_desfragmentados": 0,
+                   "bloques_movidos": 0, "bytes_recuperados": 0, "segundos": 0.0}
+        inicio = time.perf_counter()
+        procesados = 0
+
+        def pausar(bloques):
+            nonlocal procesados
+            procesados += bloques
+            if bloques_por_segundo:
+                espera = procesados / bloques_por_segundo - (time.perf_counter() - inicio)
+                if espera > 0:
+                    detener.wait(espera)
+            return detener.is_set()
+
+        if retencion_dias is not None:
+            limite = self._texto_fecha(timedelta(days=retencion_dias))
+            _, vencidos = self.consultar(en_papelera=True, eliminado_hasta=limite)
+            for entrada in vencidos:
+                bloques, liberados = self._purgar_vencido(entrada["nombre"], limite)
+                informe["archivos_purgados"] += bloques is not None
+                informe["bytes_recuperados"] += liberados
+                if pausar(bloques or 0):
+                    break
+        if not detener.is_set():
+            cantidad, liberados = self._recuperar_huerfanos()
+            informe["bloques_huerfanos"] = cantidad
+            informe["bytes_recuperados"] += liberados
+            pausar(cantidad)
+        if desfragmentar and not detener.is_set():
+            _, fragmentados = self.consultar()
+            for entrada in fragmentados:
+                if len(entrada.get("extensiones") or ()) < 2:
+                    continue
+                movidos = self._desfragmentar(entrada["nombre"])
+                informe["archivos_desfragmentados"] += movidos > 0
+                informe["bloques_movidos"] += movidos
+                if pausar(2 * movidos):
+                    break
+        informe["segundos"] = time.perf_counter() - inicio
+        self.ultima_limpieza = informe
+        return informe
+
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def _purgar_vencido(self, nombre_archivo, limite):
+        #Se vuelve a comprobar bajo el cerrojo: el archivo pudo recuperarse despues de la consulta
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or not entrada.get("estado_papelera") or not entrada.get("fecha_eliminacion") or entrada["fecha_eliminacion"] >= limite:
+            return None, 0
+        bloques = self._cantidad_bloques(entrada)
+        self._purgar_entrada(nombre_archivo, entrada)
+        return bloques, self._bytes_liberados()
+
+    def _recuperar_huerfanos(self):
+        #Bloques ocupados en el asignador o en el almacen que ninguna entrada ni instantanea usa, p. ej. reservas de
+        #una escritura interrumpida. Con el volumen bloqueado no hay reservas en curso que confundir con huerfanos
+        with self._cerrojo_volumen.escritura():
+            usados = set()
+            for entrada in self._entradas():
+                usados.update(self.almacen.identificador(ruta) for ruta in self._indice_bloques(entrada))
+            with self._cerrojo_almacen:
+                ocupados = set(self.asignador.ids_ocupados()) | set(self.almacen.ids_ocupados()) | set(self.referencias.entradas)
+            huerfanos = sorted(id_bloque for id_bloque in ocupados - usados if not self._en_instantanea(None, id_bloque))
+            if not huerfanos:
+                return 0, 0
+            return len(huerfanos), self._liberar_huerfanos(huerfanos)
+
+    @_transaccional
+    def _liberar_huerfanos(self, huerfanos):
+        transaccion = self._local.transaccion
+        for id_bloque in huerfanos:
+            if self._referencia(id_bloque) is not None:
+                transaccion.referencias[id_bloque] = None
+            transaccion.bloques[self.almacen.referencia(id_bloque)] = None
+            transaccion.liberados.append(id_bloque)
+        return self._bytes_liberados()
+
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def _desfragmentar(self, nombre_archivo):
+        #Copia los bloques del archivo a un tramo contiguo y libera los originales; devuelve los bloques movidos.
+        #Los archivos con bloques compartidos (deduplicados, clonados o en una instantanea) se quedan donde estan:
+        #moverlos duplicaria esos bloques
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada or len(entrada.get("extensiones") or ()) < 2:
+            return 0
+        rutas = self._indice_bloques(entrada)
+        referencias = [self._referencia(self.almacen.identificador(ruta)) for ruta in rutas]
+        if any(referencia is not None and referencia["cuenta"] > 1 for referencia in referencias):
+            return 0
+        if any(self._en_instantanea(ruta) for ruta in rutas):
+            return 0
+        nuevas = self._reservar_bloques(len(rutas), contiguos=True)
+        transaccion = self._local.transaccion
+        for i, (ruta, nueva, referencia) in enumerate(zip(rutas, nuevas, referencias)):
+            bloque = self._leer_bloque(ruta)
+            self._eliminar_bloque_datos(ruta)
+            if referencia is None:
+                self._guardar_bloque_datos(nueva, {
+                    "datos": bloque["datos"],
+                    "siguiente_archivo": nuevas[i + 1] if i < len(nuevas) - 1 else None,
+                    "eof": i == len(nuevas) - 1
+                })
+            else:
+                #Un bloque deduplicado no lleva enlace; se mueve con su huella
+                self._guardar_bloque_datos(nueva, bloque)
+                id_nuevo = self.almacen.identificador(nueva)
+                transaccion.referencias[id_nuevo] = dict(referencia)
+                transaccion.huellas[referencia["huella"]] = id_nuevo
+        self._fijar_indice(entrada, nuevas)
+        self._guardar_entrada_fat(nombre_archivo, entrada)
+        return len(rutas)
+
+    def iniciar_limpieza(self, intervalo=INTERVALO_LIMPIEZA, **opciones):
+        #Ejecuta limpiar_volumen cada `intervalo` segundos en un hilo propio; el ultimo informe queda en ultima_limpieza.
+        #Solo el administrador puede iniciarla; el hilo limpia como administrador
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            raise PermissionError("Solo el administrador puede limpiar el volumen.")
+        with self._cerrojo_tabla:
+            if self._hilo_limpieza is not None:
+                return False
+            self._fin_limpieza.clear()
+            self._hilo_limpieza = threading.Thread(target=self._bucle_limpieza, args=(intervalo, opciones),
+                                                   name="fat-limpieza", daemon=True)
+            self._hilo_limpieza.start()
+        return True
+
+    def _bucle_limpieza(self, intervalo, opciones):
+        with self.como_usuario(PROPIETARIO_DEFECTO):
+            while not self._fin_limpieza.wait(intervalo):
+                self.limpiar_volumen(detener=self._fin_limpieza, **opciones)
+
+    def detener_limpieza(self):
+        with self._cerrojo_tabla:
+            hilo, self._hilo_limpieza = self._hilo_limpieza, None
+        if hilo is not None:
+            self._fin_limpieza.set()
+            hilo.join()
+
+    #Instantaneas: copias con nombre del catalogo en DIR_INSTANTANEAS. Crear una solo copia metadatos; sus bloques
+    #quedan fijados, no se liberan ni se escriben en su sitio mientras alguna instantanea los use, y al eliminar
+    #la ultima que los usa se recuperan como huerfanos
+    def _fijar_instantaneas(self):
+        #Los bloques fijados se guardan como tramos [inicio, fin) ordenados y sin solapes, mas las rutas sin id
+        tramos, rutas = [], set()
+        for instantanea in self._instantaneas.values():
+            for entrada in instantanea.entradas.values():
+                if "extensiones" in entrada:
+                    tramos += [(inicio, inicio + longitud) for inicio, longitud in entrada["extensiones"]]
+                    continue
+                for ruta in entrada["indice_bloques"]:
+                    id_bloque = self.almacen.identificador(ruta)
+                    if id_bloque is None:
+                        rutas.add(ruta)
+                    else:
+                        tramos.append((id_bloque, id_bloque + 1))
+        inicios, fines = [], []
+        for inicio, fin in sorted(tramos):
+            if fines and inicio <= fines[-1]:
+                fines[-1] = max(fines[-1], fin)
+            else:
+                inicios.append(inicio)
+                fines.append(fin)
+        self._inicios_fijados, self._fines_fijados, self._rutas_fijadas = inicios, fines, rutas
+
+    @_medido
+    def crear_instantanea(self, nombre_instantanea):
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el administrador puede crear instantáneas."
+        if not PATRON_INSTANTANEA.match(nombre_instantanea):
+            return False, f"Nombre de instantánea '{nombre_instantanea}' no válido."
+        with self._cerrojo_volumen.escritura():
+            if nombre_instantanea in self._instantaneas:
+                return False, "La instantánea ya existe."
+            #Las entradas anteriores al indice se indexan antes para que la instantanea liste todos sus bloques
+            for entrada in self._entradas():
+                if "extensiones" not in entrada and "indice_bloques" not in entrada:
+                    self._indexar_cadena(entrada)
+            with self._cerrojo_almacen:
+                entradas = copy.deepcopy(self.catalogo.entradas)
+            ruta = os.path.join(self._ruta(DIR_INSTANTANEAS), nombre_instantanea + EXTENSION_INSTANTANEA)
+            self._instantaneas[nombre_instantanea] = InstantaneaFAT(ruta, entradas)
+            self._fijar_instantaneas()
+        return True, f"Instantánea '{nombre_instantanea}' creada ({len(entradas)} archivos)."
+
+    def listar_instantaneas(self):
+        #[{nombre, fecha_creacion, archivos}] de la mas antigua a la mas reciente
+        with self._cerrojo_volumen.lectura():
+            instantaneas = [{
+                "nombre": nombre,
+                "fecha_creacion": datetime.fromtimestamp(os.path.getmtime(instantanea.ruta)).strftime(FORMATO_FECHA),
+                "archivos": len(instantanea.entradas),
+            } for nombre, instantanea in self._instantaneas.items()]
+        return sorted(instantaneas, key=lambda instantanea: (instantanea["fecha_creacion"], instantanea["nombre"]))
+
+    @_medido
+    def archivos_instantanea(self, nombre_instantanea, incluir_eliminados=False):
+        #Devuelve (exito, entradas legibles de la instantanea ordenadas por nombre o mensaje de error);
+        #los permisos son los que cada archivo tenia al crearla
+        with self._cerrojo_volumen.lectura():
+            instantanea = self._instantaneas.get(nombre_instantanea)
+            if instantanea is None:
+                return False, "Instantánea no encontrada."
+            nombres = instantanea.indices.filtrar(en_papelera=None if incluir_eliminados else False, legible_por=self.usuario_actual)
+            return True, [instantanea.entradas[nombre] for nombre in sorted(instantanea.entradas if nombres is None else nombres)]
+
+    @_medido
+    def leer_instantanea(self, nombre_instantanea, nombre_archivo, tam_fragmento=TAMAÑO_FRAGMENTO_LECTURA, desde=0):
+        #Como abrir_lectura, sobre el archivo tal como estaba al crear la instantanea
+        with self._cerrojo_volumen.lectura():
+            instantanea = self._instantaneas.get(nombre_instantanea)
+            if instantanea is None:
+                return None, "Instantánea no encontrada."
+            entrada = instantanea.obtener(nombre_archivo)
+            if not entrada or entrada.get("estado_papelera"):
+                return None, "Archivo no encontrado o en papelera."
+            if not self._permite(entrada, "lectura"):
+                return None, "Permiso de lectura denegado."
+        return self._metadata_entrada(entrada), self._fragmentos_instantanea(nombre_instantanea, instantanea, entrada, tam_fragmento, desde)
+
+    def _fragmentos_instantanea(self, nombre_instantanea, instantanea, entrada, tam_fragmento, desde):
+        #Los bloques de una instantanea no cambian; el cerrojo del volumen solo impide que se eliminen a mitad de lectura
+        posicion = desde
+        while True:
+            with self._cerrojo_volumen.lectura():
+                if self._instantaneas.get(nombre_instantanea) is not instantanea:
+                    return
+                fragmento = next(self._fragmentos(entrada, tam_fragmento, posicion), "")
+            if not fragmento:
+                return
+            posicion += len(fragmento)
+            yield fragmento
+
+    @_medido
+    def restaurar_instantanea(self, nombre_instantanea, nombres=None):
+        #Devuelve el volumen, o solo los archivos `nombres`, al estado de la instantanea; lo escrito despues se descarta
+        #y los bloques que solo usaban las versiones descartadas se recuperan como huerfanos
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el administrador puede restaurar instantáneas."
+        with self._cerrojo_volumen.escritura():
+            instantanea = self._instantaneas.get(nombre_instantanea)
+            if instantanea is None:
+                return False, "Instantánea no encontrada."
+            for nombre in nombres or ():
+                if nombre not in instantanea.entradas:
+                    return False, f"El archivo '{nombre}' no está en la instantánea."
+            cambiados = self._restaurar(instantanea, nombres)
+            self._recuperar_huerfanos()
+        return True, f"Instantánea '{nombre_instantanea}' restaurada ({cambiados} archivos cambiados)."
+
+    @_transaccional
+    def _restaurar(self, instantanea, nombres):
+        #Un solo registro del diario sustituye las entradas y recalcula las cuentas de los bloques compartidos
+        transaccion = self._local.transaccion
+        with self._cerrojo_almacen:
+            actuales = dict(self.catalogo.entradas)
+        vivas = dict(actuales)
+        cambiados = 0
+        for nombre in set(actuales) | set(instantanea.entradas) if nombres is None else nombres:
+            congelada = instantanea.obtener(nombre)
+            if congelada == actuales.get(nombre):
+                continue
+            cambiados += 1
+            if congelada is None:
+                del vivas[nombre]
+                self._eliminar_entrada_fat(nombre)
+                transaccion.textos[nombre] = (None, None, None, False)
+            else:
+                entrada = vivas[nombre] = copy.deepcopy(congelada)
+                self._registrar_texto(nombre, entrada, None)
+                self._guardar_entrada_fat(nombre, entrada)
+        cuentas = Counter(self.almacen.identificador(ruta) for entrada in vivas.values() for ruta in self._indice_bloques(entrada))
+        for id_bloque in set(self.referencias.entradas) | {id_bloque for id_bloque, cuenta in cuentas.items() if cuenta > 1}:
+            if id_bloque is None:
+                continue
+            anterior = self.referencias.obtener(id_bloque)
+            huella = anterior["huella"] if anterior else None
+            cuenta = cuentas.get(id_bloque, 0)
+            referencia = {"huella": huella, "cuenta": cuenta} if cuenta > 1 or (cuenta and huella is not None) else None
+            if referencia != anterior:
+                transaccion.referencias[id_bloque] = referencia
+        return cambiados
+
+    @_medido
+    def eliminar_instantanea(self, nombre_instantanea):
+        if self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el administrador puede eliminar instantáneas."
+        with self._cerrojo_volumen.escritura():
+            instantanea = self._instantaneas.pop(nombre_instantanea, None)
+            if instantanea is None:
+                return False, "Instantánea no encontrada."
+            os.remove(instantanea.ruta)
+            self._fijar_instantaneas()
+            cantidad, _ = self._recuperar_huerfanos()
+        return True, f"Instantánea '{nombre_instantanea}' eliminada ({cantidad} bloques liberados)."
+
+    #Importacion y exportacion masivas. Los archivos pequeños se crean por lotes, cada lote en una sola transaccion
+    #(un registro del diario); los grandes se leen por fragmentos: se crean con el primero y se completan anexando,
+    #con el archivo bloqueado hasta el final. Ningun archivo se tiene entero en memoria
+    @_medido
+    def importar(self, origen, hilos=HILOS_IMPORTACION, progreso=None):
+        #origen es un directorio o un tar (comprimido o no). Solo el administrador conserva propietario y permisos
+        #del origen; los demas usuarios quedan como dueños de lo que importan. `progreso` recibe informes parciales
+        #desde los hilos de trabajo; se devuelve el informe final
+        usuario = self.usuario_actual
+        if not usuario:
+            raise ValueError("Usuario no logueado.")
+        if os.path.isdir(origen):
+            fuentes, total = self._fuentes_directorio(origen)
+        elif os.path.isfile(origen) and tarfile.is_tarfile(origen):
+            fuentes, total = self._fuentes_tar(origen), None
+        else:
+            raise ValueError(f"'{origen}' no es un directorio ni un archivo tar.")
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+        registro = ProgresoTransferencia(progreso, total)
+        hilos = max(1, hilos)
+        pendientes = set()
+        lote = []
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="fat-importacion") as pool:
+            def enviar(funcion, *args):
+                #Como mucho dos tareas por hilo en vuelo, para no leer el origen mas rapido de lo que se escribe
+                nonlocal pendientes
+                if len(pendientes) >= 2 * hilos:
+                    terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                    for futuro in terminados:
+                        futuro.result()
+
+                def tarea():
+                    with self.como_usuario(usuario):
+                        funcion(*args, registro)
+                pendientes.add(pool.submit(tarea))
+
+            for nombre, abrir, metadatos, tamaño, secuencial in fuentes:
+                if not tamaño:
+                    #El volumen no guarda archivos vacios: se informan como omitidos, no como fallidos
+                    registro.omitir(nombre, "Archivo vacío.")
+                elif tamaño <= TAMAÑO_FRAGMENTO_LECTURA:
+                    lote.append((nombre, abrir, metadatos, tamaño))
+                    if len(lote) >= LOTE_IMPORTACION:
+                        enviar(self._importar_lote, lote)
+                        lote = []
+                elif secuencial:
+                    #Un miembro de un tar leido en flujo hay que consumirlo antes de pasar al siguiente
+                    self._importar_grande(nombre, abrir, metadatos, tamaño, registro)
+                else:
+                    enviar(self._importar_grande, nombre, abrir, metadatos, tamaño)
+            if lote:
+                enviar(self._importar_lote, lote)
+            for futuro in pendientes:
+                futuro.result()
+        informe = registro.informe()
+        if progreso:
+            progreso(informe)
+        return informe
+
+    def _fuentes_directorio(self, origen):
+        #Devuelve (fuentes, total); los nombres son las rutas relativas con "/" y el manifiesto de una exportacion
+        #previa aporta propietario, permisos y fechas
+        metadatos_previos = {}
+        ruta_manifiesto = os.path.join(origen, MANIFIESTO_EXPORTACION)
+        if os.path.isfile(ruta_manifiesto):
+            with open(ruta_manifiesto, 'r', encoding='utf-8') as f:
+                for linea in f:
+                    if linea.strip():
+                        metadatos = json.loads(linea)
+                        metadatos_previos[metadatos["nombre"]] = metadatos
+        rutas = []
+        for directorio, subdirectorios, archivos in os.walk(origen):
+            subdirectorios.sort()
+            for archivo in sorted(archivos):
+                ruta = os.path.join(directorio, archivo)
+                nombre = os.path.relpath(ruta, origen).replace(os.sep, "/")
+                if nombre != MANIFIESTO_EXPORTACION and os.path.isfile(ruta):
+                    rutas.append((nombre, ruta))
+
+        def fuentes():
+            for nombre, ruta in rutas:
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                metadatos = metadatos_previos.get(nombre) or {"fecha_modificacion": _epoca_a_fecha(int(estado.st_mtime))}
+                yield nombre, functools.partial(open, ruta, 'rb'), metadatos, estado.st_size, False
+        return fuentes(), len(rutas)
+
+    def _fuentes_tar(self, origen):
+        #El tar se lee en flujo; los miembros pequeños se leen aqui para que el lote los use despues
+        with tarfile.open(origen, 'r|*') as tar:
+            for miembro in tar:
+                if not miembro.isfile():
+                    continue
+                metadatos = {"fecha_modificacion": _epoca_a_fecha(int(miembro.mtime))}
+                for campo in ("propietario", "fecha_creacion", "fecha_modificacion"):
+                    if PREFIJO_PAX + campo in miembro.pax_headers:
+                        metadatos[campo] = miembro.pax_headers[PREFIJO_PAX + campo]
+                if PREFIJO_PAX + "permisos" in miembro.pax_headers:
+                    metadatos["permisos"] = json.loads(miembro.pax_headers[PREFIJO_PAX + "permisos"])
+                if miembro.size <= TAMAÑO_FRAGMENTO_LECTURA:
+                    yield miembro.name, functools.partial(io.BytesIO, tar.extractfile(miembro).read()), metadatos, miembro.size, False
+                else:
+                    yield miembro.name, functools.partial(tar.extractfile, miembro), metadatos, miembro.size, True
+
+    def _atributos_importados(self, metadatos):
+        #(propietario, permisos, fecha_creacion, fecha_modificacion) con los que se crea un archivo importado
+        propietario, permisos = self.usuario_actual, None
+        origen = metadatos.get("propietario")
+        if self.usuario_actual == PROPIETARIO_DEFECTO and isinstance(origen, str) and origen:
+            propietario = origen
+            permisos_origen = metadatos.get("permisos")
+            if isinstance(permisos_origen, dict) and all(
+                    isinstance(permisos_origen.get(tipo), list) and all(isinstance(u, str) for u in permisos_origen[tipo])
+                    for tipo in ("lectura", "escritura")):
+                permisos = {tipo: list(dict.fromkeys([propietario] + permisos_origen[tipo])) for tipo in ("lectura", "escritura")}
+        fechas = [metadatos.get(campo) for campo in ("fecha_creacion", "fecha_modificacion")]
+        fechas = [fecha if isinstance(fecha, str) and _fecha_a_epoca(fecha) is not None else None for fecha in fechas]
+        return propietario, permisos, fechas[0], fechas[1]
+
+    def _importar_lote(self, lote, registro):
+        archivos = []
+        for nombre, abrir, metadatos, tamaño in lote:
+            try:
+                with abrir() as binario:
+                    contenido = binario.read().decode('utf-8')
+            except (OSError, ValueError, tarfile.TarError) as error:
+                registro.fallo(nombre, str(error))
+                continue
+            archivos.append((nombre, contenido, metadatos, tamaño))
+        if not archivos:
+            return
+        #Los cerrojos de todo el lote se toman en orden para no bloquearse con otro lote
+        with self._cerrojo_volumen.lectura(), contextlib.ExitStack() as pila:
+            for nombre in sorted({nombre for nombre, _, _, _ in archivos}):
+                pila.enter_context(self._cerrojo_de(nombre).escritura())
+            resultados = self._crear_importados(archivos)
+        creados = caracteres = cantidad_bytes = 0
+        for (nombre, contenido, _, tamaño), (exito, mensaje) in zip(archivos, resultados):
+            if exito:
+                creados += 1
+                caracteres += len(contenido)
+                cantidad_bytes += tamaño
+            else:
+                registro.fallo(nombre, mensaje)
+        registro.sumar(creados, caracteres, cantidad_bytes)
+
+    @_transaccional
+    def _crear_importados(self, archivos):
+        resultados = []
+        for nombre, contenido, metadatos, _ in archivos:
+            if self._cargar_entrada_fat(nombre):
+                resultados.append((False, "El archivo ya existe."))
+            else:
+                resultados.append(self._crear_entrada(nombre, contenido, *self._atributos_importados(metadatos)))
+        return resultados
+
+    def _importar_grande(self, nombre, abrir, metadatos, tamaño, registro):
+        creado = False
+        with self._cerrojo_volumen.lectura(), self._cerrojo_de(nombre).escritura():
+            try:
+                with abrir() as binario:
+                    fragmentos = self._fragmentos_texto(binario)
+                    fragmento = next(fragmentos, "")
+                    exito, mensaje = self._crear_importados([(nombre, fragmento, metadatos, tamaño)])[0]
+                    if not exito:
+                        registro.fallo(nombre, mensaje)
+                        return
+                    creado = True
+                    caracteres = len(fragmento)
+                    for fragmento in fragmentos:
+                        exito, mensaje = self.agregar_contenido(nombre, fragmento)
+                        if not exito:
+                            raise ValueError(mensaje)
+                        caracteres += len(fragmento)
+                self._fijar_fecha_importada(nombre, metadatos)
+            except (OSError, ValueError, tarfile.TarError) as error:
+                #Un archivo a medio importar no se deja en el volumen
+                if creado:
+                    self._descartar_importado(nombre)
+                registro.fallo(nombre, str(error))
+                return
+        registro.sumar(1, caracteres, tamaño)
+
+    def _fragmentos_texto(self, binario):
+        #Decodifica en utf-8 por fragmentos; un caracter partido entre dos lecturas se completa en la siguiente
+        decodificador = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            datos = binario.read(TAMAÑO_FRAGMENTO_LECTURA)
+            texto = decodificador.decode(datos, final=not datos)
+            if texto:
+                yield texto
+            if not datos:
+                return
+
+    @_transaccional
+    def _fijar_fecha_importada(self, nombre, metadatos):
+        #Anexar los fragmentos cambia la fecha de modificacion; se devuelve la del origen
+        fecha_modificacion = self._atributos_importados(metadatos)[3]
+        entrada = self._cargar_entrada_fat(nombre)
+        if entrada and fecha_modificacion:
+            entrada["fecha_modificacion"] = fecha_modificacion
+            self._guardar_entrada_fat(nombre, entrada)
+
+    @_transaccional
+    def _descartar_importado(self, nombre):
+        entrada = self._cargar_entrada_fat(nombre)
+        if entrada:
+            self._purgar_entrada(nombre, entrada)
+
+    @_medido
+    def exportar(self, destino, nombres=None, hilos=HILOS_IMPORTACION, progreso=None):
+        #Copia al anfitrion los archivos legibles por el usuario fuera de la papelera (o solo `nombres`).
+        #Un destino con sufijo de EXTENSIONES_TAR se escribe como tar en flujo, con propietario, permisos y fechas
+        #en cabeceras PAX; cualquier otro es un directorio y esos datos van a MANIFIESTO_EXPORTACION
+        usuario = self.usuario_actual
+        if not usuario:
+            raise ValueError("Usuario no logueado.")
+        _, entradas = self.consultar(en_papelera=False, legible_por=usuario)
+        if nombres is not None:
+            buscados = set(nombres)
+            entradas = [entrada for entrada in entradas if entrada["nombre"] in buscados]
+        registro = ProgresoTransferencia(progreso, len(entradas))
+        compresion = next((compresion for sufijo, compresion in EXTENSIONES_TAR.items() if destino.endswith(sufijo)), None)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=max(1, hilos), thread_name_prefix="fat-exportacion") as pool:
+            def enviar(funcion, *args):
+                def tarea():
+                    with self.como_usuario(usuario):
+                        return funcion(*args)
+                return pool.submit(tarea)
+            if compresion is None:
+                self._exportar_directorio(destino, entradas, enviar, registro)
+            else:
+                self._exportar_tar(destino, compresion, entradas, enviar, max(1, hilos), registro)
+        informe = registro.informe()
+        if progreso:
+            progreso(informe)
+        return informe
+
+    def _metadatos_exportados(self, entrada):
+        return {campo: entrada[campo] for campo in ("nombre", "propietario", "permisos", "fecha_creacion", "fecha_modificacion")}
+
+    def _volcar(self, nombre, escribir):
+        #Escribe el contenido en utf-8 por fragmentos y devuelve (caracteres, bytes)
+        metadata, fragmentos = self.abrir_lectura(nombre)
+        if not metadata:
+            raise ValueError(fragmentos)
+        caracteres = cantidad_bytes = 0
+        for fragmento in fragmentos:
+            datos = fragmento.encode('utf-8')
+            escribir(datos)
+            caracteres += len(fragmento)
+            cantidad_bytes += len(datos)
+        return caracteres, cantidad_bytes
+
+    def _exportar_directorio(self, destino, entradas, enviar, registro):
+        os.makedirs(destino, exist_ok=True)
+        cerrojo_manifiesto = threading.Lock()
+
+        def exportar_archivo(entrada, manifiesto):
+            nombre = entrada["nombre"]
+            partes = nombre.split("/")
+            if nombre == MANIFIESTO_EXPORTACION or any(parte in ("", ".", "..") for parte in partes):
+                registro.fallo(nombre, "El nombre no se puede usar como ruta.")
+                return
+            ruta = os.path.join(destino, *partes)
+            try:
+                os.makedirs(os.path.dirname(ruta), exist_ok=True)
+                with open(ruta, 'wb') as f:
+                    caracteres, cantidad_bytes = self._volcar(nombre, f.write)
+                epoca = _fecha_a_epoca(entrada["fecha_modificacion"])
+                if epoca is not None:
+                    os.utime(ruta, (epoca, epoca))
+            except (OSError, ValueError) as error:
+                registro.fallo(nombre, str(error))
+                return
+            linea = json.dumps(self._metadatos_exportados(entrada), ensure_ascii=False) + "\n"
+            with cerrojo_manifiesto:
+                manifiesto.write(linea)
+            registro.sumar(1, caracteres, cantidad_bytes)
+
+        with open(os.path.join(destino, MANIFIESTO_EXPORTACION), 'w', encoding='utf-8') as manifiesto:
+            for futuro in [enviar(exportar_archivo, entrada, manifiesto) for entrada in entradas]:
+                futuro.result()
+
+    def _exportar_tar(self, destino, compresion, entradas, enviar, hilos, registro):
+        #Los hilos vuelcan cada archivo a un temporal (en memoria si es pequeño) y el tar se escribe en orden
+        def preparar(entrada):
+            temporal = tempfile.SpooledTemporaryFile(max_size=16 * TAMAÑO_FRAGMENTO_LECTURA)
+            try:
+                caracteres, cantidad_bytes = self._volcar(entrada["nombre"], temporal.write)
+            except (OSError, ValueError) as error:
+                temporal.close()
+                return entrada, None, str(error), 0
+            temporal.seek(0)
+            return entrada, temporal, caracteres, cantidad_bytes
+
+        def escribir(futuro):
+            entrada, temporal, caracteres, cantidad_bytes = futuro.result()
+            if temporal is None:
+                registro.fallo(entrada["nombre"], caracteres)
+                return
+            with temporal:
+                miembro = tarfile.TarInfo(entrada["nombre"])
+                miembro.size = cantidad_bytes
+                miembro.mtime = _fecha_a_epoca(entrada["fecha_modificacion"]) or time.time()
+                miembro.mode = 0o644
+                miembro.uname = entrada["propietario"]
+                miembro.pax_headers = {PREFIJO_PAX + campo: valor if isinstance(valor, str) else json.dumps(valor, ensure_ascii=False)
+                                       for campo, valor in self._metadatos_exportados(entrada).items() if campo != "nombre"}
+                tar.addfile(miembro, temporal)
+            registro.sumar(1, caracteres, cantidad_bytes)
+
+        en_vuelo = deque()
+        with tarfile.open(destino, f"w|{compresion}", format=tarfile.PAX_FORMAT) as tar:
+            for entrada in entradas:
+                if len(en_vuelo) >= 2 * hilos:
+                    escribir(en_vuelo.popleft())
+                en_vuelo.append(enviar(preparar, entrada))
+            while en_vuelo:
+                escribir(en_vuelo.popleft())
+
+    def estadisticas_espacio(self):
+        with self._cerrojo_almacen:
+            tramos = self.asignador.tramos_libres()
+        libres = sum(longitud for _, longitud in tramos)
+        archivos_fragmentados = 0
+        extensiones = 0
+        for entrada in self._entradas():
+            cantidad = len(entrada.get("extensiones") or entrada.get("indice_bloques") or ())
+            extensiones += cantidad
+            archivos_fragmentados += cantidad > 1
+        return {
+            "bloques_usados": self.asignador.usados,
+            "bloques_libres": libres,
+            "limite_asignado": self.asignador.limite,
+            "caracteres_por_bloque": self.tamaño_bloque,
+            "tramos_libres": len(tramos),
+            "mayor_tramo_libre": max((longitud for _, longitud in tramos), default=0),
+            #0 si todo el espacio libre es un solo tramo, tiende a 1 cuanto mas disperso esta
+            "fragmentacion_libre": 1 - max((l for _, l in tramos), default=0) / libres if libres else 0.0,
+            "archivos_fragmentados": archivos_fragmentados,
+            "extensiones": extensiones,
+        }
+
+    def estadisticas_deduplicacion(self):
+        bloques_logicos = 0
+        for entrada in self._entradas():
+            bloques_logicos += sum(longitud for _, longitud in entrada.get("extensiones", ()))
+            bloques_logicos += len(entrada.get("indice_bloques", ()))
+        registrados = self.referencias.entradas.values()
+        return {
+            "deduplicacion": self.volumen["deduplicacion"],
+            "bloques_logicos": bloques_logicos,
+            "bloques_fisicos": self.asignador.usados,
+            "bloques_deduplicados": len(registrados),
+            "bloques_compartidos": sum(1 for referencia in registrados if referencia["cuenta"] > 1),
+            "ratio_deduplicacion": bloques_logicos / self.asignador.usados if self.asignador.usados else 1.0,
+        }
+
+    def estadisticas_compresion(self):
+        #Ratio del volumen sobre los archivos comprimidos y coste de CPU de cada codec desde que se abrió
+        archivos = bloques_planos = bloques_almacenados = 0
+        for entrada in self._entradas():
+            if "marcos" in entrada:
+                archivos += 1
+                for caracteres, bloques, _ in entrada["marcos"]:
+                    bloques_planos += -(-caracteres // self.tamaño_bloque)
+                    bloques_almacenados += bloques
+        codecs = {}
+        with self._cerrojo_medidas:
+            medidas = {codec: dict(medida) for codec, medida in self._medidas_codec.items()}
+        for codec, medida in medidas.items():
+            codecs[codec] = dict(medida,
+                ratio=medida["bytes_originales"] / medida["bytes_almacenados"] if medida["bytes_almacenados"] else 1.0,
+                mb_por_segundo_compresion=medida["bytes_originales"] / 1e6 / medida["segundos_compresion"] if medida["segundos_compresion"] else 0.0)
+        return {
+            "compresion": self.volumen["compresion"],
+            "archivos_comprimidos": archivos,
+            "bloques_sin_comprimir": bloques_planos,
+            "bloques_almacenados": bloques_almacenados,
+            "ratio_compresion": bloques_planos / bloques_almacenados if bloques_almacenados else 1.0,
+            "codecs": codecs,
+        }
+
+    def evaluar_codecs(self, nombre_archivo):
+        #Mide cada codec registrado sobre el contenido de un archivo sin modificarlo
+        metadata, contenido = self.obtener_contenido_archivo(nombre_archivo)
+        if not metadata:
+            return None, contenido
+        datos = contenido.encode('utf-8')
+        resultados = {}
+        for codec, (comprimir, descomprimir) in CODECS.items():
+            inicio = time.perf_counter()
+            comprimido = comprimir(datos)
+            medio = time.perf_counter()
+            descomprimir(comprimido)
+            resultados[codec] = {
+                "bytes_originales": len(datos),
+                "bytes_comprimidos": len(comprimido),
+                "ratio": len(datos) / len(comprimido) if comprimido else 1.0,
+                "segundos_compresion": medio - inicio,
+                "segundos_descompresion": time.perf_counter() - medio,
+            }
+        return metadata, resultados
+
+    def _registrar_texto(self, nombre_archivo, entrada, texto, anexado=False):
+        #Da una revision nueva al contenido y anota el cambio para el indice de texto
+        anterior = entrada.get("revision")
+        entrada["revision"] = max(time.time_ns(), (anterior or 0) + 1)
+        textos = self._local.transaccion.textos
+        previo = textos.get(nombre_archivo)
+        if anexado and previo and previo[2] is not None:
+            anterior, texto, anexado = previo[0], previo[2] + texto, previo[3]
+        textos[nombre_archivo] = (anterior, entrada["revision"], texto, anexado)
+
+    def _indexar_textos(self, textos):
+        with self._cerrojo_texto:
+            indice = self._indice_texto
+            if indice is None:
+                return
+            for nombre, (anterior, revision, texto, anexado) in textos.items():
+                if revision is None:
+                    indice.quitar(nombre)
+                    self._pendientes_texto.discard(nombre)
+                elif texto is None:
+                    #Clones y restauraciones no leen el contenido: se indexa en la proxima busqueda
+                    self._pendientes_texto.add(nombre)
+                elif not anexado:
+                    indice.indexar(nombre, revision, texto)
+                    self._pendientes_texto.discard(nombre)
+                elif nombre in indice.documentos and indice.revision(nombre) == anterior and nombre not in self._pendientes_texto:
+                    indice.anexar(nombre, revision, texto)
+                else:
+                    self._pendientes_texto.add(nombre)
+
+    def _preparar_indice_texto(self):
+        #Carga el indice la primera vez y reindexa los archivos pendientes leyendo su contenido
+        with self._cerrojo_texto:
+            if self._indice_texto is None:
+                indice = IndiceTexto.cargar(self._ruta(RUTA_INDICE_TEXTO))
+                with self._cerrojo_almacen:
+                    revisiones = {nombre: entrada.get("revision") for nombre, entrada in self.catalogo.entradas.items()}
+                for nombre in [nombre for nombre in indice.documentos if nombre not in revisiones]:
+                    indice.quitar(nombre)
+                self._pendientes_texto = {nombre for nombre, revision in revisiones.items()
+                                          if nombre not in indice.documentos or indice.revision(nombre) != revision}
+                self._indice_texto = indice
+            pendientes, self._pendientes_texto = self._pendientes_texto, set()
+        for nombre in pendientes:
+            with self._cerrojo_volumen.lectura(), self._cerrojo_de(nombre).lectura():
+                entrada = self.catalogo.obtener(nombre)
+                texto = "".join(self._piezas(entrada, 0)) if entrada else None
+                with self._cerrojo_texto:
+                    if entrada is None:
+                        self._indice_texto.quitar(nombre)
+                    else:
+                        self._indice_texto.indexar(nombre, entrada.get("revision"), texto)
+
+    @_medido
+    def buscar(self, consulta, limite=None, incluir_eliminados=False):
+        #Devuelve [(nombre, apariciones)] de los archivos legibles que contienen todas las palabras, frases
+        #("entre comillas") y prefijos (palabra*) de la consulta, de mas a menos apariciones
+        self._preparar_indice_texto()
+        with self._cerrojo_texto:
+            coincidencias = self._indice_texto.buscar(consulta)
+        resultados = []
+        for nombre, apariciones in coincidencias.items():
+            entrada = self.catalogo.obtener(nombre)
+            if not entrada or (entrada.get("estado_papelera") and not incluir_eliminados):
+                continue
+            if self.verificar_permisos(nombre, "lectura", entrada):
+                resultados.append((nombre, apariciones))
+        resultados.sort(key=lambda resultado: (-resultado[1], resultado[0]))
+        return resultados if limite is None else resultados[:limite]
+
+    @_medido
+    def verificar_permisos(self, nombre_archivo, tipo_permiso, entrada=None):
+        #Quien ya cargo la entrada la pasa para no buscarla otra vez. Se decide con la propia entrada, que dentro
+        #de una transaccion puede tener cambios aun sin confirmar; los conjuntos por usuario del catalogo solo
+        #reflejan lo confirmado y se usan para filtrar muchos archivos a la vez (consultar, archivos_accesibles)
+        if entrada is None:
+            entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada: return False
+        return self._permite(entrada, tipo_permiso)
+
+    def _permite(self, entrada, tipo_permiso):
+        if self.usuario_actual == PROPIETARIO_DEFECTO: return True
+        if self.usuario_actual == entrada["propietario"]: return True
+        return self.usuario_actual in entrada["permisos"].get(tipo_permiso, ())
+
+    @_medido
+    def archivos_accesibles(self, tipo_permiso="lectura", usuario=None):
+        #Conjunto de nombres que el usuario puede leer o escribir, sin evaluar las ACL archivo por archivo
+        usuario = usuario or self.usuario_actual
+        with self._cerrojo_almacen:
+            if usuario == PROPIETARIO_DEFECTO:
+                return set(self.catalogo.entradas)
+            return self.catalogo.indices.accesibles(usuario, tipo_permiso)
+
+    @_medido
+    def convertir_almacen(self, tipo_destino):
+        with self._cerrojo_volumen.escritura():
+            return self._convertir_almacen(tipo_destino)
+
+    def _convertir_almacen(self, tipo_destino):
+        if tipo_destino not in ALMACENES:
+            return False, f"Almacen '{tipo_destino}' no válido."
+        if tipo_destino == self.almacen.tipo:
+            return False, f"El volumen ya usa el almacen '{tipo_destino}'."
+        if self._instantaneas:
+            return False, "Elimine las instantáneas antes de convertir el almacen."
+        #La conversion escribe el almacen destino directamente, fuera del diario, y solo libera el origen al final
+        self.diario.punto_control()
+        destino = self._abrir_almacen(tipo_destino)
+        entradas = self.listar_archivos(incluir_eliminados=True)
+        rutas_origen = []
+        for entrada in entradas:
+            rutas_bloques = self._indice_bloques(entrada)
+            datos = [self._leer_bloque(ruta)["datos"] for ruta in rutas_bloques]
+            #Cada marco comprimido se copia por separado para conservar su numero de bloques
+            marcos = [marco[1] for marco in entrada["marcos"]] if "marcos" in entrada else [len(datos)]
+            rutas_destino = []
+            for bloques in marcos:
+                rutas_destino += self._generar_bloques("".join(datos[:bloques]), destino)
+                del datos[:bloques]
+            self._fijar_indice(entrada, rutas_destino, destino)
+            rutas_origen.extend(rutas_bloques)
+        self.diario.punto_control()
+        with self._cerrojo_almacen:
+            destino.sincronizar()
+            for entrada in entradas:
+                self.catalogo.guardar(entrada["nombre"], entrada)
+            self.catalogo.sincronizar()
+            self.volumen["almacen"] = tipo_destino
+            self._guardar_volumen(self.volumen)
+            for ruta in rutas_origen:
+                self.almacen.liberar(ruta)
+                self.asignador.liberar(self.almacen.identificador(ruta))
+            #El almacen destino recibe copias sin compartir; la tabla de deduplicacion se reinicia
+            for id_bloque in list(self.referencias.entradas):
+                self.referencias.eliminar(id_bloque)
+            self.referencias.compactar()
+            self._por_huella.clear()
+            self.almacen.cerrar()
+            if isinstance(self.almacen, AlmacenImagen):
+                os.remove(self.almacen.ruta)
+            self.almacen = destino
+            self.cache.vaciar()
+        return True, f"Volumen convertido al almacen '{tipo_destino}' ({len(entradas)} archivos)."
+
+    @_medido
+    @_cerrojo_archivo("escritura")
+    @_transaccional
+    def asignar_permisos(self, nombre_archivo, usuario_destino, tipo_permiso, accion="agregar"):
+        if tipo_permiso not in ("lectura", "escritura"):
+            return False, "Tipo de permiso inválido."
+        entrada = self._cargar_entrada_fat(nombre_archivo)
+        if not entrada: return False, "Archivo no encontrado."
+        if self.usuario_actual != entrada["propietario"] and self.usuario_actual != PROPIETARIO_DEFECTO:
+            return False, "Solo el propietario o el administrador pueden modificar permisos."
+        lista_permisos = entrada["permisos"].get(tipo_permiso)
+        if usuario_destino == entrada["propietario"]:
+            return False, "No puede modificar los permisos del propietario desde esta interfaz."
+        if accion == "agregar":
+            if usuario_destino not in lista_permisos:
+                lista_permisos.append(usuario_destino)
+                self._guardar_entrada_fat(nombre_archivo, entrada)
+                return True, f"Permiso de '{tipo_permiso}' asignado a {usuario_destino}."
+            return False, f"El usuario {usuario_destino} ya tiene permiso de '{tipo_permiso}'."
+        elif accion == "revocar":
+            if usuario_destino in lista_permisos:
+                lista_permisos.remove(usuario_destino)
+                self._guardar_entrada_fat(nombre_archivo, entrada)
+                return True, f"Permiso de '{tipo_permiso}' revocado a {usuario_destino}."
+            return False, f"El usuario {usuario_destino} no tenía permiso de '{tipo_permiso}'."
+        return False, "Acción de permiso no válida."
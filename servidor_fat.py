@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from motor_fat import SistemaFAT, TAMAÑO_FRAGMENTO_LECTURA
+
+#Protocolo: cada mensaje es un objeto JSON precedido por su longitud en 4 bytes big-endian.
+#Peticion {"op": ..., argumentos}; respuesta {"ok", "msg", "datos"}.
+#"leer" responde con los metadatos, luego un {"frag"} por fragmento y termina con {"ok": true, "fin": true}
+LONGITUD = struct.Struct('>I')
+MENSAJE_MAXIMO = 64 * 1024 * 1024
+HOST_DEFECTO = '127.0.0.1'
+PUERTO_DEFECTO = 7070
+MAX_CONEXIONES = 256
+MAX_OPERACIONES = 32
+TAMAÑO_POOL_CLIENTE = 4
+CAMPOS_LISTADO = ("nombre", "propietario", "cant_caracteres", "fecha_creacion", "fecha_modificacion",
+                  "fecha_eliminacion", "estado_papelera", "permisos")
+
+
+def codificar(mensaje):
+    datos = json.dumps(mensaje, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return LONGITUD.pack(len(datos)) + datos
+
+
+async def leer_mensaje(lector):
+    #Devuelve None cuando el otro extremo cierra entre dos mensajes
+    try:
+        cabecera = await lector.readexactly(LONGITUD.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (longitud,) = LONGITUD.unpack(cabecera)
+    if longitud > MENSAJE_MAXIMO:
+        raise ValueError("Mensaje demasiado grande.")
+    return json.loads(await lector.readexactly(longitud))
+
+
+#Servidor
+class ServidorFAT:
+    #op -> (metodo de la sesion, argumentos en orden); todos devuelven (exito, mensaje)
+    OPERACIONES = {
+        "crear": ("crear_archivo", ("nombre", "contenido")),
+        "modificar": ("modificar_archivo", ("nombre", "contenido")),
+        "agregar": ("agregar_contenido", ("nombre", "texto")),
+        "eliminar": ("eliminar_archivo", ("nombre",)),
+        "recuperar": ("recuperar_archivo", ("nombre",)),
+        "purgar": ("purgar_archivo", ("nombre",)),
+        "clonar": ("clonar_archivo", ("nombre", "destino")),
+        "permisos": ("asignar_permisos", ("nombre", "usuario", "tipo", "accion")),
+    }
+
+    def __init__(self, sistema, max_conexiones=MAX_CONEXIONES, max_operaciones=MAX_OPERACIONES):
+        self.sistema = sistema
+        self.max_conexiones = max_conexiones
+        self.conexiones = 0
+        #Las operaciones del motor bloquean (cerrojos, fsync): se ejecutan en hilos y como mucho max_operaciones a la vez
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_operaciones, thread_name_prefix="servidor-fat")
+        self._semaforo = asyncio.Semaphore(max_operaciones)
+        self._servidores = []
+
+    async def iniciar_tcp(self, host=HOST_DEFECTO, puerto=PUERTO_DEFECTO):
+        servidor = await asyncio.start_server(self._atender, host, puerto)
+        self._servidores.append(servidor)
+        return servidor
+
+    async def iniciar_unix(self, ruta):
+        servidor = await asyncio.start_unix_server(self._atender, ruta)
+        self._servidores.append(servidor)
+        return servidor
+
+    async def servir(self):
+        await asyncio.gather(*(servidor.serve_forever() for servidor in self._servidores))
+
+    async def cerrar(self):
+        for servidor in self._servidores:
+            servidor.close()
+            await servidor.wait_closed()
+        self._ejecutor.shutdown()
+
+    async def _ejecutar(self, funcion, *args):
+        async with self._semaforo:
+            return await asyncio.get_running_loop().run_in_executor(self._ejecutor, functools.partial(funcion, *args))
+
+    async def _atender(self, lector, escritor):
+        if self.conexiones >= self.max_conexiones:
+            escritor.write(codificar({"ok": False, "msg": "Servidor ocupado."}))
+            escritor.close()
+            return
+        self.conexiones += 1
+        sesion = None
+        try:
+            while True:
+                peticion = await leer_mensaje(lector)
+                if peticion is None:
+                    break
+                #Un JSON valido que no es un objeto ([], 1, "x") se rechaza sin cerrar la conexion
+                op = peticion.get("op") if isinstance(peticion, dict) else None
+                if op == "salir":
+                    break
+                if not isinstance(peticion, dict):
+                    respuesta = {"ok": False, "msg": "Petición inválida: se esperaba un objeto JSON."}
+                elif op == "login":
+                    sesion = await self._ejecutar(self.sistema.abrir_sesion, peticion.get("usuario", ""), peticion.get("contrasena", ""))
+                    respuesta = {"ok": True, "msg": "Sesión iniciada."} if sesion else {"ok": False, "msg": "Credenciales incorrectas."}
+                elif sesion is None:
+                    respuesta = {"ok": False, "msg": "Sesión no iniciada."}
+                elif op == "leer":
+                    await self._transmitir(sesion, peticion, escritor)
+                    continue
+                else:
+                    respuesta = await self._despachar(sesion, op, peticion)
+                escritor.write(codificar(respuesta))
+                await escritor.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.conexiones -= 1
+            escritor.close()
+            with contextlib.suppress(ConnectionError):
+                await escritor.wait_closed()
+
+    async def _despachar(self, sesion, op, peticion):
+        try:
+            if op == "rango":
+                metadata, texto = await self._ejecutar(sesion.leer_rango, peticion["nombre"], peticion.get("offset", 0), peticion["longitud"])
+                if metadata is None:
+                    return {"ok": False, "msg": texto}
+                return {"ok": True, "datos": {"metadata": metadata, "texto": texto}}
+            if op == "listar":
+                entradas = await self._ejecutar(sesion.listar_archivos, peticion.get("eliminados", False))
+                return {"ok": True, "datos": [{campo: entrada.get(campo) for campo in CAMPOS_LISTADO} for entrada in entradas]}
+            if op not in self.OPERACIONES:
+                return {"ok": False, "msg": f"Operación '{op}' no válida."}
+            metodo, parametros = self.OPERACIONES[op]
+            exito, mensaje = await self._ejecutar(getattr(sesion, metodo), *(peticion.get(p) for p in parametros if p in peticion))
+            return {"ok": exito, "msg": mensaje}
+        except (KeyError, TypeError) as error:
+            return {"ok": False, "msg": f"Petición inválida: {error}"}
+
+    async def _transmitir(self, sesion, peticion, escritor):
+        #Cada fragmento se lee en un hilo y se espera a que el socket lo acepte antes de leer el siguiente
+        metadata, fragmentos = await self._ejecutar(sesion.abrir_lectura, peticion.get("nombre"),
+                                                    peticion.get("tam_fragmento", TAMAÑO_FRAGMENTO_LECTURA), peticion.get("desde", 0))
+        if metadata is None:
+            escritor.write(codificar({"ok": False, "msg": fragmentos}))
+            await escritor.drain()
+            return
+        escritor.write(codificar({"ok": True, "datos": metadata}))
+        while True:
+            fragmento = await self._ejecutar(next, fragmentos, None)
+            if fragmento is None:
+                break
+            escritor.write(codificar({"frag": fragmento}))
+            await escritor.drain()
+        escritor.write(codificar({"ok": True, "fin": True}))
+        await escritor.drain()
+
+
+#Cliente
+class ConexionFAT:
+
+    def __init__(self, lector, escritor):
+        self.lector = lector
+        self.escritor = escritor
+
+    @classmethod
+    async def abrir(cls, usuario, contrasena, host=HOST_DEFECTO, puerto=PUERTO_DEFECTO, ruta_unix=None):
+        if ruta_unix:
+            lector, escritor = await asyncio.open_unix_connection(ruta_unix)
+        else:
+            lector, escritor = await asyncio.open_connection(host, puerto)
+        conexion = cls(lector, escritor)
+        respuesta = await conexion.pedir("login", usuario=usuario, contrasena=contrasena)
+        if not respuesta["ok"]:
+            await conexion.cerrar()
+            raise PermissionError(respuesta["msg"])
+        return conexion
+
+    async def _enviar(self, op, argumentos):
+        self.escritor.write(codificar(dict(argumentos, op=op)))
+        await self.escritor.drain()
+
+    async def _recibir(self):
+        respuesta = await leer_mensaje(self.lector)
+        if respuesta is None:
+            raise ConnectionError("El servidor cerró la conexión.")
+        return respuesta
+
+    async def pedir(self, op, **argumentos):
+        await self._enviar(op, argumentos)
+        return await self._recibir()
+
+    async def transmitir(self, op, **argumentos):
+        #Produce primero la respuesta inicial y despues cada fragmento hasta el mensaje de fin
+        await self._enviar(op, argumentos)
+        respuesta = await self._recibir()
+        yield respuesta
+        if not respuesta["ok"]:
+            return
+        while True:
+            mensaje = await self._recibir()
+            if "frag" not in mensaje:
+                return
+            yield mensaje["frag"]
+
+    async def cerrar(self):
+        with contextlib.suppress(ConnectionError):
+            await self._enviar("salir", {})
+        self.escritor.close()
+        with contextlib.suppress(ConnectionError):
+            await self.escritor.wait_closed()
+
+
+class ClienteFAT:
+    #Pool de conexiones autenticadas como un usuario; cada peticion usa una conexion libre o abre otra hasta tamaño_pool
+
+    def __init__(self, usuario, contrasena, host=HOST_DEFECTO, puerto=PUERTO_DEFECTO, ruta_unix=None, tamaño_pool=TAMAÑO_POOL_CLIENTE):
+        self._abrir = functools.partial(ConexionFAT.abrir, usuario, contrasena, host, puerto, ruta_unix)
+        self._semaforo = asyncio.Semaphore(tamaño_pool)
+        self._libres = []
+
+    @contextlib.asynccontextmanager
+    async def conexion(self):
+        async with self._semaforo:
+            conexion = self._libres.pop() if self._libres else await self._abrir()
+            try:
+                yield conexion
+            except BaseException:
+                #Una conexion interrumpida a mitad de mensaje no puede reutilizarse
+                await conexion.cerrar()
+                raise
+            self._libres.append(conexion)
+
+    async def _pedir(self, op, **argumentos):
+        async with self.conexion() as conexion:
+            respuesta = await conexion.pedir(op, **argumentos)
+        return respuesta["ok"], respuesta.get("msg")
+
+    async def crear(self, nombre, contenido):
+        return await self._pedir("crear", nombre=nombre, contenido=contenido)
+
+    async def modificar(self, nombre, contenido):
+        return await self._pedir("modificar", nombre=nombre, contenido=contenido)
+
+    async def agregar(self, nombre, texto):
+        return await self._pedir("agregar", nombre=nombre, texto=texto)
+
+    async def eliminar(self, nombre):
+        return await self._pedir("eliminar", nombre=nombre)
+
+    async def recuperar(self, nombre):
+        return await self._pedir("recuperar", nombre=nombre)
+
+    async def purgar(self, nombre):
+        return await self._pedir("purgar", nombre=nombre)
+
+    async def permisos(self, nombre, usuario, tipo, accion="agregar"):
+        return await self._pedir("permisos", nombre=nombre, usuario=usuario, tipo=tipo, accion=accion)
+
+    async def listar(self, eliminados=False):
+        async with self.conexion() as conexion:
+            respuesta = await conexion.pedir("listar", eliminados=eliminados)
+        return respuesta["datos"]
+
+    async def leer_rango(self, nombre, offset, longitud):
+        async with self.conexion() as conexion:
+            respuesta = await conexion.pedir("rango", nombre=nombre, offset=offset, longitud=longitud)
+        if not respuesta["ok"]:
+            return None, respuesta["msg"]
+        return respuesta["datos"]["metadata"], respuesta["datos"]["texto"]
+
+    async def leer(self, nombre, tam_fragmento=TAMAÑO_FRAGMENTO_LECTURA, desde=0):
+        #Generador asincrono de fragmentos; la conexion queda ocupada hasta terminar la lectura
+        async with self.conexion() as conexion:
+            mensajes = conexion.transmitir("leer", nombre=nombre, tam_fragmento=tam_fragmento, desde=desde)
+            respuesta = await mensajes.__anext__()
+            if respuesta["ok"]:
+                async for fragmento in mensajes:
+                    yield fragmento
+        if not respuesta["ok"]:
+            raise FileNotFoundError(respuesta["msg"])
+
+    async def obtener(self, nombre):
+        try:
+            return "".join([fragmento async for fragmento in self.leer(nombre)])
+        except FileNotFoundError:
+            return None
+
+    async def cerrar(self):
+        libres, self._libres = self._libres, []
+        for conexion in libres:
+            await conexion.cerrar()
+
+
+async def _servir(sistema, argumentos):
+    servidor = ServidorFAT(sistema, argumentos.max_conexiones, argumentos.max_operaciones)
+    if argumentos.unix:
+        await servidor.iniciar_unix(argumentos.unix)
+    else:
+        await servidor.iniciar_tcp(argumentos.host, argumentos.puerto)
+    try:
+        await servidor.servir()
+    finally:
+        await servidor.cerrar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de red del sistema de archivos FAT.")
+    parser.add_argument("--host", default=HOST_DEFECTO)
+    parser.add_argument("--puerto", type=int, default=PUERTO_DEFECTO)
+    parser.add_argument("--unix", help="Ruta de un socket Unix en lugar de TCP.")
+    parser.add_argument("--max-conexiones", type=int, default=MAX_CONEXIONES)
+    parser.add_argument("--max-operaciones", type=int, default=MAX_OPERACIONES)
+    parser.add_argument("--raiz", help="Directorio del volumen (por defecto, el actual).")
+    argumentos = parser.parse_args()
+    sistema = SistemaFAT(raiz=argumentos.raiz)
+    try:
+        asyncio.run(_servir(sistema, argumentos))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sistema.cerrar()
+
+
+if __name__ == "__main__":
+    main()
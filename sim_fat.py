@@ -1,17 +1,17 @@
-import json
-import os
-import time
-from datetime import datetime
+import queue
 import tkinter as tk
-from tkinter import messagebox, simpledialog, scrolledtext, ttk
-
-#Todas las configuraciones necesarias en los directorios y colores de la interfaz
-TAMAÑO_BLOQUE = 20
-DIR_FAT = 'fat_data'
-DIR_DATOS = 'datos_archivos'
-PROPIETARIO_DEFECTO = 'admin'
-CONTRASENA_DEFECTO = 'admin'
-RUTA_USUARIOS = 'usuarios.json'
+from operator import itemgetter
+from tkinter import filedialog, messagebox, simpledialog, scrolledtext, ttk
+
+from motor_fat import PROPIETARIO_DEFECTO, SistemaFAT
+
+#Interfaz grafica; el motor vive en motor_fat y no depende de Tkinter
+TAMAÑO_PAGINA_VISTA = 4000
+FILAS_POR_PAGINA_LISTA = 2000
+PAGINAS_POR_CICLO_LISTA = 4
+INTERVALO_COLA_LISTA_MS = 30
+RETARDO_FILTRO_MS = 150
+INTERVALO_ESTADISTICAS_MS = 1000
 COLOR_FONDO_OSCURO = '#1E1E1E'
 COLOR_MARCO_OSCURO = '#2D2D30'
 COLOR_TEXTO_CLARO = '#D4D4D4'
@@ -19,229 +19,236 @@ COLOR_ACCION_PRIMARIA = '#FF8C00'
 COLOR_ACCENTO_USUARIO = '#9CDCFE'
 COLOR_ADVERTENCIA = '#CE9178'
 
-#Principal
-class SistemaFAT:
-
-    def __init__(self):
-        os.makedirs(DIR_FAT, exist_ok=True)
-        os.makedirs(DIR_DATOS, exist_ok=True)
-        self.usuarios_registrados = self._cargar_usuarios()
-        self.usuario_actual = None
-
-    def _cargar_usuarios(self):
-        if not os.path.exists(RUTA_USUARIOS):
-            return {PROPIETARIO_DEFECTO: self._hash_contrasena(CONTRASENA_DEFECTO)}
+class ListaVirtual:
+    #Treeview que solo dibuja la ventana de filas visible de una lista que puede tener cientos de miles.
+    #Las filas se calculan en un hilo y llegan por paginas a una cola que el hilo de Tk vacia con after;
+    #cada fila es (valores, clave_busqueda) y valores[0] es el nombre del archivo
+
+    def __init__(self, padre, columnas, lanzar, alto=15, etiquetar=None):
+        self.padre = padre
+        self.alto = alto
+        self._lanzar = lanzar
+        self._etiquetar = etiquetar
+        self._filas = []
+        self._visibles = []
+        self._filtro = ""
+        self._orden = None
+        self._desplazamiento = 0
+        self._seleccion = None
+        self._generacion = 0
+        self._total = 0
+        self._cargando = False
+        self._filtro_pendiente = None
+        self._cola = queue.Queue()
+
+        self.var_filtro = tk.StringVar(padre)
+        self.var_filtro.trace_add('write', lambda *_: self._programar_filtro())
+        self.var_estado = tk.StringVar(padre)
+        marco_filtro = ttk.Frame(padre)
+        marco_filtro.pack(fill='x', pady=(0, 5))
+        ttk.Label(marco_filtro, text="Filtrar:").pack(side=tk.LEFT)
+        tk.Entry(marco_filtro, textvariable=self.var_filtro, bg=COLOR_MARCO_OSCURO, fg=COLOR_TEXTO_CLARO, insertbackground=COLOR_ACCION_PRIMARIA).pack(side=tk.LEFT, padx=5)
+        ttk.Label(marco_filtro, textvariable=self.var_estado).pack(side=tk.LEFT, padx=5)
+        self.progreso = ttk.Progressbar(marco_filtro, mode='determinate', length=150)
+        self.progreso.pack(side=tk.RIGHT)
+
+        marco_arbol = ttk.Frame(padre)
+        marco_arbol.pack(fill='both', expand=True)
+        claves = [clave for clave, _, _ in columnas]
+        self.arbol = ttk.Treeview(marco_arbol, columns=claves, show='headings', height=alto, selectmode='browse')
+        for indice, (clave, titulo, ancho) in enumerate(columnas):
+            self.arbol.heading(clave, text=titulo, command=lambda i=indice: self.ordenar(i))
+            self.arbol.column(clave, width=ancho, stretch=indice == 0)
+        self.arbol.tag_configure('ok', foreground=COLOR_ACCION_PRIMARIA)
+        self.arbol.tag_configure('elim', foreground=COLOR_ADVERTENCIA)
+        self.arbol.pack(side="left", fill="both", expand=True)
+        self.barra = ttk.Scrollbar(marco_arbol, orient="vertical", command=self._desplazar)
+        self.barra.pack(side="right", fill="y")
+        self.arbol.bind('<<TreeviewSelect>>', self._al_seleccionar)
+        self.arbol.bind('<Configure>', self._al_redimensionar)
+        self.arbol.bind('<MouseWheel>', lambda evento: self._rodar(-1 if evento.delta > 0 else 1))
+        self.arbol.bind('<Button-4>', lambda evento: self._rodar(-1))
+        self.arbol.bind('<Button-5>', lambda evento: self._rodar(1))
+        self.arbol.bind('<Up>', lambda evento: self._mover_seleccion(-1))
+        self.arbol.bind('<Down>', lambda evento: self._mover_seleccion(1))
+        self.arbol.bind('<Prior>', lambda evento: self._mover_seleccion(-self.alto))
+        self.arbol.bind('<Next>', lambda evento: self._mover_seleccion(self.alto))
+
+    def cargar(self, obtener_filas):
+        #obtener_filas se ejecuta en un hilo del motor; una carga nueva descarta las paginas de la anterior
+        self._generacion += 1
+        generacion = self._generacion
+        self._filas, self._visibles, self._total = [], [], 0
+        self._desplazamiento = 0
+        self._cargando = True
+        self.progreso.config(value=0, maximum=1)
+        self.var_estado.set("Cargando...")
+        self._dibujar()
+        self._lanzar(self._producir, generacion, obtener_filas)
+        self.padre.after(INTERVALO_COLA_LISTA_MS, self._revisar_cola)
+
+    def mostrar_mensaje(self, mensaje):
+        self._generacion += 1
+        self._filas, self._visibles = [], []
+        self._cargando = False
+        self._dibujar()
+        self.var_estado.set(mensaje)
+
+    def _producir(self, generacion, obtener_filas):
         try:
-            with open(RUTA_USUARIOS, 'r') as f:
-                usuarios = json.load(f)
-                if PROPIETARIO_DEFECTO not in usuarios:
-                    usuarios[PROPIETARIO_DEFECTO] = self._hash_contrasena(CONTRASENA_DEFECTO)
-                return usuarios
-        except Exception:
-            return {PROPIETARIO_DEFECTO: self._hash_contrasena(CONTRASENA_DEFECTO)}
-
-    def _guardar_usuarios(self):
-        with open(RUTA_USUARIOS, 'w') as f:
-            json.dump(self.usuarios_registrados, f, indent=4)
-
-    def _hash_contrasena(self, contrasena):
-        return contrasena[::-1] + '_hash'
-
-    def verificar_credenciales(self, nombre_usuario, contrasena):
-        nombre_usuario = nombre_usuario.lower()
-        if nombre_usuario in self.usuarios_registrados:
-            contrasena_hash = self._hash_contrasena(contrasena)
-            return self.usuarios_registrados[nombre_usuario] == contrasena_hash
-        return False
-
-    def registrar_usuario(self, nombre_usuario, contrasena):
-        nombre_usuario = nombre_usuario.lower()
-        if nombre_usuario not in self.usuarios_registrados:
-            self.usuarios_registrados[nombre_usuario] = self._hash_contrasena(contrasena)
-            self._guardar_usuarios()
-            return True
-        return False
-
-    def _guardar_entrada_fat(self, nombre_archivo, entrada):
-        ruta = os.path.join(DIR_FAT, f"{nombre_archivo}.json")
-        with open(ruta, 'w') as f:
-            json.dump(entrada, f, indent=4)
-
-    def _cargar_entrada_fat(self, nombre_archivo):
-        ruta = os.path.join(DIR_FAT, f"{nombre_archivo}.json")
-        if not os.path.exists(ruta):
-            return None
-        with open(ruta, 'r') as f:
-            return json.load(f)
-
-    def _guardar_bloque_datos(self, nombre_bloque, datos_bloque):
-        ruta = os.path.join(DIR_DATOS, f"{nombre_bloque}.json")
-        with open(ruta, 'w') as f:
-            json.dump(datos_bloque, f, indent=4)
-        return ruta
-
-    def _eliminar_bloque_datos(self, ruta_bloque):
-        if os.path.exists(ruta_bloque):
-            os.remove(ruta_bloque)
-
-    def _generar_bloques(self, contenido):
-        bloques = [contenido[i:i + TAMAÑO_BLOQUE] for i in range(0, len(contenido), TAMAÑO_BLOQUE)]
-        timestamp = int(time.time() * 1000)
-        referencias_bloque = []
-        for i, datos_bloque in enumerate(bloques):
-            nombre_bloque = f"bloque_{timestamp}_{i}"
-            ruta_bloque = os.path.join(DIR_DATOS, f"{nombre_bloque}.json")
-            siguiente_ruta = os.path.join(DIR_DATOS, f"bloque_{timestamp}_{i+1}.json") if i < len(bloques) - 1 else None
-            entrada_bloque = {
-                "datos": datos_bloque,
-                "siguiente_archivo": siguiente_ruta,
-                "eof": (i == len(bloques) - 1)
-            }
-            self._guardar_bloque_datos(nombre_bloque, entrada_bloque)
-            referencias_bloque.append(ruta_bloque)
-        return referencias_bloque
-
-    def _leer_contenido_completo(self, ruta_primer_bloque):
-        ruta_actual = ruta_primer_bloque
-        contenido_completo = ""
-        rutas_bloques = []
-        while ruta_actual:
+            filas = obtener_filas()
+        except Exception as error:
+            self._cola.put((generacion, error, 0))
+            return
+        for inicio in range(0, len(filas), FILAS_POR_PAGINA_LISTA):
+            if generacion != self._generacion:
+                return
+            self._cola.put((generacion, filas[inicio:inicio + FILAS_POR_PAGINA_LISTA], len(filas)))
+        self._cola.put((generacion, None, len(filas)))
+
+    def _revisar_cola(self):
+        if not self.arbol.winfo_exists():
+            return
+        for _ in range(PAGINAS_POR_CICLO_LISTA):
             try:
-                with open(ruta_actual, 'r') as f: bloque = json.load(f)
-            except Exception:
+                generacion, pagina, total = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if generacion != self._generacion:
+                continue
+            if isinstance(pagina, Exception):
+                self._cargando = False
+                self.var_estado.set(f"Error al listar: {pagina}")
+                return
+            self._total = total
+            if pagina is None:
+                self._cargando = False
+                self._ordenar_visibles()
                 break
+            self._filas.extend(pagina)
+            self._visibles.extend(fila for fila in pagina if self._filtro in fila[1])
+        self.progreso.config(maximum=max(self._total, 1), value=len(self._filas) if self._cargando else max(self._total, 1))
+        self._actualizar_estado()
+        self._dibujar()
+        if self._cargando:
+            self.padre.after(INTERVALO_COLA_LISTA_MS, self._revisar_cola)
+
+    def _actualizar_estado(self):
+        if self._cargando:
+            self.var_estado.set(f"Cargando {len(self._filas)} de {self._total}...")
+        elif self._filtro:
+            self.var_estado.set(f"{len(self._visibles)} de {len(self._filas)} archivos")
+        else:
+            self.var_estado.set(f"{len(self._filas)} archivos")
+
+    def _programar_filtro(self):
+        #Se espera a que el usuario deje de escribir antes de volver a filtrar
+        if self._filtro_pendiente is not None:
+            self.padre.after_cancel(self._filtro_pendiente)
+        self._filtro_pendiente = self.padre.after(RETARDO_FILTRO_MS, self._aplicar_filtro)
+
+    def _aplicar_filtro(self):
+        self._filtro_pendiente = None
+        filtro = self.var_filtro.get().strip().lower()
+        #Si el filtro nuevo extiende al anterior basta con filtrar las filas que ya eran visibles
+        origen = self._visibles if self._filtro and filtro.startswith(self._filtro) else self._filas
+        self._filtro = filtro
+        self._visibles = [fila for fila in origen if filtro in fila[1]]
+        if origen is self._filas:
+            self._ordenar_visibles()
+        self._desplazamiento = 0
+        self._actualizar_estado()
+        self._dibujar()
+
+    def ordenar(self, indice):
+        descendente = self._orden == (indice, False)
+        self._orden = (indice, descendente)
+        self._ordenar_visibles()
+        self._desplazamiento = 0
+        self._dibujar()
+
+    def _ordenar_visibles(self):
+        if self._orden is None:
+            return
+        indice, descendente = self._orden
+        clave = itemgetter(indice)
+        self._visibles.sort(key=lambda fila: clave(fila[0]), reverse=descendente)
+
+    def _dibujar(self):
+        ventana = self._visibles[self._desplazamiento:self._desplazamiento + self.alto]
+        items = self.arbol.get_children()
+        if len(items) > len(ventana):
+            self.arbol.delete(*items[len(ventana):])
+        for _ in range(len(items), len(ventana)):
+            self.arbol.insert('', 'end')
+        seleccionado = None
+        for item, (valores, _) in zip(self.arbol.get_children(), ventana):
+            etiquetas = (self._etiquetar(valores),) if self._etiquetar else ()
+            self.arbol.item(item, values=valores, tags=etiquetas)
+            if valores[0] == self._seleccion:
+                seleccionado = item
+        if seleccionado:
+            self.arbol.selection_set(seleccionado)
+        elif self.arbol.selection():
+            self.arbol.selection_remove(*self.arbol.selection())
+        total = len(self._visibles)
+        if total:
+            self.barra.set(self._desplazamiento / total, min(1.0, (self._desplazamiento + self.alto) / total))
+        else:
+            self.barra.set(0.0, 1.0)
+
+    def _limitar(self, desplazamiento):
+        return max(0, min(desplazamiento, len(self._visibles) - self.alto))
+
+    def _desplazar(self, accion, cantidad, unidad=None):
+        if accion == 'moveto':
+            self._desplazamiento = self._limitar(int(float(cantidad) * len(self._visibles)))
+        else:
+            paso = self.alto if unidad == 'pages' else 1
+            self._desplazamiento = self._limitar(self._desplazamiento + int(cantidad) * paso)
+        self._dibujar()
+
+    def _rodar(self, pasos):
+        self._desplazamiento = self._limitar(self._desplazamiento + 3 * pasos)
+        self._dibujar()
+        return "break"
+
+    def _al_redimensionar(self, evento):
+        #La ventana de filas dibujadas sigue al alto real del Treeview; se descuenta una fila para el encabezado
+        alto_fila = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        alto = max(1, evento.height // alto_fila - 1)
+        if alto != self.alto:
+            self.alto = alto
+            self._desplazamiento = self._limitar(self._desplazamiento)
+            self._dibujar()
+
+    def _al_seleccionar(self, evento):
+        #Deseleccionar al desplazar no borra la seleccion: la fila puede haber quedado fuera de la ventana
+        items = self.arbol.selection()
+        if items:
+            valores = self.arbol.item(items[0], 'values')
+            if valores:
+                self._seleccion = valores[0]
+
+    def _mover_seleccion(self, paso):
+        if not self._visibles:
+            return "break"
+        nombres = [valores[0] for valores, _ in self._visibles]
+        indice = nombres.index(self._seleccion) + paso if self._seleccion in nombres else 0
+        indice = max(0, min(len(nombres) - 1, indice))
+        self._seleccion = nombres[indice]
+        if not self._desplazamiento <= indice < self._desplazamiento + self.alto:
+            self._desplazamiento = self._limitar(indice - (self.alto - 1 if paso > 0 else 0))
+        self._dibujar()
+        return "break"
+
+    def seleccion(self):
+        if self._seleccion is None:
+            return None
+        if any(valores[0] == self._seleccion for valores, _ in self._visibles):
+            return self._seleccion
+        return None
 
-            contenido_completo += bloque["datos"]
-            rutas_bloques.append(ruta_actual)
-            if bloque["eof"]:
-                ruta_actual = None
-            else:
-                ruta_actual = bloque["siguiente_archivo"]
-        return contenido_completo, rutas_bloques
-
-    def crear_archivo(self, nombre_archivo, contenido):
-        if self._cargar_entrada_fat(nombre_archivo):
-            return False, "El archivo ya existe."
-        propietario_archivo = self.usuario_actual
-        if not propietario_archivo:
-            return False, "Usuario no logueado."
-        rutas_bloques = self._generar_bloques(contenido)
-        if not rutas_bloques:
-            return False, "El contenido del archivo es inválido."
-        ahora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entrada_fat = {
-            "nombre": nombre_archivo,
-            "ruta_datos_inicial": rutas_bloques[0],
-            "estado_papelera": False,
-            "cant_caracteres": len(contenido),
-            "fecha_creacion": ahora,
-            "fecha_modificacion": ahora,
-            "fecha_eliminacion": None,
-            "propietario": propietario_archivo,
-            "permisos": {"lectura": [propietario_archivo], "escritura": [propietario_archivo]}
-        }
-        self._guardar_entrada_fat(nombre_archivo, entrada_fat)
-        return True, "Archivo creado exitosamente."
-
-    def listar_archivos(self, incluir_eliminados=False):
-        archivos = []
-        for nombre_archivo_json in os.listdir(DIR_FAT):
-            if nombre_archivo_json.endswith(".json"):
-                nombre = nombre_archivo_json.replace(".json", "")
-                entrada = self._cargar_entrada_fat(nombre)
-                if entrada and (incluir_eliminados or not entrada.get("estado_papelera", False)):
-                    archivos.append(entrada)
-        return archivos
-
-    def obtener_contenido_archivo(self, nombre_archivo):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada or entrada.get("estado_papelera"):
-            return None, "Archivo no encontrado o en papelera."
-        if not self.verificar_permisos(nombre_archivo, "lectura"):
-            return None, "Permiso de lectura denegado."
-        contenido, _ = self._leer_contenido_completo(entrada["ruta_datos_inicial"])
-        metadata = {
-            "Nombre": entrada["nombre"],
-            "Propietario": entrada["propietario"],
-            "Tamaño (chars)": entrada["cant_caracteres"],
-            "Creación": entrada["fecha_creacion"],
-            "Modificación": entrada["fecha_modificacion"],
-            "Permisos (Lectura)": ", ".join(entrada["permisos"]["lectura"]),
-            "Permisos (Escritura)": ", ".join(entrada["permisos"]["escritura"]),
-        }
-        return metadata, contenido
-
-    def modificar_archivo(self, nombre_archivo, nuevo_contenido):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada or entrada.get("estado_papelera"):
-            return False, "Archivo no encontrado o en papelera."
-        if not self.verificar_permisos(nombre_archivo, "escritura"):
-            return False, "Permiso de escritura denegado."
-        _, rutas_bloques_viejas = self._leer_contenido_completo(entrada["ruta_datos_inicial"])
-        for ruta in rutas_bloques_viejas: self._eliminar_bloque_datos(ruta)
-
-        rutas_bloques_nuevas = self._generar_bloques(nuevo_contenido)
-        if not rutas_bloques_nuevas:
-            return False, "Error: El nuevo contenido del archivo es inválido."
-
-        entrada["ruta_datos_inicial"] = rutas_bloques_nuevas[0]
-        entrada["cant_caracteres"] = len(nuevo_contenido)
-        entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self._guardar_entrada_fat(nombre_archivo, entrada)
-        return True, "Archivo modificado exitosamente."
-
-    def eliminar_archivo(self, nombre_archivo):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada or entrada.get("estado_papelera"):
-            return False, "Error: Archivo no encontrado o ya en papelera."
-        if entrada["propietario"] != self.usuario_actual:
-            return False, "Error: Solo el propietario puede eliminar el archivo."
-
-        entrada["estado_papelera"] = True
-        entrada["fecha_eliminacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self._guardar_entrada_fat(nombre_archivo, entrada)
-        return True, "Archivo movido a la papelera."
-
-    def recuperar_archivo(self, nombre_archivo):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada or not entrada.get("estado_papelera"):
-            return False, "Archivo no encontrado o no está en papelera."
-        if entrada["propietario"] != self.usuario_actual:
-            return False, "Solo el propietario puede recuperar el archivo."
-        entrada["estado_papelera"] = False
-        entrada["fecha_eliminacion"] = None
-        entrada["fecha_modificacion"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self._guardar_entrada_fat(nombre_archivo, entrada)
-        return True, "Archivo recuperado exitosamente."
-
-    def verificar_permisos(self, nombre_archivo, tipo_permiso):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada: return False
-        if self.usuario_actual == PROPIETARIO_DEFECTO: return True
-        if self.usuario_actual == entrada["propietario"]: return True
-        return self.usuario_actual in entrada["permisos"].get(tipo_permiso, [])
-
-    def asignar_permisos(self, nombre_archivo, usuario_destino, tipo_permiso, accion="agregar"):
-        entrada = self._cargar_entrada_fat(nombre_archivo)
-        if not entrada: return False, "Archivo no encontrado."
-        if self.usuario_actual != entrada["propietario"] and self.usuario_actual != PROPIETARIO_DEFECTO:
-            return False, "Solo el propietario o el administrador pueden modificar permisos."
-        lista_permisos = entrada["permisos"].get(tipo_permiso)
-        if usuario_destino == entrada["propietario"]:
-            return False, "No puede modificar los permisos del propietario desde esta interfaz."
-        if accion == "agregar":
-            if usuario_destino not in lista_permisos:
-                lista_permisos.append(usuario_destino)
-                self._guardar_entrada_fat(nombre_archivo, entrada)
-                return True, f"Permiso de '{tipo_permiso}' asignado a {usuario_destino}."
-            return False, f"El usuario {usuario_destino} ya tiene permiso de '{tipo_permiso}'."
-        elif accion == "revocar":
-            if usuario_destino in lista_permisos:
-                lista_permisos.remove(usuario_destino)
-                self._guardar_entrada_fat(nombre_archivo, entrada)
-                return True, f"Permiso de '{tipo_permiso}' revocado a {usuario_destino}."
-            return False, f"El usuario {usuario_destino} no tenía permiso de '{tipo_permiso}'."
-        return False, "Acción de permiso no válida."
 
 #INterfaz
 class InterfazFAT:
@@ -261,6 +268,9 @@ class InterfazFAT:
         self.style.configure('TLabelframe.Label', background=COLOR_MARCO_OSCURO, foreground=COLOR_ACCENTO_USUARIO)
         self.style.configure('TButton', background=COLOR_ACCION_PRIMARIA, foreground=COLOR_FONDO_OSCURO, font=('Helvetica', 10, 'bold'), bordercolor=COLOR_ACCION_PRIMARIA, borderwidth=0, relief='flat')
         self.style.map('TButton', background=[('active', COLOR_ACCION_PRIMARIA)])
+        self.style.configure('Treeview', background=COLOR_MARCO_OSCURO, fieldbackground=COLOR_MARCO_OSCURO, foreground=COLOR_TEXTO_CLARO)
+        self.style.configure('Treeview.Heading', background=COLOR_FONDO_OSCURO, foreground=COLOR_ACCENTO_USUARIO)
+        self.style.map('Treeview', background=[('selected', COLOR_ACCION_PRIMARIA)], foreground=[('selected', COLOR_FONDO_OSCURO)])
         self._centrar_ventana(master, ancho=750, alto=550)
         self.login_frame = None
         self._mostrar_login_frame()
@@ -392,24 +402,27 @@ class InterfazFAT:
         ttk.Label(frame_usuario, textvariable=self.var_usuario_actual, foreground=COLOR_ACCENTO_USUARIO, font=('Helvetica', 10, 'bold')).pack(side=tk.LEFT)
         ttk.Button(frame_usuario, text="Cerrar Sesión", command=self._mostrar_login_frame).pack(side=tk.RIGHT, padx=5)
         ttk.Button(frame_usuario, text="Cambiar Usuario", command=self._mostrar_dialogo_cambio_usuario).pack(side=tk.RIGHT, padx=5)
+        #Por defecto se listan todos los archivos, como siempre; marcado, solo los que el usuario puede leer
+        self.var_solo_legibles = tk.BooleanVar(self.master, value=False)
+        ttk.Checkbutton(frame_usuario, text="Solo legibles", variable=self.var_solo_legibles,
+                        command=self.actualizar_lista_archivos).pack(side=tk.RIGHT, padx=5)
 
         frame_lista = ttk.LabelFrame(self.master, text="Archivos en el Sistema", padding=10)
         frame_lista.pack(padx=10, pady=5, fill='both', expand=True)
-        self.lista_archivos_box = tk.Listbox(frame_lista, height=15, bg=COLOR_MARCO_OSCURO, fg=COLOR_TEXTO_CLARO, selectbackground=COLOR_ACCION_PRIMARIA, selectforeground=COLOR_FONDO_OSCURO, highlightthickness=0)
-        self.lista_archivos_box.pack(side="left", fill="both", expand=True)
-
-        scrollbar = ttk.Scrollbar(frame_lista, orient="vertical")
-        scrollbar.config(command=self.lista_archivos_box.yview)
-        scrollbar.pack(side="right", fill="y")
-        self.lista_archivos_box.config(yscrollcommand=scrollbar.set)
+        columnas = [("nombre", "Nombre", 300), ("estado", "Estado", 70), ("propietario", "Propietario", 120),
+                    ("tamaño", "Tamaño", 90), ("modificacion", "Modificación", 150)]
+        self.lista_archivos = ListaVirtual(frame_lista, columnas, self.sistema_fat.enviar,
+                                           etiquetar=lambda valores: 'elim' if valores[1] == 'ELIM' else 'ok')
 
         frame_botones = ttk.Frame(self.master, padding=5)
         frame_botones.pack(fill='x')
         ttk.Button(frame_botones, text="Crear Archivo", command=self.gui_crear_archivo).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(frame_botones, text="Abrir", command=self.gui_abrir_archivo).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(frame_botones, text="Modificar", command=self.gui_modificar_archivo).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(frame_botones, text="Anexar", command=self.gui_agregar_contenido).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(frame_botones, text="Eliminar", command=self.gui_eliminar_archivo).pack(side=tk.LEFT, padx=5, pady=5)
         ttk.Button(frame_botones, text="Ver Papelera", command=self.gui_ver_papelera).pack(side=tk.LEFT, padx=5, pady=5)
+        ttk.Button(frame_botones, text="Estadísticas", command=self.gui_ver_estadisticas).pack(side=tk.LEFT, padx=5, pady=5)
 
         self.style.configure('Special.TButton', background=COLOR_ADVERTENCIA, foreground=COLOR_FONDO_OSCURO)
         self.style.map('Special.TButton', background=[('active', COLOR_ADVERTENCIA)])
@@ -431,33 +444,32 @@ class InterfazFAT:
         self.boton_permisos.config(state=tk.NORMAL if es_admin else tk.DISABLED)
 
     def actualizar_lista_archivos(self, incluir_eliminados=False):
-        self.lista_archivos_box.delete(0, tk.END)
         if not self.sistema_fat.usuario_actual:
-            self.lista_archivos_box.insert(0, "Inicie sesión para ver los archivos.")
-            self.lista_archivos_box.itemconfig(0, {'fg': COLOR_ADVERTENCIA})
+            self.lista_archivos.mostrar_mensaje("Inicie sesión para ver los archivos.")
             return
 
-        archivos = self.sistema_fat.listar_archivos(incluir_eliminados=incluir_eliminados)
+        legible_por = self._filtro_legibles()
 
-        for i, entrada_archivo in enumerate(archivos):
-            estado = f"[{'ELIM' if entrada_archivo.get('estado_papelera') else 'OK'}]"
-            display_text = f"{estado} {entrada_archivo['nombre']} (Propietario: {entrada_archivo['propietario']})"
-            self.lista_archivos_box.insert(i, display_text)
-
-            if entrada_archivo.get('estado_papelera'):
-                self.lista_archivos_box.itemconfig(i, {'fg': COLOR_ADVERTENCIA})
-            elif estado == "[OK]":
-                self.lista_archivos_box.itemconfig(i, {'fg': COLOR_ACCION_PRIMARIA})
+        def obtener_filas():
+            filas = []
+            _, entradas = self.sistema_fat.consultar(en_papelera=None if incluir_eliminados else False, legible_por=legible_por)
+            for entrada_archivo in entradas:
+                valores = (entrada_archivo['nombre'], 'ELIM' if entrada_archivo.get('estado_papelera') else 'OK',
+                           entrada_archivo['propietario'], entrada_archivo['cant_caracteres'], entrada_archivo['fecha_modificacion'])
+                filas.append((valores, f"{valores[0]}\0{valores[2]}".lower()))
+            return filas
+        self.lista_archivos.cargar(obtener_filas)
 
+    def _filtro_legibles(self):
+        #Se lee aqui, en el hilo de Tk: las filas se cargan en el pool. Los conjuntos por usuario del catalogo
+        #resuelven el filtro de una vez
+        return self.sistema_fat.usuario_actual if self.var_solo_legibles.get() else None
 
     def obtener_nombre_archivo_seleccionado(self):
-        indices_seleccionados = self.lista_archivos_box.curselection()
-        if not indices_seleccionados:
+        nombre_archivo = self.lista_archivos.seleccion()
+        if not nombre_archivo:
             messagebox.showwarning("Selección", "Por favor, selecciona un archivo de la lista.")
             return None
-
-        texto_seleccionado = self.lista_archivos_box.get(indices_seleccionados[0]).split('(Propietario:')[0].strip()
-        nombre_archivo = ' '.join(texto_seleccionado.split()[1:]).strip()
         return nombre_archivo
 
     def gui_crear_archivo(self):
@@ -477,9 +489,11 @@ class InterfazFAT:
         if not nombre_archivo:
             return
 
-        metadata, contenido_o_error = self.sistema_fat.obtener_contenido_archivo(nombre_archivo)
+        #La primera pagina se lee por posicion para mostrarla de inmediato
+        metadata, pagina_o_error = self.sistema_fat.leer_rango(nombre_archivo, 0, TAMAÑO_PAGINA_VISTA)
 
         if metadata:
+            _, fragmentos = self.sistema_fat.abrir_lectura(nombre_archivo, desde=len(pagina_o_error))
             meta_str = "\n".join([f"    {k}: {v}" for k, v in metadata.items()])
 
             ventana_ver = tk.Toplevel(self.master)
@@ -491,15 +505,28 @@ class InterfazFAT:
             scrolled_text.insert(tk.END, "--- METADATOS ---\n", 'titulo')
             scrolled_text.insert(tk.END, f"{meta_str}\n\n")
             scrolled_text.insert(tk.END, "--- CONTENIDO ---\n", 'titulo')
-            scrolled_text.insert(tk.END, contenido_o_error)
+            scrolled_text.insert(tk.END, pagina_o_error)
             scrolled_text.tag_config('titulo', font=('TkDefaultFont', 10, 'bold'), foreground=COLOR_ACCENTO_USUARIO)
             scrolled_text.config(state=tk.DISABLED)
 
+            #El contenido se inserta por fragmentos para no bloquear la ventana con archivos grandes
+            def insertar_siguiente_fragmento():
+                if not scrolled_text.winfo_exists():
+                    return
+                fragmento = next(fragmentos, None)
+                if fragmento is None:
+                    return
+                scrolled_text.config(state=tk.NORMAL)
+                scrolled_text.insert(tk.END, fragmento)
+                scrolled_text.config(state=tk.DISABLED)
+                ventana_ver.after(1, insertar_siguiente_fragmento)
+
+            insertar_siguiente_fragmento()
             ttk.Button(ventana_ver, text="Cerrar", command=ventana_ver.destroy).pack(pady=5)
             self._centrar_ventana(ventana_ver, ancho=600, alto=450)
 
         else:
-            messagebox.showerror("Error al Abrir", contenido_o_error)
+            messagebox.showerror("Error al Abrir", pagina_o_error)
 
     def gui_modificar_archivo(self):
 
@@ -534,6 +561,18 @@ class InterfazFAT:
         ttk.Button(ventana_mod, text="Guardar Cambios", command=guardar_cambios).pack(pady=10)
         self._centrar_ventana(ventana_mod, ancho=600, alto=450)
 
+    def gui_agregar_contenido(self):
+        nombre_archivo = self.obtener_nombre_archivo_seleccionado()
+        if not nombre_archivo: return
+        texto = simpledialog.askstring("Anexar", f"Introduce el texto a agregar al final de '{nombre_archivo}':", initialvalue="")
+        if not texto: return
+        exito, mensaje = self.sistema_fat.agregar_contenido(nombre_archivo, texto)
+        if exito:
+            messagebox.showinfo("Éxito", mensaje)
+            self.actualizar_lista_archivos()
+        else:
+            messagebox.showerror("Error al Anexar", mensaje)
+
     def gui_eliminar_archivo(self):
         nombre_archivo = self.obtener_nombre_archivo_seleccionado()
         if not nombre_archivo:
@@ -553,23 +592,28 @@ class InterfazFAT:
         ventana_papelera.config(bg=COLOR_FONDO_OSCURO)
 
         tk.Label(ventana_papelera, text="Archivos en Papelera:", bg=COLOR_FONDO_OSCURO, fg=COLOR_TEXTO_CLARO).pack(padx=10, pady=5)
-        lista_papelera_box = tk.Listbox(ventana_papelera, height=10, width=50, bg=COLOR_MARCO_OSCURO, fg=COLOR_TEXTO_CLARO, selectbackground=COLOR_ADVERTENCIA, selectforeground=COLOR_FONDO_OSCURO)
-        lista_papelera_box.pack(padx=10, pady=5)
-
-        archivos_en_papelera = [f for f in self.sistema_fat.listar_archivos(incluir_eliminados=True) if f.get("estado_papelera")]
-
-        for i, entrada_archivo in enumerate(archivos_en_papelera):
-            lista_papelera_box.insert(i, f"[ELIM] {entrada_archivo['nombre']} (Eliminado: {entrada_archivo['fecha_eliminacion']})")
-            lista_papelera_box.itemconfig(i, {'fg': COLOR_ADVERTENCIA})
+        frame_papelera = ttk.Frame(ventana_papelera, padding=5)
+        frame_papelera.pack(padx=10, pady=5, fill='both', expand=True)
+        columnas = [("nombre", "Nombre", 220), ("propietario", "Propietario", 100), ("eliminacion", "Eliminado", 150)]
+        lista_papelera = ListaVirtual(frame_papelera, columnas, self.sistema_fat.enviar, alto=10, etiquetar=lambda valores: 'elim')
+
+        legible_por = self._filtro_legibles()
+
+        def obtener_filas():
+            filas = []
+            _, entradas = self.sistema_fat.consultar(en_papelera=True, legible_por=legible_por)
+            for entrada_archivo in entradas:
+                valores = (entrada_archivo['nombre'], entrada_archivo['propietario'], entrada_archivo['fecha_eliminacion'])
+                filas.append((valores, f"{valores[0]}\0{valores[1]}".lower()))
+            return filas
+        lista_papelera.cargar(obtener_filas)
 
         def recuperar_seleccionado():
-            indices_seleccionados = lista_papelera_box.curselection()
-            if not indices_seleccionados:
+            nombre_archivo_a_recuperar = lista_papelera.seleccion()
+            if not nombre_archivo_a_recuperar:
                 messagebox.showwarning("Selección", "Por favor, selecciona un archivo para recuperar.")
                 return
 
-            texto_seleccionado = lista_papelera_box.get(indices_seleccionados[0]).split('(Eliminado:')[0].strip()
-            nombre_archivo_a_recuperar = texto_seleccionado.replace('[ELIM]', '').strip()
             exito, mensaje = self.sistema_fat.recuperar_archivo(nombre_archivo_a_recuperar)
 
             if exito:
@@ -579,8 +623,25 @@ class InterfazFAT:
             else:
                 messagebox.showerror("Error al Recuperar", mensaje)
 
+        def purgar_seleccionado():
+            nombre_archivo_a_purgar = lista_papelera.seleccion()
+            if not nombre_archivo_a_purgar:
+                messagebox.showwarning("Selección", "Por favor, selecciona un archivo para eliminar definitivamente.")
+                return
+
+            if not messagebox.askyesno("Eliminar Definitivamente", f"¿Eliminar '{nombre_archivo_a_purgar}' sin posibilidad de recuperarlo?"):
+                return
+            exito, mensaje = self.sistema_fat.purgar_archivo(nombre_archivo_a_purgar)
+
+            if exito:
+                messagebox.showinfo("Éxito", mensaje)
+                lista_papelera.cargar(obtener_filas)
+            else:
+                messagebox.showerror("Error al Eliminar", mensaje)
+
         ttk.Button(ventana_papelera, text="Recuperar Archivo", command=recuperar_seleccionado).pack(pady=10)
-        self._centrar_ventana(ventana_papelera, ancho=450, alto=350)
+        ttk.Button(ventana_papelera, text="Eliminar Definitivamente", command=purgar_seleccionado).pack(pady=5)
+        self._centrar_ventana(ventana_papelera, ancho=550, alto=450)
 
 
     def gui_gestionar_permisos(self):
@@ -656,6 +717,64 @@ class InterfazFAT:
         ttk.Button(ventana_permisos, text="Aplicar Cambios", command=confirmar_cambios_central).grid(row=4, column=0, columnspan=3, pady=10)
         self._centrar_ventana(ventana_permisos, ancho=450, alto=300)
 
-root = tk.Tk()
-app = InterfazFAT(root)
-root.mainloop()
\ No newline at end of file
+    def gui_ver_estadisticas(self):
+        #Panel de metricas del motor; se refresca solo mientras la ventana esta abierta
+        metricas = self.sistema_fat.metricas
+        ventana_estadisticas = tk.Toplevel(self.master)
+        ventana_estadisticas.title("Estadísticas del Sistema")
+        ventana_estadisticas.config(bg=COLOR_FONDO_OSCURO)
+
+        var_activas = tk.BooleanVar(ventana_estadisticas, value=metricas.activas)
+        def alternar_medicion():
+            metricas.activas = var_activas.get()
+        ttk.Checkbutton(ventana_estadisticas, text="Medir operaciones", variable=var_activas, command=alternar_medicion).pack(anchor='w', padx=10, pady=5)
+
+        frame_operaciones = ttk.LabelFrame(ventana_estadisticas, text="Latencia por operación (ms)", padding=5)
+        frame_operaciones.pack(padx=10, pady=5, fill='both', expand=True)
+        columnas = [("operacion", "Operación", 200), ("cuenta", "Cuenta", 70), ("p50", "p50", 70),
+                    ("p99", "p99", 70), ("max", "Máx", 70), ("total", "Total", 80)]
+        arbol_operaciones = ttk.Treeview(frame_operaciones, columns=[c for c, _, _ in columnas], show='headings', height=8)
+        for clave, titulo, ancho in columnas:
+            arbol_operaciones.heading(clave, text=titulo)
+            arbol_operaciones.column(clave, width=ancho, anchor='w' if clave == "operacion" else 'e')
+        arbol_operaciones.pack(fill='both', expand=True)
+
+        frame_contadores = ttk.LabelFrame(ventana_estadisticas, text="Contadores de E/S", padding=5)
+        frame_contadores.pack(padx=10, pady=5, fill='x')
+        var_contadores = tk.StringVar(ventana_estadisticas)
+        ttk.Label(frame_contadores, textvariable=var_contadores, justify=tk.LEFT, font=('Courier', 9)).pack(anchor='w')
+
+        def refrescar():
+            if not ventana_estadisticas.winfo_exists():
+                return
+            instantanea = metricas.instantanea()
+            arbol_operaciones.delete(*arbol_operaciones.get_children())
+            for nombre, histograma in instantanea["operaciones"].items():
+                arbol_operaciones.insert('', tk.END, values=(nombre, histograma["cuenta"], f"{histograma['p50_ms']:.3f}",
+                                                             f"{histograma['p99_ms']:.3f}", f"{histograma['max_ms']:.3f}", f"{histograma['total_ms']:.1f}"))
+            cache = self.sistema_fat.estadisticas_cache()
+            lineas = [f"{clave:<22}{valor}" for clave, valor in instantanea["contadores"].items()]
+            lineas.append(f"{'aciertos_cache':<22}{cache['tasa_aciertos']:.1%}")
+            var_contadores.set("\n".join(lineas))
+            ventana_estadisticas.after(INTERVALO_ESTADISTICAS_MS, refrescar)
+
+        def exportar():
+            ruta = filedialog.asksaveasfilename(parent=ventana_estadisticas, defaultextension=".json",
+                                                filetypes=[("JSON", "*.json")], initialfile="metricas_fat.json")
+            if ruta:
+                metricas.exportar(ruta)
+                messagebox.showinfo("Éxito", f"Métricas exportadas a {ruta}.", parent=ventana_estadisticas)
+
+        frame_botones = ttk.Frame(ventana_estadisticas, padding=5)
+        frame_botones.pack(fill='x')
+        ttk.Button(frame_botones, text="Reiniciar", command=metricas.reiniciar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botones, text="Exportar JSON", command=exportar).pack(side=tk.LEFT, padx=5)
+        ttk.Button(frame_botones, text="Cerrar", command=ventana_estadisticas.destroy).pack(side=tk.RIGHT, padx=5)
+        refrescar()
+        self._centrar_ventana(ventana_estadisticas, ancho=650, alto=500)
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    app = InterfazFAT(root)
+    root.mainloop()
+    app.sistema_fat.cerrar()
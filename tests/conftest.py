@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+#Los modulos del proyecto estan en la raiz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor_fat import CONTRASENA_DEFECTO, PROPIETARIO_DEFECTO, SistemaFAT
+
+
+@pytest.fixture
+def abrir(tmp_path):
+    #Abre (o reabre) un volumen de la prueba en tmp_path/nombre; al terminar cierra los que sigan abiertos
+    abiertos = []
+
+    def abrir_volumen(nombre="volumen", **opciones):
+        sistema = SistemaFAT(raiz=str(tmp_path / nombre), **opciones)
+        abiertos.append(sistema)
+        return sistema, sistema.abrir_sesion(PROPIETARIO_DEFECTO, CONTRASENA_DEFECTO)
+    yield abrir_volumen
+    for sistema in abiertos:
+        if not sistema.diario._cerrado:
+            sistema.cerrar()
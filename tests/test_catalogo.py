@@ -0,0 +1,59 @@
+from motor_fat import CatalogoFAT, CodecEntrada
+
+ENTRADA = {
+    "nombre": "informe.txt",
+    "ruta_datos_inicial": 7,
+    "estado_papelera": False,
+    "cant_caracteres": 70000,
+    "fecha_creacion": "2024-03-01 10:15:00",
+    "fecha_modificacion": "2024-03-02 08:00:30",
+    "fecha_eliminacion": None,
+    "propietario": "ana",
+    "permisos": {"lectura": ["ana", "luis"], "escritura": ["ana"]},
+    "extensiones": [[7, 3], [20, 1]],
+    "marcos": [[32768, 5, "zlib"], [4464, 2, None]],
+    "revision": 3,
+}
+
+
+def test_codec_ida_y_vuelta():
+    codec = CodecEntrada()
+    #Los campos que no tienen forma binaria viajan como JSON junto al registro
+    rara = dict(ENTRADA, fecha_creacion="ayer", etiquetas=["a", "b"], extensiones=[[1, -2]])
+    for entrada in (ENTRADA, rara, {"nombre": "otro"}, {}):
+        vista = memoryview(codec.codificar(entrada.get("nombre", "sin_nombre"), entrada))
+        assert codec.decodificar(vista) == (entrada.get("nombre", "sin_nombre"), entrada)
+
+
+def test_catalogo_persiste_entradas_y_borrados(tmp_path):
+    ruta = str(tmp_path / "catalogo.log")
+    catalogo = CatalogoFAT(ruta)
+    catalogo.guardar("informe.txt", ENTRADA)
+    catalogo.guardar("borrador", dict(ENTRADA, nombre="borrador", propietario="luis"))
+    catalogo.eliminar("borrador")
+    catalogo.cerrar()
+
+    catalogo = CatalogoFAT(ruta)
+    assert catalogo.entradas == {"informe.txt": ENTRADA}
+    assert catalogo.indices.por_propietario == {"ana": {"informe.txt"}}
+    catalogo.cerrar()
+
+
+def test_registro_con_crc_invalido_se_descarta(tmp_path):
+    ruta = tmp_path / "catalogo.log"
+    catalogo = CatalogoFAT(str(ruta))
+    catalogo.guardar("a", dict(ENTRADA, nombre="a"))
+    catalogo.guardar("b", dict(ENTRADA, nombre="b"))
+    catalogo.cerrar()
+    datos = bytearray(ruta.read_bytes())
+    datos[-1] ^= 0xFF
+    ruta.write_bytes(bytes(datos))
+
+    catalogo = CatalogoFAT(str(ruta))
+    assert list(catalogo.entradas) == ["a"]
+    #El registro se reescribe sin la cola corrupta, asi lo anexado despues se puede leer
+    catalogo.guardar("c", dict(ENTRADA, nombre="c"))
+    catalogo.cerrar()
+    catalogo = CatalogoFAT(str(ruta))
+    assert list(catalogo.entradas) == ["a", "c"]
+    catalogo.cerrar()
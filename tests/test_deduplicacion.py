@@ -0,0 +1,31 @@
+import motor_fat
+
+CONTENIDO = "a" * motor_fat.TAMAÑO_BLOQUE + "b" * motor_fat.TAMAÑO_BLOQUE + "a" * motor_fat.TAMAÑO_BLOQUE
+
+
+def cuentas(sistema):
+    return sorted(referencia["cuenta"] for referencia in sistema.referencias.entradas.values())
+
+
+def test_bloques_repetidos_se_comparten_y_se_liberan_con_la_ultima_referencia(abrir):
+    sistema, sesion = abrir(deduplicar=True)
+    usados = sistema.asignador.usados
+    assert sesion.crear_archivo("uno", CONTENIDO)[0]
+    assert sesion.crear_archivo("dos", CONTENIDO)[0]
+    assert sistema.asignador.usados == usados + 2
+    assert cuentas(sistema) == [2, 4]
+
+    assert sesion.eliminar_archivo("uno")[0]
+    assert sesion.purgar_archivo("uno")[0]
+    assert cuentas(sistema) == [1, 2]
+    assert sistema.asignador.usados == usados + 2
+    sistema.cerrar()
+
+    sistema, sesion = abrir()
+    assert sesion.obtener_contenido_archivo("dos")[1] == CONTENIDO
+    assert cuentas(sistema) == [1, 2]
+    assert sesion.eliminar_archivo("dos")[0]
+    assert sesion.purgar_archivo("dos")[0]
+    assert sistema.referencias.entradas == {}
+    assert sistema._por_huella == {}
+    assert sistema.asignador.usados == usados
@@ -0,0 +1,58 @@
+import errno
+import threading
+
+import motor_fat
+
+
+def test_fallo_de_fsync_se_informa_y_deshace(abrir, monkeypatch):
+    sistema, sesion = abrir()
+    assert sesion.crear_archivo("previo", "ya estaba")[0]
+    usados = sistema.asignador.usados
+
+    def fallar(descriptor):
+        raise OSError(errno.ENOSPC, "No queda espacio en el dispositivo")
+    monkeypatch.setattr(motor_fat.os, "fsync", fallar)
+    errores = []
+
+    def crear():
+        try:
+            sesion.crear_archivo("nuevo", "x" * 200)
+        except OSError as error:
+            errores.append(error)
+    hilo = threading.Thread(target=crear)
+    hilo.start()
+    hilo.join(10)
+    assert not hilo.is_alive(), "la confirmacion quedo esperando para siempre"
+    assert errores and errores[0].errno == errno.ENOSPC
+    assert sistema.catalogo.obtener("nuevo") is None
+    assert sistema.asignador.usados == usados
+
+    #El hilo de confirmacion sigue vivo: al volver el disco las escrituras funcionan
+    monkeypatch.undo()
+    assert sesion.crear_archivo("despues", "ok")[0]
+    sistema.cerrar()
+    sistema, sesion = abrir()
+    assert sistema.catalogo.obtener("nuevo") is None
+    assert sesion.obtener_contenido_archivo("despues")[1] == "ok"
+    assert sesion.obtener_contenido_archivo("previo")[1] == "ya estaba"
+
+
+def test_registro_sin_aplicar_se_repite_al_abrir(abrir, monkeypatch):
+    sistema, sesion = abrir()
+    assert sesion.crear_archivo("base", "antes del corte")[0]
+    #Caida simulada: el registro llega al diario pero no al almacen ni al catalogo
+    monkeypatch.setattr(sistema, "_aplicar", lambda registro: None)
+    monkeypatch.setattr(sistema.diario, "marcar_aplicado", lambda lsn: None)
+    assert sesion.crear_archivo("pendiente", "solo en el diario")[0]
+    assert sistema.catalogo.obtener("pendiente") is None
+    monkeypatch.undo()
+    sistema.cerrar()
+    #Una escritura interrumpida deja una linea final incompleta que la recuperacion descarta
+    with open(sistema.diario.ruta, "ab") as f:
+        f.write(b'0badc0de {"fat":')
+
+    sistema, sesion = abrir()
+    assert sesion.obtener_contenido_archivo("pendiente")[1] == "solo en el diario"
+    assert sesion.obtener_contenido_archivo("base")[1] == "antes del corte"
+    sistema.cerrar()
+    assert sistema.diario.recuperar() == []
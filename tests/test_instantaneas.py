@@ -0,0 +1,69 @@
+import motor_fat
+
+BLOQUE = motor_fat.TAMAÑO_BLOQUE
+ORIGINAL = "a" * BLOQUE + "b" * BLOQUE + "c" * BLOQUE
+
+
+def purgar(sesion, *nombres):
+    for nombre in nombres:
+        assert sesion.eliminar_archivo(nombre)[0]
+        assert sesion.purgar_archivo(nombre)[0]
+
+
+def test_clon_comparte_bloques_y_cada_uno_se_libera_una_vez(abrir):
+    sistema, sesion = abrir()
+    usados = sistema.asignador.usados
+    assert sesion.crear_archivo("origen", ORIGINAL)[0]
+    assert sesion.clonar_archivo("origen", "clon")[0]
+    assert sistema.asignador.usados == usados + 3
+    assert [r["cuenta"] for r in sistema.referencias.entradas.values()] == [2, 2, 2]
+
+    #Escribir en el clon copia solo el bloque modificado; ese bloque vuelve a tener un unico dueño
+    modificado = "x" * BLOQUE + ORIGINAL[BLOQUE:]
+    assert sesion.modificar_archivo("clon", modificado)[0]
+    assert sistema.asignador.usados == usados + 4
+    assert len(sistema.referencias.entradas) == 2
+    assert sesion.obtener_contenido_archivo("origen")[1] == ORIGINAL
+
+    purgar(sesion, "origen")
+    assert sistema.asignador.usados == usados + 3
+    assert sistema.referencias.entradas == {}
+    assert sesion.obtener_contenido_archivo("clon")[1] == modificado
+    purgar(sesion, "clon")
+    assert sistema.asignador.usados == usados
+    assert sistema.asignador.ids_ocupados() == list(range(usados))
+
+
+def test_restaurar_y_liberar_instantanea(abrir):
+    sistema, sesion = abrir()
+    usados = sistema.asignador.usados
+    assert sesion.crear_archivo("a", ORIGINAL)[0]
+    assert sesion.crear_archivo("b", "bbb")[0]
+    assert sesion.crear_instantanea("s1")[0]
+    assert sesion.modificar_archivo("a", "a cambiado")[0]
+    purgar(sesion, "b")
+    assert sesion.crear_archivo("c", "nuevo")[0]
+    #Los bloques que solo usa la instantanea siguen ocupados
+    assert sistema.asignador.usados == usados + 6
+
+    assert sesion.restaurar_instantanea("s1")[0]
+    assert sesion.obtener_contenido_archivo("a")[1] == ORIGINAL
+    assert sesion.obtener_contenido_archivo("b")[1] == "bbb"
+    assert sistema.catalogo.obtener("c") is None
+    assert sistema.asignador.usados == usados + 4
+
+    #Restauracion de un solo archivo: el resto del volumen no cambia
+    assert sesion.modificar_archivo("a", "otra vez")[0]
+    assert sesion.crear_archivo("d", "se queda")[0]
+    assert sesion.restaurar_instantanea("s1", nombres=["a"])[0]
+    assert sesion.obtener_contenido_archivo("a")[1] == ORIGINAL
+    assert sesion.obtener_contenido_archivo("d")[1] == "se queda"
+
+    purgar(sesion, "a", "b", "d")
+    assert sistema.asignador.usados == usados + 4
+    assert sesion.eliminar_instantanea("s1") == (True, "Instantánea 's1' eliminada (4 bloques liberados).")
+    assert sistema.asignador.usados == usados
+    sistema.cerrar()
+    sistema, sesion = abrir()
+    assert sesion.listar_instantaneas() == []
+    assert sistema.asignador.usados == usados
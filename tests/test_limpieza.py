@@ -0,0 +1,56 @@
+import pytest
+
+
+def test_limpieza_recupera_huerfanos(abrir):
+    sistema, sesion = abrir()
+    assert sesion.crear_archivo("vivo", "contenido que se conserva")[0]
+    usados = sistema.asignador.usados
+    #Restos de escrituras interrumpidas: reservas del asignador sin entrada y un bloque suelto en el almacen
+    reservados = sistema.asignador.reservar(2)
+    suelto = reservados[-1] + 5
+    sistema.almacen.escribir(sistema.almacen.referencia(suelto), {"datos": "perdido", "siguiente_archivo": None, "eof": True})
+
+    informe = sesion.limpiar_volumen()
+    assert informe["bloques_huerfanos"] == 3
+    assert informe["bytes_recuperados"] > 0
+    assert sistema.asignador.usados == usados
+    assert suelto not in sistema.almacen.ids_ocupados()
+    assert sesion.obtener_contenido_archivo("vivo")[1] == "contenido que se conserva"
+    assert sesion.limpiar_volumen()["bloques_huerfanos"] == 0
+
+
+def test_limpieza_purga_la_papelera_vencida(abrir):
+    sistema, sesion = abrir()
+    usados = sistema.asignador.usados
+    for nombre in ("viejo", "reciente"):
+        assert sesion.crear_archivo(nombre, nombre * 10)[0]
+        assert sesion.eliminar_archivo(nombre)[0]
+    entrada = sistema.catalogo.obtener("viejo")
+    sistema.catalogo.guardar("viejo", dict(entrada, fecha_eliminacion="2000-01-01 00:00:00"))
+
+    informe = sesion.limpiar_volumen(retencion_dias=30)
+    assert informe["archivos_purgados"] == 1
+    assert sistema.catalogo.obtener("viejo") is None
+    assert sistema.catalogo.obtener("reciente")["estado_papelera"]
+    assert sesion.recuperar_archivo("reciente")[0]
+    assert sistema.asignador.usados == usados + 4
+
+
+def test_solo_el_administrador_limpia_el_volumen(abrir):
+    sistema, _ = abrir()
+    for nombre in ("bob", "eve"):
+        assert sistema.registrar_usuario(nombre, "clave")
+    bob = sistema.abrir_sesion("bob", "clave")
+    eve = sistema.abrir_sesion("eve", "clave")
+    assert bob.crear_archivo("x", "de bob")[0]
+    assert bob.eliminar_archivo("x")[0]
+    sistema.asignador.reservar(1)
+    usados = sistema.asignador.usados
+
+    with pytest.raises(PermissionError):
+        eve.limpiar_volumen(retencion_dias=0)
+    with pytest.raises(PermissionError):
+        eve.iniciar_limpieza()
+    assert sistema.asignador.usados == usados
+    assert bob.recuperar_archivo("x")[0]
+    assert bob.obtener_contenido_archivo("x")[1] == "de bob"
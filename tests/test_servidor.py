@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from servidor_fat import ClienteFAT, ConexionFAT, ServidorFAT, codificar, leer_mensaje
+
+
+def conversar(sistema, ruta, dialogo):
+    #Levanta el servidor en un socket unix, ejecuta el dialogo del cliente y lo cierra
+    async def principal():
+        servidor = ServidorFAT(sistema)
+        await servidor.iniciar_unix(ruta)
+        try:
+            return await dialogo()
+        finally:
+            await servidor.cerrar()
+    return asyncio.run(principal())
+
+
+def test_peticiones_y_respuestas(abrir, tmp_path):
+    sistema, _ = abrir()
+    ruta = str(tmp_path / "fat.sock")
+    contenido = "linea de prueba\n" * 50
+
+    async def dialogo():
+        cliente = ClienteFAT("admin", "admin", ruta_unix=ruta)
+        try:
+            assert await cliente.crear("notas", contenido) == (True, "Archivo creado exitosamente.")
+            assert (await cliente.crear("notas", "otra vez"))[0] is False
+            assert await cliente.obtener("notas") == contenido
+            assert [f async for f in cliente.leer("notas", tam_fragmento=100)] == [contenido[i:i + 100] for i in range(0, len(contenido), 100)]
+            _, texto = await cliente.leer_rango("notas", 5, 6)
+            assert texto == contenido[5:11]
+            assert [entrada["nombre"] for entrada in await cliente.listar()] == ["notas"]
+            assert await cliente.permisos("notas", "admin", "ejecucion") == (False, "Tipo de permiso inválido.")
+            assert await cliente.obtener("no_existe") is None
+        finally:
+            await cliente.cerrar()
+    conversar(sistema, ruta, dialogo)
+    assert sistema.catalogo.obtener("notas")["cant_caracteres"] == len(contenido)
+
+
+def test_peticion_invalida_responde_sin_cerrar(abrir, tmp_path):
+    sistema, _ = abrir()
+    ruta = str(tmp_path / "fat.sock")
+
+    async def dialogo():
+        with pytest.raises(PermissionError):
+            await ConexionFAT.abrir("admin", "incorrecta", ruta_unix=ruta)
+        conexion = await ConexionFAT.abrir("admin", "admin", ruta_unix=ruta)
+        try:
+            conexion.escritor.write(codificar(["no", "es", "un", "objeto"]))
+            respuesta = await leer_mensaje(conexion.lector)
+            assert respuesta == {"ok": False, "msg": "Petición inválida: se esperaba un objeto JSON."}
+            assert (await conexion.pedir("desconocida"))["msg"] == "Operación 'desconocida' no válida."
+            assert (await conexion.pedir("listar"))["ok"]
+        finally:
+            await conexion.cerrar()
+    conversar(sistema, ruta, dialogo)
@@ -0,0 +1,32 @@
+import io
+import tarfile
+
+
+def test_importar_omite_archivos_vacios(abrir, tmp_path):
+    origen = tmp_path / "origen"
+    (origen / "sub").mkdir(parents=True)
+    (origen / "texto.txt").write_text("hola", encoding="utf-8")
+    (origen / "sub" / "vacio.txt").write_bytes(b"")
+    sistema, sesion = abrir()
+    informe = sesion.importar(str(origen))
+    assert informe["fallidos"] == []
+    assert informe["omitidos"] == [("sub/vacio.txt", "Archivo vacío.")]
+    assert informe["archivos"] == 1
+    assert sesion.obtener_contenido_archivo("texto.txt")[1] == "hola"
+    assert sistema.catalogo.obtener("sub/vacio.txt") is None
+
+
+def test_ida_y_vuelta_por_tar_con_miembro_vacio(abrir, tmp_path):
+    _, sesion = abrir()
+    assert sesion.crear_archivo("a", "contenido de a")[0]
+    exportado = tmp_path / "copia.tar"
+    informe = sesion.exportar(str(exportado))
+    assert informe["fallidos"] == [] and informe["archivos"] == 1
+    #El tar se completa por fuera del volumen con un miembro vacio
+    with tarfile.open(exportado, "a") as tar:
+        tar.addfile(tarfile.TarInfo("vacio"), io.BytesIO(b""))
+    _, destino = abrir("destino")
+    informe = destino.importar(str(exportado))
+    assert informe["fallidos"] == []
+    assert informe["omitidos"] == [("vacio", "Archivo vacío.")]
+    assert destino.obtener_contenido_archivo("a")[1] == "contenido de a"